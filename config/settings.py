@@ -3,10 +3,6 @@
 """
 import os
 from typing import Optional
-from dotenv import load_dotenv
-
-# 加载.env文件
-load_dotenv()
 
 
 class Settings:
@@ -17,26 +13,111 @@ class Settings:
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
         self.openai_api_base = os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1")
         self.openai_model = os.getenv("OPENAI_MODEL", "gpt-4")
+        self.openai_embedding_model = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
         
         # OpenRouter配置
         self.openrouter_api_key = os.getenv("OPENROUTER_API_KEY")
         self.openrouter_api_base = os.getenv("OPENROUTER_API_BASE", "https://openrouter.ai/api/v1")
         self.openrouter_model = os.getenv("OPENROUTER_MODEL", "google/gemini-2.5-flash")
+        self.openrouter_embedding_model = os.getenv("OPENROUTER_EMBEDDING_MODEL", "openai/text-embedding-3-small")
         
         # Anthropic配置
         self.anthropic_api_key = os.getenv("ANTHROPIC_API_KEY")
+        self.anthropic_api_base = os.getenv("ANTHROPIC_API_BASE", "https://api.anthropic.com")
         
         # MCP配置
         self.mcp_server_host = os.getenv("MCP_SERVER_HOST", "localhost")
         self.mcp_server_port = int(os.getenv("MCP_SERVER_PORT", "3000"))
+        # 远程工具服务器地址(tcp://host:port、unix:///path)，留空时在进程内调用
+        self.mcp_server_url = os.getenv("MCP_SERVER_URL", "")
+        # 同步工具的执行池大小(0表示按CPU数自动)
+        self.mcp_thread_pool_size = int(os.getenv("MCP_THREAD_POOL_SIZE", "0"))
+        self.mcp_process_pool_size = int(os.getenv("MCP_PROCESS_POOL_SIZE", "0"))
+        # 未单独设置timeout的工具的默认超时(秒，0表示不限制)
+        self.mcp_tool_timeout = float(os.getenv("MCP_TOOL_TIMEOUT", "60"))
+        # 工具结果缓存的内存上限(按结果序列化后的字节数)
+        self.mcp_tool_cache_max_bytes = int(os.getenv("MCP_TOOL_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+        # file_read单次返回的最大字节数，更大的文件需要分段或流式读取
+        self.mcp_file_read_max_bytes = int(os.getenv("MCP_FILE_READ_MAX_BYTES", str(1024 * 1024)))
         
         # 数据库配置
         self.database_url = os.getenv("DATABASE_URL", "sqlite:///./agent_learning.db")
         self.redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
+        self.redis_key_prefix = os.getenv("REDIS_KEY_PREFIX", "agent_learning:")
+        
+        # LLM响应缓存配置
+        self.llm_cache_max_entries = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024"))
+        self.llm_cache_ttl = float(os.getenv("LLM_CACHE_TTL", "3600"))
+        # 第二级缓存: sqlite(单机持久化) / redis(多worker共享) / none
+        self.llm_cache_backend = os.getenv("LLM_CACHE_BACKEND", "sqlite")
+        
+        # LLM批量请求配置
+        self.llm_batch_concurrency = int(os.getenv("LLM_BATCH_CONCURRENCY", "8"))
+        
+        # embeddings批量配置：每个请求的输入条数和并发请求数
+        self.llm_embed_batch_size = int(os.getenv("LLM_EMBED_BATCH_SIZE", "256"))
+        self.llm_embed_concurrency = int(os.getenv("LLM_EMBED_CONCURRENCY", "4"))
+        
+        # LLM提供商限流配置(0表示不限制)
+        self.llm_rate_limit_rpm = float(os.getenv("LLM_RATE_LIMIT_RPM", "0"))
+        self.llm_rate_limit_tpm = float(os.getenv("LLM_RATE_LIMIT_TPM", "0"))
+        self.llm_max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+        self.llm_rate_limit_max_retries = int(os.getenv("LLM_RATE_LIMIT_MAX_RETRIES", "5"))
+        # memory(进程内) / redis(多worker共享配额)
+        self.llm_rate_limit_backend = os.getenv("LLM_RATE_LIMIT_BACKEND", "memory")
+        
+        # 请求调度配置：总并发、为interactive预留的名额、来不及完成时的处理(drop / downgrade)
+        self.llm_scheduler_concurrency = int(os.getenv("LLM_SCHEDULER_CONCURRENCY", "16"))
+        self.llm_scheduler_interactive_reserve = int(os.getenv("LLM_SCHEDULER_INTERACTIVE_RESERVE", "4"))
+        self.llm_deadline_policy = os.getenv("LLM_DEADLINE_POLICY", "drop")
+        
+        # 上下文token预算配置(0表示不裁剪)
+        self.llm_context_budget = int(os.getenv("LLM_CONTEXT_BUDGET", "0"))
+        self.llm_trim_strategy = os.getenv("LLM_TRIM_STRATEGY", "drop")
+        self.llm_summary_tokens = int(os.getenv("LLM_SUMMARY_TOKENS", "256"))
+        self.llm_trim_step = int(os.getenv("LLM_TRIM_STEP", "4"))
+        
+        # 提示词前缀缓存: off / prefix(tools+system) / conversation(再加最后一条消息)
+        self.llm_prompt_cache = os.getenv("LLM_PROMPT_CACHE", "prefix")
+        
+        # 工具调用循环的最大轮数
+        self.llm_max_tool_rounds = int(os.getenv("LLM_MAX_TOOL_ROUNDS", "8"))
+        
+        # 指标导出配置
+        self.metrics_host = os.getenv("METRICS_HOST", "0.0.0.0")
+        self.metrics_port = int(os.getenv("METRICS_PORT", "9100"))
+        
+        # HTTP连接池配置
+        self.llm_http_max_connections = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100"))
+        self.llm_http_max_keepalive = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "20"))
+        self.llm_http_keepalive_expiry = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "30"))
+        self.llm_http_timeout = float(os.getenv("LLM_HTTP_TIMEOUT", "600"))
+        self.llm_http_connect_timeout = float(os.getenv("LLM_HTTP_CONNECT_TIMEOUT", "5"))
+        self.llm_http2 = os.getenv("LLM_HTTP2", "True").lower() == "true"
+        
+        # 多提供商路由配置
+        self.llm_router_providers = os.getenv("LLM_ROUTER_PROVIDERS", "openai,openrouter,anthropic")
+        self.llm_router_window = int(os.getenv("LLM_ROUTER_WINDOW", "100"))
+        self.llm_router_min_samples = int(os.getenv("LLM_ROUTER_MIN_SAMPLES", "5"))
+        self.llm_hedge_default_delay = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "5.0"))
+        self.llm_hedge_min_delay = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.2"))
+        self.llm_breaker_failure_threshold = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+        self.llm_breaker_error_rate = float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5"))
+        self.llm_breaker_recovery_timeout = float(os.getenv("LLM_BREAKER_RECOVERY_TIMEOUT", "30"))
         
         # Web应用配置
-        self.app_host = os.getenv("APP_HOST", "0.0.0.0")
+        # 默认只监听本机，对外提供服务时显式设置APP_HOST
+        self.app_host = os.getenv("APP_HOST", "127.0.0.1")
         self.app_port = int(os.getenv("APP_PORT", "8000"))
+        self.app_workers = int(os.getenv("APP_WORKERS", "1"))
+        
+        # 网关配置：默认提供商和挂载的MCP工具注册表("模块:属性"或"文件路径.py:属性"，默认不挂载)
+        self.gateway_provider = os.getenv("GATEWAY_PROVIDER", "openrouter")
+        self.gateway_mcp_server = os.getenv("GATEWAY_MCP_SERVER", "")
+        # 设置后/v1接口需要 Authorization: Bearer <key> 或 X-API-Key 请求头
+        self.gateway_api_key = os.getenv("GATEWAY_API_KEY", "")
+        # 对外开放的工具(逗号分隔)；工具接口至少需要API key或白名单之一，否则不提供
+        self.gateway_tool_allowlist = os.getenv("GATEWAY_TOOL_ALLOWLIST", "")
         self.debug = os.getenv("DEBUG", "True").lower() == "true"
         
         # 日志配置
@@ -52,10 +133,24 @@ class Settings:
         self.allowed_hosts = os.getenv("ALLOWED_HOSTS", "localhost,127.0.0.1")
 
 
-# 全局配置实例
-settings = Settings()
+# 全局配置实例，首次使用时才加载.env并创建
+_settings: Optional[Settings] = None
 
 
 def get_settings() -> Settings:
     """获取配置实例"""
-    return settings 
\ No newline at end of file
+    global _settings
+    if _settings is None:
+        from dotenv import load_dotenv
+        
+        # 加载.env文件
+        load_dotenv()
+        _settings = Settings()
+    return _settings
+
+
+def __getattr__(name: str):
+    # 兼容 from config.settings import settings
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}") 
\ No newline at end of file
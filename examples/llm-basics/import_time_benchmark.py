@@ -0,0 +1,83 @@
+"""
+src.core 导入耗时基准
+基于 python -X importtime 统计导入src.core的耗时，并检查启动预算
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+# 项目根目录
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 导入src.core时不应被加载的重量级依赖
+FORBIDDEN_MODULES = ["openai", "anthropic", "httpx", "dotenv", "sqlite3"]
+
+
+def run_importtime(module: str) -> List[Tuple[int, int, str]]:
+    """在子进程中导入模块，返回 (self_us, cumulative_us, 模块名) 列表"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"导入{module}失败:\n{result.stderr}")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        entries.append((int(self_us), int(cumulative_us), name.rstrip()))
+    return entries
+
+
+def summarize(entries: List[Tuple[int, int, str]], module: str, top: int = 10) -> Dict[str, object]:
+    """汇总目标模块的累计耗时和最慢的模块"""
+    # 只统计目标模块自身的cumulative，排除site等解释器启动时的导入
+    total_us = sum(cumulative for _, cumulative, name in entries if name.strip() == module)
+    loaded = {name.strip() for _, _, name in entries}
+    slowest = sorted(entries, key=lambda entry: entry[0], reverse=True)[:top]
+    return {
+        "total_ms": total_us / 1000,
+        "loaded": loaded,
+        "slowest": [(name.strip(), self_us / 1000) for self_us, _, name in slowest]
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="src.core 导入耗时基准")
+    parser.add_argument("--module", default="src.core", help="要测量的模块")
+    parser.add_argument("--budget-ms", type=float, default=100.0, help="导入耗时预算(毫秒)")
+    parser.add_argument("--runs", type=int, default=5, help="重复次数，取最小值")
+    args = parser.parse_args()
+
+    runs = [summarize(run_importtime(args.module), args.module) for _ in range(args.runs)]
+    best = min(runs, key=lambda run: run["total_ms"])
+
+    print(f"📦 导入 {args.module}: {best['total_ms']:.1f} ms (预算 {args.budget_ms:.1f} ms, 最好{args.runs}次)")
+    print("🐢 最慢的模块(self):")
+    for name, self_ms in best["slowest"]:
+        print(f"  {self_ms:8.2f} ms  {name}")
+
+    failures = []
+    if best["total_ms"] > args.budget_ms:
+        failures.append(f"导入耗时 {best['total_ms']:.1f} ms 超出预算 {args.budget_ms:.1f} ms")
+    for module in FORBIDDEN_MODULES:
+        if module in best["loaded"]:
+            failures.append(f"导入时加载了重量级依赖: {module}")
+
+    if failures:
+        for failure in failures:
+            print(f"❌ {failure}")
+        return 1
+
+    print("✅ 导入耗时在预算内，且未加载任何提供商SDK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
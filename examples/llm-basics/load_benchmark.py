@@ -0,0 +1,211 @@
+"""
+LLMClient 负载基准
+按目标QPS/并发驱动LLMClient，统计吞吐、p50/p95/p99延迟和首token延迟(TTFT)，输出JSON。
+默认在进程内启动模拟服务器，不会调用付费API。
+
+示例:
+    python load_benchmark.py --provider openai --requests 500 --concurrency 32 --stream
+    python load_benchmark.py --provider anthropic --qps 50 --duration 20 --error-rate-429 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Any
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from config.settings import get_settings
+from src.core.llm_client import LLMClient
+from src.core.http_pool import close_http_clients
+from mock_llm_server import MockLLMServer, add_mock_arguments, mock_config_from_args
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    """计算p50/p95/p99和均值(毫秒)"""
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "mean": None, "max": None}
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))] * 1000
+
+    return {
+        "p50": pick(0.50),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "mean": sum(ordered) / len(ordered) * 1000,
+        "max": ordered[-1] * 1000
+    }
+
+
+def point_settings_at(base_url: str):
+    """把所有提供商的地址指向模拟服务器"""
+    settings = get_settings()
+    settings.openai_api_base = f"{base_url}/v1"
+    settings.openrouter_api_base = f"{base_url}/v1"
+    settings.anthropic_api_base = base_url
+    settings.openai_api_key = settings.openai_api_key or "mock-key"
+    settings.openrouter_api_key = settings.openrouter_api_key or "mock-key"
+    settings.anthropic_api_key = settings.anthropic_api_key or "mock-key"
+
+
+class LoadBenchmark:
+    """负载驱动器：开环(按QPS发起)或闭环(固定并发)"""
+
+    def __init__(self, client: LLMClient, args: argparse.Namespace):
+        self.client = client
+        self.args = args
+        self.latencies: List[float] = []
+        self.ttfts: List[float] = []
+        self.output_tokens = 0
+        self.successes = 0
+        self.errors: Dict[str, int] = {}
+
+    def _messages(self, index: int) -> List[Dict[str, str]]:
+        # 默认每个请求内容不同，避免被缓存/合并层吸收
+        suffix = "" if self.args.identical else f" #{index}"
+        return [{"role": "user", "content": f"{self.args.prompt}{suffix}"}]
+
+    async def _one(self, index: int):
+        start = time.perf_counter()
+        ttft = None
+        try:
+            if self.args.stream:
+                async for delta in self.client.stream_chat_completion(
+                    self._messages(index), max_tokens=self.args.max_tokens
+                ):
+                    if delta["type"] == "text" and ttft is None:
+                        ttft = time.perf_counter() - start
+                    elif delta["type"] == "usage":
+                        self.output_tokens += self._completion_tokens(delta["usage"])
+            else:
+                response = await self.client.chat_completion(
+                    self._messages(index), max_tokens=self.args.max_tokens
+                )
+                self.output_tokens += self._completion_tokens(response.get("usage"))
+        except Exception as e:
+            name = type(e).__name__
+            self.errors[name] = self.errors.get(name, 0) + 1
+            return
+
+        latency = time.perf_counter() - start
+        self.successes += 1
+        self.latencies.append(latency)
+        self.ttfts.append(ttft if ttft is not None else latency)
+
+    @staticmethod
+    def _completion_tokens(usage: Optional[Dict[str, Any]]) -> int:
+        if not usage:
+            return 0
+        return int(usage.get("completion_tokens") or usage.get("output_tokens") or 0)
+
+    async def run_closed_loop(self, total: int, concurrency: int):
+        """固定并发：每个worker完成一个请求后立即发下一个"""
+        counter = iter(range(total))
+
+        async def worker():
+            for index in counter:
+                await self._one(index)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    async def run_open_loop(self, qps: float, duration: float, concurrency: Optional[int]):
+        """开环：按固定间隔发起请求，不受响应快慢影响"""
+        semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+        tasks = []
+        start = time.perf_counter()
+        index = 0
+
+        async def limited(i: int):
+            if semaphore is None:
+                return await self._one(i)
+            async with semaphore:
+                return await self._one(i)
+
+        while time.perf_counter() - start < duration:
+            tasks.append(asyncio.create_task(limited(index)))
+            index += 1
+            next_at = start + index / qps
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+        await asyncio.gather(*tasks)
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        total = self.successes + sum(self.errors.values())
+        return {
+            "provider": self.args.provider,
+            "mode": "open_loop" if self.args.qps else "closed_loop",
+            "stream": self.args.stream,
+            "target_qps": self.args.qps,
+            "concurrency": self.args.concurrency,
+            "requests": total,
+            "successes": self.successes,
+            "errors": self.errors,
+            "duration_s": elapsed,
+            "throughput_rps": self.successes / elapsed if elapsed else 0.0,
+            "output_tokens_per_s": self.output_tokens / elapsed if elapsed else 0.0,
+            "latency_ms": percentiles(self.latencies),
+            "ttft_ms": percentiles(self.ttfts)
+        }
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    server = None
+    if args.base_url:
+        point_settings_at(args.base_url.rstrip("/"))
+    else:
+        server = await MockLLMServer(mock_config_from_args(args)).start()
+        point_settings_at(server.base_url)
+
+    client = LLMClient(provider=args.provider, rate_limit=args.rate_limit, coalesce=args.coalesce)
+    benchmark = LoadBenchmark(client, args)
+    try:
+        if args.warmup:
+            await client.warmup(args.concurrency or 1)
+        start = time.perf_counter()
+        if args.qps:
+            await benchmark.run_open_loop(args.qps, args.duration, args.concurrency)
+        else:
+            await benchmark.run_closed_loop(args.requests, args.concurrency or 1)
+        report = benchmark.report(time.perf_counter() - start)
+        if server is not None:
+            report["server_status_counts"] = server.status_counts
+        return report
+    finally:
+        await close_http_clients()
+        if server is not None:
+            await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLMClient 负载基准")
+    parser.add_argument("--provider", default="openai", choices=["openai", "openrouter", "anthropic"])
+    parser.add_argument("--base-url", default=None, help="使用外部模拟服务器，不指定则在进程内启动")
+    parser.add_argument("--requests", type=int, default=200, help="闭环模式下的总请求数")
+    parser.add_argument("--concurrency", type=int, default=16, help="并发数(开环模式下为上限，0表示不限)")
+    parser.add_argument("--qps", type=float, default=0.0, help="开环模式的目标QPS，0表示使用闭环模式")
+    parser.add_argument("--duration", type=float, default=10.0, help="开环模式的持续秒数")
+    parser.add_argument("--stream", action="store_true", help="使用流式接口")
+    parser.add_argument("--max-tokens", type=int, default=64)
+    parser.add_argument("--prompt", default="Say hello")
+    parser.add_argument("--identical", action="store_true", help="所有请求内容相同(用于测试缓存/合并)")
+    parser.add_argument("--rate-limit", action="store_true", help="启用客户端自适应限流")
+    parser.add_argument("--coalesce", action="store_true", help="启用相同请求合并")
+    parser.add_argument("--warmup", action="store_true", help="开始前预热连接")
+    parser.add_argument("--output", default=None, help="结果JSON输出文件")
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,476 @@
+"""
+本地模拟LLM服务器
+兼容OpenAI chat.completions / embeddings 与 Anthropic messages 接口(含SSE流式)，
+用于在不调用付费API的情况下对LLMClient做性能测试
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import struct
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Any, Tuple
+
+
+@dataclass
+class LatencyDistribution:
+    """延迟分布，参数单位为毫秒
+
+    kind: fixed(a) / uniform(a, b) / normal(均值a, 标准差b) / lognormal(中位数a, sigma b) / exponential(均值a)
+    """
+    kind: str = "fixed"
+    a: float = 0.0
+    b: float = 0.0
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyDistribution":
+        """解析 "kind:a,b" 形式的描述，如 "lognormal:200,0.5" """
+        kind, _, params = spec.partition(":")
+        values = [float(v) for v in params.split(",") if v.strip()] if params else []
+        values += [0.0] * (2 - len(values))
+        if kind not in ("fixed", "uniform", "normal", "lognormal", "exponential"):
+            raise ValueError(f"Unsupported latency distribution: {kind}")
+        return cls(kind, values[0], values[1])
+
+    def sample(self, rng: random.Random) -> float:
+        """采样一次延迟，返回秒"""
+        if self.kind == "uniform":
+            ms = rng.uniform(self.a, self.b)
+        elif self.kind == "normal":
+            ms = rng.gauss(self.a, self.b)
+        elif self.kind == "lognormal":
+            ms = self.a * rng.lognormvariate(0.0, self.b) if self.a > 0 else 0.0
+        elif self.kind == "exponential":
+            ms = rng.expovariate(1.0 / self.a) if self.a > 0 else 0.0
+        else:
+            ms = self.a
+        return max(0.0, ms) / 1000.0
+
+
+@dataclass
+class MockConfig:
+    """模拟服务器行为配置"""
+    ttft: LatencyDistribution = field(default_factory=lambda: LatencyDistribution("fixed", 50))
+    tokens_per_second: float = 200.0
+    output_tokens: int = 64
+    error_rate_429: float = 0.0
+    error_rate_5xx: float = 0.0
+    retry_after: float = 1.0
+    # 请求带tools且上一条不是工具结果时，调用前N个工具(0表示不调用)
+    tool_calls: int = 2
+    embedding_dim: int = 64
+    seed: Optional[int] = None
+
+
+class MockLLMServer:
+    """基于asyncio的最小HTTP/1.1服务器，支持keep-alive和分块传输"""
+
+    def __init__(self, config: Optional[MockConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or MockConfig()
+        self.host = host
+        self.port = port
+        self.rng = random.Random(self.config.seed)
+        self.request_count = 0
+        self.status_counts: Dict[int, int] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> "MockLLMServer":
+        """启动服务器，port为0时自动分配端口"""
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        """停止服务器"""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    # ==================== HTTP ====================
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        method, path, _ = request_line.decode("latin-1").split(" ", 2)
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        body = b""
+        length = int(headers.get("content-length", "0") or 0)
+        if length:
+            body = await reader.readexactly(length)
+        return method, path.split("?", 1)[0], headers, body
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                await self._dispatch(writer, method, path, body)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _write_head(self, writer: asyncio.StreamWriter, status: int, headers: Dict[str, str]):
+        self.status_counts[status] = self.status_counts.get(status, 0) + 1
+        reasons = {200: "OK", 404: "Not Found", 429: "Too Many Requests", 500: "Internal Server Error", 503: "Service Unavailable"}
+        lines = [f"HTTP/1.1 {status} {reasons.get(status, 'OK')}"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: int, payload: Any, headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self._write_head(writer, status, {
+            "content-type": "application/json",
+            "content-length": str(len(body)),
+            **(headers or {})
+        })
+        writer.write(body)
+        await writer.drain()
+
+    async def _send_chunk(self, writer: asyncio.StreamWriter, data: str):
+        raw = data.encode("utf-8")
+        writer.write(f"{len(raw):x}\r\n".encode("latin-1") + raw + b"\r\n")
+        await writer.drain()
+
+    async def _dispatch(self, writer: asyncio.StreamWriter, method: str, path: str, body: bytes):
+        # 供连接预热和健康检查使用
+        if method == "HEAD":
+            self._write_head(writer, 200, {"content-length": "0"})
+            await writer.drain()
+            return
+        if method == "GET":
+            await self._send_json(writer, 200, {"status": "ok"})
+            return
+
+        if method == "POST" and path in ("/v1/embeddings", "/embeddings"):
+            self.request_count += 1
+            await self._embeddings(writer, json.loads(body or b"{}"))
+            return
+
+        if method != "POST" or path not in ("/v1/chat/completions", "/chat/completions", "/v1/messages", "/messages"):
+            await self._send_json(writer, 404, {"error": {"message": f"Unknown path {path}"}})
+            return
+
+        self.request_count += 1
+        anthropic_format = path.endswith("/messages")
+        payload = json.loads(body or b"{}")
+
+        error = self._maybe_error(anthropic_format)
+        if error is not None:
+            status, error_body, headers = error
+            await self._send_json(writer, status, error_body, headers)
+            return
+
+        max_tokens = payload.get("max_tokens") or self.config.output_tokens
+        output_tokens = max(1, min(int(max_tokens), self.config.output_tokens))
+        input_tokens = sum(len(str(m.get("content", ""))) for m in payload.get("messages", [])) // 4 + 1
+        model = payload.get("model", "mock-model")
+
+        tool_calls = self._tool_calls(payload, anthropic_format)
+        if anthropic_format:
+            if payload.get("stream"):
+                await self._stream_anthropic(writer, model, input_tokens, output_tokens, tool_calls)
+            else:
+                await self._complete_anthropic(writer, model, input_tokens, output_tokens, tool_calls)
+        else:
+            include_usage = bool((payload.get("stream_options") or {}).get("include_usage"))
+            if payload.get("stream"):
+                await self._stream_openai(writer, model, input_tokens, output_tokens, include_usage, tool_calls)
+            else:
+                await self._complete_openai(writer, model, input_tokens, output_tokens, tool_calls)
+
+    def _tool_calls(self, payload: Dict[str, Any], anthropic_format: bool) -> List[Tuple[str, str]]:
+        """决定本次响应要发起的工具调用，返回 [(id, 工具名)]"""
+        tools = payload.get("tools") or []
+        messages = payload.get("messages") or [{}]
+        last = messages[-1]
+        if anthropic_format:
+            content = last.get("content")
+            answered = isinstance(content, list) and any(block.get("type") == "tool_result" for block in content)
+            names = [tool["name"] for tool in tools]
+        else:
+            answered = last.get("role") == "tool"
+            names = [tool["function"]["name"] for tool in tools]
+        if answered or not names:
+            return []
+        return [(f"call_{uuid.uuid4().hex[:12]}", name) for name in names[:self.config.tool_calls]]
+
+    def _maybe_error(self, anthropic_format: bool) -> Optional[Tuple[int, Dict[str, Any], Dict[str, str]]]:
+        """按配置的概率注入429/5xx错误"""
+        roll = self.rng.random()
+        if roll < self.config.error_rate_429:
+            message = "Rate limit exceeded (mock)"
+            body = ({"type": "error", "error": {"type": "rate_limit_error", "message": message}}
+                    if anthropic_format else
+                    {"error": {"message": message, "type": "rate_limit_exceeded", "code": "rate_limit_exceeded"}})
+            return 429, body, {"retry-after": str(self.config.retry_after)}
+        if roll < self.config.error_rate_429 + self.config.error_rate_5xx:
+            status = self.rng.choice([500, 503])
+            message = "Upstream overloaded (mock)"
+            body = ({"type": "error", "error": {"type": "api_error", "message": message}}
+                    if anthropic_format else
+                    {"error": {"message": message, "type": "server_error"}})
+            return status, body, {}
+        return None
+
+    # ==================== 生成 ====================
+
+    def _embedding(self, text: str, dim: int) -> List[float]:
+        """由文本哈希生成的确定性向量"""
+        digest = b""
+        counter = 0
+        while len(digest) < dim:
+            digest += hashlib.sha256(f"{counter}:{text}".encode("utf-8")).digest()
+            counter += 1
+        return [byte / 127.5 - 1.0 for byte in digest[:dim]]
+
+    async def _embeddings(self, writer, payload: Dict[str, Any]):
+        error = self._maybe_error(False)
+        if error is not None:
+            status, error_body, headers = error
+            await self._send_json(writer, status, error_body, headers)
+            return
+        inputs = payload.get("input") or []
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        dim = int(payload.get("dimensions") or self.config.embedding_dim)
+        await asyncio.sleep(self.config.ttft.sample(self.rng))
+        data = []
+        for index, text in enumerate(inputs):
+            vector = self._embedding(str(text), dim)
+            if payload.get("encoding_format") == "base64":
+                vector = base64.b64encode(struct.pack(f"<{dim}f", *vector)).decode("ascii")
+            data.append({"object": "embedding", "index": index, "embedding": vector})
+        tokens = sum(len(str(text)) for text in inputs) // 4 + len(inputs)
+        await self._send_json(writer, 200, {
+            "object": "list",
+            "data": data,
+            "model": payload.get("model", "mock-embedding"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+        })
+
+    def _tokens(self, count: int) -> List[str]:
+        return [f"tok{i} " for i in range(count)]
+
+    def _token_interval(self) -> float:
+        return 1.0 / self.config.tokens_per_second if self.config.tokens_per_second > 0 else 0.0
+
+    async def _generate(self, output_tokens: int):
+        """非流式：等待首token延迟 + 全部token生成时间"""
+        await asyncio.sleep(self.config.ttft.sample(self.rng) + output_tokens * self._token_interval())
+
+    async def _complete_openai(self, writer, model: str, input_tokens: int, output_tokens: int,
+                               tool_calls: Optional[List[Tuple[str, str]]] = None):
+        await self._generate(output_tokens)
+        message: Dict[str, Any] = {"role": "assistant", "content": "".join(self._tokens(output_tokens))}
+        if tool_calls:
+            message = {"role": "assistant", "content": None, "tool_calls": [
+                {"id": call_id, "type": "function", "function": {"name": name, "arguments": "{}"}}
+                for call_id, name in tool_calls
+            ]}
+        await self._send_json(writer, 200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": message,
+                "finish_reason": "tool_calls" if tool_calls else "stop"
+            }],
+            "usage": {
+                "prompt_tokens": input_tokens,
+                "completion_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens
+            }
+        })
+
+    async def _complete_anthropic(self, writer, model: str, input_tokens: int, output_tokens: int,
+                                  tool_calls: Optional[List[Tuple[str, str]]] = None):
+        await self._generate(output_tokens)
+        content = [{"type": "text", "text": "".join(self._tokens(output_tokens))}]
+        content.extend({"type": "tool_use", "id": call_id, "name": name, "input": {}} for call_id, name in tool_calls or [])
+        await self._send_json(writer, 200, {
+            "id": f"msg_{uuid.uuid4().hex}",
+            "type": "message",
+            "role": "assistant",
+            "model": model,
+            "content": content,
+            "stop_reason": "tool_use" if tool_calls else "end_turn",
+            "stop_sequence": None,
+            "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens}
+        })
+
+    def _start_sse(self, writer):
+        self._write_head(writer, 200, {
+            "content-type": "text/event-stream",
+            "cache-control": "no-cache",
+            "transfer-encoding": "chunked"
+        })
+
+    async def _end_sse(self, writer):
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    def _tool_gap(self, output_tokens: int, tool_calls: List[Tuple[str, str]]) -> float:
+        """流式工具调用之间的生成间隔，模拟模型逐个输出工具参数"""
+        return output_tokens * self._token_interval() / max(1, len(tool_calls))
+
+    async def _stream_openai(self, writer, model: str, input_tokens: int, output_tokens: int, include_usage: bool,
+                             tool_calls: Optional[List[Tuple[str, str]]] = None):
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+
+        def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None, usage=None) -> str:
+            data = {
+                "id": chunk_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [] if usage else [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+            if usage:
+                data["usage"] = usage
+            return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+        self._start_sse(writer)
+        await asyncio.sleep(self.config.ttft.sample(self.rng))
+        await self._send_chunk(writer, chunk({"role": "assistant", "content": ""}))
+        interval = self._token_interval()
+        for index, token in enumerate(self._tokens(output_tokens)):
+            if index and interval:
+                await asyncio.sleep(interval)
+            await self._send_chunk(writer, chunk({"content": token}))
+        for index, (call_id, name) in enumerate(tool_calls or []):
+            # 参数分两段发送，中间间隔一段生成时间
+            await self._send_chunk(writer, chunk({"tool_calls": [{
+                "index": index, "id": call_id, "type": "function", "function": {"name": name, "arguments": "{"}
+            }]}))
+            await asyncio.sleep(self._tool_gap(output_tokens, tool_calls))
+            await self._send_chunk(writer, chunk({"tool_calls": [{"index": index, "function": {"arguments": "}"}}]}))
+        await self._send_chunk(writer, chunk({}, finish_reason="tool_calls" if tool_calls else "stop"))
+        if include_usage:
+            await self._send_chunk(writer, chunk({}, usage={
+                "prompt_tokens": input_tokens,
+                "completion_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens
+            }))
+        await self._send_chunk(writer, "data: [DONE]\n\n")
+        await self._end_sse(writer)
+
+    async def _stream_anthropic(self, writer, model: str, input_tokens: int, output_tokens: int,
+                                tool_calls: Optional[List[Tuple[str, str]]] = None):
+        def event(name: str, data: Dict[str, Any]) -> str:
+            return f"event: {name}\ndata: {json.dumps({'type': name, **data}, ensure_ascii=False)}\n\n"
+
+        self._start_sse(writer)
+        await asyncio.sleep(self.config.ttft.sample(self.rng))
+        await self._send_chunk(writer, event("message_start", {"message": {
+            "id": f"msg_{uuid.uuid4().hex}",
+            "type": "message",
+            "role": "assistant",
+            "model": model,
+            "content": [],
+            "stop_reason": None,
+            "stop_sequence": None,
+            "usage": {"input_tokens": input_tokens, "output_tokens": 1}
+        }}))
+        await self._send_chunk(writer, event("content_block_start", {
+            "index": 0, "content_block": {"type": "text", "text": ""}
+        }))
+        interval = self._token_interval()
+        for index, token in enumerate(self._tokens(output_tokens)):
+            if index and interval:
+                await asyncio.sleep(interval)
+            await self._send_chunk(writer, event("content_block_delta", {
+                "index": 0, "delta": {"type": "text_delta", "text": token}
+            }))
+        await self._send_chunk(writer, event("content_block_stop", {"index": 0}))
+        for index, (call_id, name) in enumerate(tool_calls or [], start=1):
+            await self._send_chunk(writer, event("content_block_start", {
+                "index": index, "content_block": {"type": "tool_use", "id": call_id, "name": name, "input": {}}
+            }))
+            await self._send_chunk(writer, event("content_block_delta", {
+                "index": index, "delta": {"type": "input_json_delta", "partial_json": "{"}
+            }))
+            await asyncio.sleep(self._tool_gap(output_tokens, tool_calls))
+            await self._send_chunk(writer, event("content_block_delta", {
+                "index": index, "delta": {"type": "input_json_delta", "partial_json": "}"}
+            }))
+            await self._send_chunk(writer, event("content_block_stop", {"index": index}))
+        await self._send_chunk(writer, event("message_delta", {
+            "delta": {"stop_reason": "tool_use" if tool_calls else "end_turn", "stop_sequence": None},
+            "usage": {"output_tokens": output_tokens}
+        }))
+        await self._send_chunk(writer, event("message_stop", {}))
+        await self._end_sse(writer)
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="本地模拟LLM服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    add_mock_arguments(parser)
+    return parser
+
+
+def add_mock_arguments(parser: argparse.ArgumentParser):
+    """添加模拟服务器行为相关的命令行参数"""
+    parser.add_argument("--ttft", default="fixed:50", help="首token延迟分布(毫秒)，如 lognormal:200,0.5")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="输出token速率")
+    parser.add_argument("--output-tokens", type=int, default=64, help="每次响应的输出token数")
+    parser.add_argument("--error-rate-429", type=float, default=0.0, help="注入429错误的概率")
+    parser.add_argument("--error-rate-5xx", type=float, default=0.0, help="注入5xx错误的概率")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429响应的retry-after秒数")
+    parser.add_argument("--tool-calls", type=int, default=2, help="请求带tools时每次响应调用的工具数")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子")
+
+
+def mock_config_from_args(args: argparse.Namespace) -> MockConfig:
+    return MockConfig(
+        ttft=LatencyDistribution.parse(args.ttft),
+        tokens_per_second=args.tokens_per_second,
+        output_tokens=args.output_tokens,
+        error_rate_429=args.error_rate_429,
+        error_rate_5xx=args.error_rate_5xx,
+        retry_after=args.retry_after,
+        tool_calls=args.tool_calls,
+        seed=args.seed
+    )
+
+
+async def serve(args: argparse.Namespace):
+    server = await MockLLMServer(mock_config_from_args(args), args.host, args.port).start()
+    print(f"🚀 Mock LLM server listening on {server.base_url}")
+    print(f"  OpenAI兼容:    OPENAI_API_BASE={server.base_url}/v1")
+    print(f"  Anthropic兼容: ANTHROPIC_API_BASE={server.base_url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(serve(build_arg_parser().parse_args()))
+    except KeyboardInterrupt:
+        print("\n👋 Mock LLM server stopped")
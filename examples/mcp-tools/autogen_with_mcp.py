@@ -15,6 +15,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(
 from dotenv import load_dotenv
 import autogen
 from config.settings import get_settings
+from src.core.tools import to_openai_tools
 from mcp_client import MCPClient
 
 # 加载环境变量
@@ -34,6 +35,16 @@ class MCPToolAgent:
             descriptions.append(f"- {name}: {tool['description']}")
         return "\n".join(descriptions)
     
+    def get_openai_tools(self) -> List[Dict[str, Any]]:
+        """获取原生tool calling格式的工具定义"""
+        return to_openai_tools(self.tools)
+    
+    def get_function_map(self) -> Dict[str, Any]:
+        """获取 工具名 -> 执行函数 映射，供执行工具调用的Agent注册"""
+        def make_function(tool_name: str):
+            return lambda **parameters: self.call_tool(tool_name, parameters)
+        return {name: make_function(name) for name in self.tools}
+    
     def call_tool(self, tool_name: str, parameters: Optional[Dict[str, Any]] = None) -> str:
         """调用工具并返回格式化结果"""
         if parameters is None:
@@ -89,16 +100,12 @@ def create_mcp_enhanced_agents(llm_config, mcp_tool_agent: MCPToolAgent):
         可用工具：
         {tools_description}
         
-        工具调用格式：
-        当需要使用工具时，请用以下格式：
-        TOOL_CALL: {{
-            "tool_name": "工具名称",
-            "parameters": {{参数}}
-        }}
+        工具调用方式：
+        直接使用函数调用(tool calling)，相互独立的工具可以在一次回复中同时调用
         
         工作风格：实用、准确、高效
         """,
-        llm_config=llm_config,
+        llm_config={**llm_config, "tools": mcp_tool_agent.get_openai_tools()},
     )
     
     # 2. 数据分析师Agent
@@ -137,6 +144,8 @@ def create_mcp_enhanced_agents(llm_config, mcp_tool_agent: MCPToolAgent):
         max_consecutive_auto_reply=15,
         code_execution_config=False,
     )
+    # 工具操作员发起的工具调用由协调者执行，结果作为tool消息回到群聊
+    user_proxy.register_function(function_map=mcp_tool_agent.get_function_map())
     
     print(f"✅ 创建了4个Agents: 工具操作员、数据分析师、项目协调员、协调者")
     return tool_operator, data_analyst, project_coordinator, user_proxy
@@ -149,7 +158,7 @@ class MCPGroupChatManager:
         self.llm_config = llm_config
         self.mcp_tool_agent = mcp_tool_agent
         
-        # 创建群聊
+        # 创建群聊(上一条消息包含工具调用时，func_call_filter会选择注册了对应函数的Agent发言)
         self.groupchat = autogen.GroupChat(
             agents=agents,
             messages=[],
@@ -162,31 +171,6 @@ class MCPGroupChatManager:
             groupchat=self.groupchat,
             llm_config=llm_config,
         )
-    
-    def process_message(self, message: str) -> str:
-        """处理消息，检查是否包含工具调用"""
-        if "TOOL_CALL:" in message:
-            # 提取工具调用
-            try:
-                tool_start = message.find("TOOL_CALL:") + len("TOOL_CALL:")
-                tool_end = message.find("}", tool_start) + 1
-                tool_call_str = message[tool_start:tool_end].strip()
-                
-                tool_call = json.loads(tool_call_str)
-                tool_name = tool_call.get("tool_name")
-                parameters = tool_call.get("parameters", {})
-                
-                # 调用工具
-                result = self.mcp_tool_agent.call_tool(tool_name, parameters)
-                
-                # 替换消息中的工具调用
-                new_message = message[:message.find("TOOL_CALL:")] + f"\n{result}"
-                return new_message
-                
-            except Exception as e:
-                return message + f"\n❌ 工具调用解析失败: {e}"
-        
-        return message
 
 async def execute_mcp_task(task="使用工具分析当前目录的文件情况"):
     """执行集成MCP工具的任务"""
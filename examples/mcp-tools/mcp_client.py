@@ -3,16 +3,108 @@ MCP Tool Client
 用于测试MCP工具调用和Agent集成
 """
 import asyncio
+import atexit
 import sys
 import json
-from typing import Dict, Any, Optional
+import threading
+from typing import Dict, Any, Optional, List, Tuple, Coroutine, AsyncIterator
 from mcp_server import mcp_server
+from config.settings import get_settings
+
+class SyncBridge:
+    """同步调用桥接器
+
+    在一个常驻后台线程中运行事件循环，同步代码通过run_coroutine_threadsafe投递协程，
+    避免每次调用都创建/销毁事件循环，也可以在已有事件循环的线程中使用。
+    """
+    
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+    
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        """懒启动后台事件循环线程"""
+        loop = self._loop
+        if loop is not None and loop.is_running():
+            return loop
+        with self._lock:
+            if self._loop is None or not self._loop.is_running():
+                loop = asyncio.new_event_loop()
+                started = threading.Event()
+                
+                def run():
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(started.set)
+                    loop.run_forever()
+                    loop.close()
+                
+                self._thread = threading.Thread(target=run, name="mcp-sync-bridge", daemon=True)
+                self._thread.start()
+                started.wait()
+                self._loop = loop
+            return self._loop
+    
+    def run(self, coro: Coroutine, timeout: Optional[float] = None) -> Any:
+        """在后台事件循环中执行协程并阻塞等待结果"""
+        loop = self._ensure_started()
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("SyncBridge.run() cannot be called from the bridge loop thread")
+        return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout)
+    
+    def close(self, timeout: float = 5.0):
+        """停止后台事件循环并等待线程退出"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = None
+            self._thread = None
+        if loop is None or not loop.is_running():
+            return
+        
+        async def shutdown():
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await loop.shutdown_asyncgens()
+        
+        try:
+            asyncio.run_coroutine_threadsafe(shutdown(), loop).result(timeout)
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            if thread is not None:
+                thread.join(timeout)
+
+_sync_bridge: Optional[SyncBridge] = None
+
+def get_sync_bridge() -> SyncBridge:
+    """获取进程内共享的同步桥接器"""
+    global _sync_bridge
+    if _sync_bridge is None:
+        _sync_bridge = SyncBridge()
+        atexit.register(_sync_bridge.close)
+    return _sync_bridge
 
 class MCPClient:
-    """简单的MCP工具客户端"""
+    """简单的MCP工具客户端
+    
+    默认直接调用进程内的mcp_server；用connect()连接独立进程或其他主机上的工具服务器。
+    """
     
     def __init__(self, server_instance=None):
         self.server = server_instance or mcp_server
+    
+    @classmethod
+    async def connect(cls, url: str) -> "MCPClient":
+        """连接远程工具服务器，url形如 tcp://host:port、unix:///path/to.sock、stdio:<启动命令>"""
+        from mcp_transport import RemoteMCPServer
+        return cls(await RemoteMCPServer.connect(url))
+    
+    async def close(self):
+        """关闭到远程工具服务器的连接"""
+        if hasattr(self.server, "close"):
+            await self.server.close()
         
     def get_available_tools(self) -> Dict[str, Any]:
         """获取可用工具列表"""
@@ -25,9 +117,24 @@ class MCPClient:
         
         return await self.server.call_tool(tool_name, parameters)
     
-    def call_tool_sync(self, tool_name: str, parameters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        """同步调用工具"""
-        return asyncio.run(self.call_tool(tool_name, parameters))
+    async def stream_tool(self, tool_name: str, parameters: Optional[Dict[str, Any]] = None) -> AsyncIterator[Any]:
+        """流式调用工具(如分块读取大文件)，逐块产出结果"""
+        async for chunk in self.server.stream_tool(tool_name, parameters or {}):
+            yield chunk
+    
+    def call_tool_sync(self, tool_name: str, parameters: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """同步调用工具(复用常驻后台事件循环)"""
+        return get_sync_bridge().run(self.call_tool(tool_name, parameters), timeout)
+    
+    async def call_tools(self, calls: List[Tuple[str, Optional[Dict[str, Any]]]]) -> List[Dict[str, Any]]:
+        """并发调用多个工具，按输入顺序返回结果"""
+        return list(await asyncio.gather(
+            *(self.call_tool(tool_name, parameters) for tool_name, parameters in calls)
+        ))
+    
+    def call_tools_sync(self, calls: List[Tuple[str, Optional[Dict[str, Any]]]], timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """同步批量调用工具，一次跨线程投递完成整批调用"""
+        return get_sync_bridge().run(self.call_tools(calls), timeout)
     
     def format_result(self, result: Dict[str, Any]) -> str:
         """格式化结果显示"""
@@ -40,7 +147,12 @@ class MCPClient:
 mcp_client = MCPClient()
 
 def main():
-    """主函数 - 命令行工具测试"""
+    """主函数 - 命令行工具测试(设置MCP_SERVER_URL时连接远程工具服务器)"""
+    global mcp_client
+    url = get_settings().mcp_server_url
+    if url:
+        mcp_client = get_sync_bridge().run(MCPClient.connect(url))
+    
     if len(sys.argv) < 2:
         print("🛠️  MCP Tool Client")
         print("=" * 50)
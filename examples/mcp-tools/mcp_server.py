@@ -2,15 +2,29 @@
 简单的MCP Tool Server
 提供基础工具给AI Agent使用
 """
+import argparse
+import ast
+import inspect
 import json
+import math
 import asyncio
 import sys
 import os
-from typing import Dict, Any, List, Optional, Callable
+import time
+from typing import Dict, Any, List, Optional, Callable, Sequence, Tuple, AsyncIterator, Union
 from dataclasses import dataclass
 from datetime import datetime
 import logging
 
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from config.settings import get_settings
+from src.core.file_reader import iter_chunks, read_lines, read_range
+from src.core.metrics import record_tool_call
+from src.core.tool_cache import CachePolicy, PathResolver, ToolResultCache
+from src.core.tool_pools import EXECUTION_MODES, Bulkhead, ToolPool, ToolSaturated, default_pool_sizes
+
 # 设置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -22,26 +36,98 @@ class Tool:
     description: str
     parameters: Dict[str, Any]
     function: Callable
+    # 执行策略: inline / thread / process
+    execution: str = "inline"
+    # 超时(秒)，None表示使用服务器默认值
+    timeout: Optional[float] = None
+    # 并发隔离舱，None表示不限制并发
+    bulkhead: Optional[Bulkhead] = None
+    # 结果缓存策略，None表示不缓存
+    cache: Optional[CachePolicy] = None
+    # 调用后需要使缓存失效的路径参数名
+    invalidates: Tuple[str, ...] = ()
+    # 流式实现(生成器)，由register_stream注册
+    stream: Optional[Callable] = None
+    # process工具独占的进程池，None表示使用服务器共享的池
+    pool: Optional[ToolPool] = None
+
+def _next_chunk(generator) -> Tuple[bool, Any]:
+    """在线程池中推进同步生成器一步"""
+    try:
+        return False, next(generator)
+    except StopIteration:
+        return True, None
 
 class MCPServer:
     """简单的MCP工具服务器"""
     
-    def __init__(self):
+    def __init__(self, thread_workers: Optional[int] = None, process_workers: Optional[int] = None,
+                 default_timeout: Optional[float] = None, cache_max_bytes: Optional[int] = None):
         self.tools: Dict[str, Tool] = {}
         self.version = "1.0.0"
+        self.default_timeout = default_timeout if default_timeout is not None else get_settings().mcp_tool_timeout
+        self.cache = ToolResultCache(cache_max_bytes)
+        sizes = default_pool_sizes()
+        # 池在第一次使用时才创建线程/进程；进程池按工具分开创建，见register_tool
+        self.pools: Dict[str, ToolPool] = {
+            "thread": ToolPool("thread", thread_workers or sizes["thread"])
+        }
+        self.process_workers = process_workers or sizes["process"]
+        
+    def register_tool(self, name: str, description: str, parameters: Dict[str, Any],
+                      execution: Optional[str] = None, timeout: Optional[float] = None,
+                      max_concurrency: Optional[int] = None, max_queue: int = 0,
+                      cache: Optional[str] = None, cache_ttl: Optional[float] = None,
+                      cache_paths: Union[Sequence[str], PathResolver] = (), invalidates: Sequence[str] = ()):
+        """注册工具装饰器
+        
+        execution: inline(在事件循环上执行) / thread(线程池，阻塞IO) / process(进程池，CPU密集型)；
+        默认异步函数为inline，同步函数为thread
+        timeout: 超时秒数(含排队时间)，默认MCP_TOOL_TIMEOUT，0表示不限制
+        max_concurrency/max_queue: 同时执行和排队的调用上限，超出时立即拒绝
+        cache: 结果缓存策略 pure / ttl(需要cache_ttl) / fs(cache_paths中的路径变化时失效)，默认不缓存；
+               cache_paths也可以是由参数计算依赖路径的函数，返回None时这次调用不缓存
+        invalidates: 调用后使缓存中依赖这些路径参数(及其所在目录)的条目失效
+        """
+        if execution is not None and execution not in EXECUTION_MODES:
+            raise ValueError(f"Unknown execution mode '{execution}', expected one of {EXECUTION_MODES}")
+        bulkhead = Bulkhead(name, max_concurrency, max_queue) if max_concurrency else None
         
-    def register_tool(self, name: str, description: str, parameters: Dict[str, Any]):
-        """注册工具装饰器"""
         def decorator(func: Callable):
+            mode = execution or ("inline" if asyncio.iscoroutinefunction(func) else "thread")
+            if mode != "inline" and asyncio.iscoroutinefunction(func):
+                raise ValueError(f"Async tool '{name}' must use inline execution")
+            pool = None
+            if mode == "process":
+                # 超时会终止整个进程池的worker，每个工具独占一个池，不会连带终止其他工具的调用
+                workers = min(self.process_workers, max_concurrency) if max_concurrency else self.process_workers
+                pool = ToolPool("process", workers, name=f"process:{name}")
             self.tools[name] = Tool(
                 name=name,
                 description=description,
                 parameters=parameters,
-                function=func
+                function=func,
+                execution=mode,
+                timeout=timeout,
+                bulkhead=bulkhead,
+                cache=CachePolicy.create(func, cache, cache_ttl, cache_paths if callable(cache_paths) else tuple(cache_paths)) if cache else None,
+                invalidates=tuple(invalidates),
+                pool=pool
             )
             return func
         return decorator
     
+    def register_stream(self, name: str):
+        """为已注册的工具注册流式实现(同步或异步生成器)，逐块产出结果"""
+        def decorator(func: Callable):
+            if name not in self.tools:
+                raise ValueError(f"Tool '{name}' must be registered before its stream")
+            if not (inspect.isgeneratorfunction(func) or inspect.isasyncgenfunction(func)):
+                raise ValueError(f"Stream for tool '{name}' must be a generator function")
+            self.tools[name].stream = func
+            return func
+        return decorator
+    
     def get_tools_schema(self) -> Dict[str, Any]:
         """获取所有工具的schema"""
         tools_schema = {}
@@ -61,39 +147,227 @@ class MCPServer:
                 "error": f"Tool '{tool_name}' not found"
             }
         
-        try:
-            tool = self.tools[tool_name]
-            
-            # 检查是否是异步函数
-            if asyncio.iscoroutinefunction(tool.function):
-                result = await tool.function(**parameters)
+        start = time.perf_counter()
+        tool = self.tools[tool_name]
+        lookup = None
+        if tool.cache is not None:
+            # fs模式需要stat依赖的路径，放到线程中执行，避免慢文件系统阻塞事件循环
+            if tool.cache.mode == "fs":
+                lookup = await asyncio.to_thread(self.cache.lookup, tool_name, tool.cache, parameters)
             else:
-                result = tool.function(**parameters)
+                lookup = self.cache.lookup(tool_name, tool.cache, parameters)
+        if lookup is not None and lookup.hit:
+            record_tool_call(tool_name, True, time.perf_counter() - start)
+            return {
+                "success": True,
+                "result": lookup.value,
+                "timestamp": datetime.now().isoformat(),
+                "cached": True
+            }
+        
+        timeout = tool.timeout if tool.timeout is not None else self.default_timeout
+        try:
+            result = await asyncio.wait_for(self._execute(tool, parameters), timeout or None)
             
+            # 工具自身返回{"error": ...}时也按失败计入指标，且不缓存
+            success = not (isinstance(result, dict) and "error" in result)
+            record_tool_call(tool_name, success, time.perf_counter() - start)
+            if success and lookup is not None:
+                self.cache.store(lookup, result, tool.cache.ttl)
             return {
                 "success": True,
                 "result": result,
                 "timestamp": datetime.now().isoformat()
             }
+        except asyncio.TimeoutError:
+            record_tool_call(tool_name, False, time.perf_counter() - start, status="timeout")
+            logger.warning(f"Tool {tool_name} timed out after {timeout}s")
+            return {
+                "success": False,
+                "error": f"Tool '{tool_name}' timed out after {timeout}s",
+                "reason": "timeout"
+            }
+        except ToolSaturated as e:
+            record_tool_call(tool_name, False, time.perf_counter() - start, status="rejected")
+            return {
+                "success": False,
+                "error": str(e),
+                "reason": "saturated"
+            }
         except Exception as e:
+            record_tool_call(tool_name, False, time.perf_counter() - start)
             logger.error(f"Error calling tool {tool_name}: {e}")
             return {
                 "success": False,
                 "error": str(e)
             }
+        finally:
+            # 写入失败或超时也可能已经改动了文件
+            paths = [str(parameters[name]) for name in tool.invalidates if parameters.get(name) is not None]
+            if paths:
+                self.cache.invalidate_paths(*paths)
+    
+    async def stream_tool(self, tool_name: str, parameters: Dict[str, Any]) -> AsyncIterator[Any]:
+        """流式调用工具，逐块产出结果
+        
+        同步生成器的每一步在线程池中执行；占用工具的隔离舱名额直到流结束，每块受工具超时限制。
+        工具不存在或不支持流式时抛出ValueError。
+        """
+        tool = self.tools.get(tool_name)
+        if tool is None or tool.stream is None:
+            raise ValueError(f"Tool '{tool_name}' does not support streaming")
+        timeout = (tool.timeout if tool.timeout is not None else self.default_timeout) or None
+        start = time.perf_counter()
+        success = False
+        if tool.bulkhead is not None:
+            await tool.bulkhead.acquire()
+        try:
+            if inspect.isasyncgenfunction(tool.stream):
+                async for chunk in tool.stream(**parameters):
+                    yield chunk
+            else:
+                generator = tool.stream(**parameters)
+                try:
+                    while True:
+                        done, chunk = await asyncio.wait_for(
+                            self.pools["thread"].run(_next_chunk, {"generator": generator}), timeout
+                        )
+                        if done:
+                            break
+                        yield chunk
+                finally:
+                    try:
+                        generator.close()
+                    except ValueError:
+                        # 超时后生成器仍在线程中执行，由它自己结束
+                        pass
+            success = True
+        finally:
+            if tool.bulkhead is not None:
+                tool.bulkhead.release()
+            record_tool_call(tool_name, success, time.perf_counter() - start)
+    
+    async def _execute(self, tool: Tool, parameters: Dict[str, Any]) -> Any:
+        """在工具的隔离舱名额内按执行策略运行工具"""
+        bulkhead = tool.bulkhead
+        if bulkhead is not None:
+            await bulkhead.acquire()
+        if tool.execution != "inline":
+            # 名额在调用真正结束时才释放：进程池超时会终止worker并随之释放；线程池中的调用无法中断，
+            # 失控的工具只会耗尽自己的名额
+            pool = tool.pool or self.pools[tool.execution]
+            return await pool.run(
+                tool.function, parameters, on_done=bulkhead.release if bulkhead is not None else None
+            )
+        try:
+            # 异步函数可以被超时取消；inline同步函数会阻塞事件循环，超时无法打断
+            if asyncio.iscoroutinefunction(tool.function):
+                return await tool.function(**parameters)
+            return tool.function(**parameters)
+        finally:
+            if bulkhead is not None:
+                bulkhead.release()
+    
+    def pool_stats(self) -> Dict[str, Any]:
+        """执行池状态(在途、排队、已完成)和各工具隔离舱状态，process按工具分别列出"""
+        stats: Dict[str, Any] = {kind: pool.stats() for kind, pool in self.pools.items()}
+        stats["process"] = {name: tool.pool.stats() for name, tool in self.tools.items() if tool.pool is not None}
+        stats["bulkheads"] = {
+            name: tool.bulkhead.stats() for name, tool in self.tools.items() if tool.bulkhead is not None
+        }
+        return stats
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """结果缓存状态(条目数、占用字节、各工具命中率)"""
+        return self.cache.stats()
+    
+    def shutdown(self, wait: bool = True):
+        """关闭执行池，进程池中没有按时结束的worker会被终止"""
+        pools = list(self.pools.values()) + [tool.pool for tool in self.tools.values() if tool.pool is not None]
+        for pool in pools:
+            pool.shutdown(wait=wait)
     
-    def start_server(self, host: str = "localhost", port: int = 8000):
-        """启动服务器"""
-        print(f"🚀 MCP Tool Server starting on {host}:{port}")
-        print(f"📋 Available tools: {list(self.tools.keys())}")
+    def start_server(self, host: Optional[str] = None, port: Optional[int] = None,
+                     transport: str = "http", path: Optional[str] = None):
+        """启动服务器
         
-        # 这里可以添加实际的HTTP服务器代码
-        # 为了简化，我们提供一个同步接口
-        pass
+        transport: http(通过HTTP网关，单worker) / tcp / unix / stdio(按行分隔的JSON-RPC，见mcp_transport)
+        """
+        settings = get_settings()
+        host = host or settings.mcp_server_host
+        port = port or settings.mcp_server_port
+        # stdio模式下标准输出是协议通道，提示信息写到标准错误
+        out = sys.stderr if transport == "stdio" else sys.stdout
+        address = {"unix": path, "stdio": "stdin/stdout"}.get(transport, f"{host}:{port}")
+        print(f"🚀 MCP Tool Server starting ({transport}) on {address}", file=out)
+        print(f"📋 Available tools: {list(self.tools.keys())}", file=out)
+        
+        if transport == "http":
+            import uvicorn
+            from src.core.gateway import Gateway, create_app
+            
+            if not (settings.gateway_api_key or settings.gateway_tool_allowlist):
+                print("⚠️  工具接口未开放：设置GATEWAY_API_KEY或GATEWAY_TOOL_ALLOWLIST后才能通过HTTP调用工具", file=out)
+            uvicorn.run(create_app(Gateway(mcp_server=self)), host=host, port=port)
+            return
+        
+        from mcp_transport import run_server
+        try:
+            asyncio.run(run_server(self, transport, host=host, port=port, path=path))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.shutdown()
 
 # 创建服务器实例
 mcp_server = MCPServer()
 
+# calculator允许的最大指数
+MAX_EXPONENT = 10000
+# calculator中整数结果(含中间结果)的最大位数，约4000位十进制数，不超过int转字符串的默认上限
+MAX_RESULT_BITS = 13000
+
+
+def _estimate_bits(node: ast.AST) -> Optional[float]:
+    """估算整数表达式结果的位数(log2)上界，任一中间结果超过MAX_RESULT_BITS时抛出ValueError
+
+    浮点结果返回None：浮点运算代价固定，溢出时直接报错。
+    """
+    if isinstance(node, ast.Expression):
+        return _estimate_bits(node.body)
+    if isinstance(node, ast.Constant):
+        if not isinstance(node.value, int):
+            return None
+        return math.log2(node.value) if node.value > 1 else 0.0
+    if isinstance(node, ast.UnaryOp):
+        return _estimate_bits(node.operand)
+    if not isinstance(node, ast.BinOp):
+        raise ValueError("不支持的表达式")
+    left, right = _estimate_bits(node.left), _estimate_bits(node.right)
+    if isinstance(node.op, ast.Pow):
+        # 指数必须是常数，避免 9**9**9 这类指数本身就是巨大计算
+        try:
+            exponent = ast.literal_eval(node.right)
+        except ValueError:
+            raise ValueError("指数必须是常数")
+        if abs(exponent) > MAX_EXPONENT:
+            raise ValueError(f"指数不能超过{MAX_EXPONENT}")
+        if left is None or not isinstance(exponent, int) or exponent < 0:
+            return None
+        bits = left * exponent
+    elif left is None or right is None or isinstance(node.op, ast.Div):
+        return None
+    elif isinstance(node.op, (ast.Add, ast.Sub)):
+        bits = max(left, right) + 1
+    elif isinstance(node.op, ast.Mult):
+        bits = left + right
+    else:
+        # // 和 % 的结果不超过被除数
+        bits = left
+    if bits > MAX_RESULT_BITS:
+        raise ValueError(f"结果过大(超过{MAX_RESULT_BITS}位)")
+    return bits
+
 # ==================== 工具实现 ====================
 
 @mcp_server.register_tool(
@@ -108,7 +382,12 @@ mcp_server = MCPServer()
             }
         },
         "required": ["expression"]
-    }
+    },
+    execution="process",
+    timeout=5,
+    max_concurrency=2,
+    max_queue=8,
+    cache="pure"
 )
 def calculator(expression: str) -> Dict[str, Any]:
     """计算器工具"""
@@ -117,6 +396,11 @@ def calculator(expression: str) -> Dict[str, Any]:
         allowed_chars = set('0123456789+-*/.() ')
         if not all(c in allowed_chars for c in expression):
             return {"error": "表达式包含不允许的字符"}
+        # 巨大的整数运算(如 9**9**9 或 (9**9999)**9999)会长时间占用进程池worker，执行前按整个表达式估算结果大小
+        try:
+            _estimate_bits(ast.parse(expression, mode="eval"))
+        except ValueError as e:
+            return {"error": str(e)}
         
         result = eval(expression)
         return {
@@ -141,30 +425,73 @@ def calculator(expression: str) -> Dict[str, Any]:
                 "type": "string",
                 "description": "文件编码，默认utf-8",
                 "default": "utf-8"
+            },
+            "offset": {
+                "type": "integer",
+                "description": "起始字节偏移，负数表示从文件末尾倒数"
+            },
+            "length": {
+                "type": "integer",
+                "description": "读取的字节数"
+            },
+            "start_line": {
+                "type": "integer",
+                "description": "起始行号(从1开始)，负数表示读取最后N行"
+            },
+            "end_line": {
+                "type": "integer",
+                "description": "结束行号(含)，默认读到文件末尾"
             }
         },
         "required": ["file_path"]
-    }
+    },
+    execution="thread",
+    cache="fs",
+    cache_paths=("file_path",)
 )
-def file_read(file_path: str, encoding: str = "utf-8") -> Dict[str, Any]:
-    """读取文件工具"""
+def file_read(file_path: str, encoding: str = "utf-8", offset: Optional[int] = None,
+              length: Optional[int] = None, start_line: Optional[int] = None,
+              end_line: Optional[int] = None) -> Dict[str, Any]:
+    """读取文件工具
+    
+    小文件整体读取；指定字节范围/行范围或文件超过MCP_FILE_READ_MAX_BYTES时只读取请求的部分，
+    单次最多返回MCP_FILE_READ_MAX_BYTES字节，truncated为True时可从next_offset继续读取
+    """
     try:
         # 安全检查：只允许读取当前目录及子目录的文件
         if ".." in file_path or file_path.startswith("/"):
             return {"error": "不允许访问该路径"}
         
-        with open(file_path, 'r', encoding=encoding) as f:
-            content = f.read()
+        max_bytes = get_settings().mcp_file_read_max_bytes
+        if start_line is not None:
+            result = read_lines(file_path, start_line, end_line, encoding, max_bytes)
+        elif offset is not None or length is not None or os.path.getsize(file_path) > max_bytes:
+            result = read_range(file_path, offset or 0, max_bytes if length is None else min(length, max_bytes), encoding)
+            result["truncated"] = not result["eof"] and (length is None or length > max_bytes)
+        else:
+            with open(file_path, 'r', encoding=encoding) as f:
+                content = f.read()
+            
+            return {
+                "file_path": file_path,
+                "content": content,
+                "size": len(content),
+                "lines": len(content.splitlines())
+            }
         
-        return {
-            "file_path": file_path,
-            "content": content,
-            "size": len(content),
-            "lines": len(content.splitlines())
-        }
+        return {"file_path": file_path, **result, "size": len(result["content"])}
     except Exception as e:
         return {"error": f"读取文件错误: {str(e)}"}
 
+@mcp_server.register_stream("file_read")
+def file_read_stream(file_path: str, encoding: str = "utf-8", offset: int = 0,
+                     length: Optional[int] = None, chunk_size: int = 256 * 1024):
+    """按chunk_size逐段读取文件，每段带offset/next_offset/eof"""
+    if ".." in file_path or file_path.startswith("/"):
+        raise ValueError("不允许访问该路径")
+    for chunk in iter_chunks(file_path, offset, length, chunk_size, encoding):
+        yield {"file_path": file_path, **chunk}
+
 @mcp_server.register_tool(
     name="file_write",
     description="写入文件内容",
@@ -186,7 +513,9 @@ def file_read(file_path: str, encoding: str = "utf-8") -> Dict[str, Any]:
             }
         },
         "required": ["file_path", "content"]
-    }
+    },
+    execution="thread",
+    invalidates=("file_path",)
 )
 def file_write(file_path: str, content: str, encoding: str = "utf-8") -> Dict[str, Any]:
     """写入文件工具"""
@@ -221,7 +550,8 @@ def file_write(file_path: str, content: str, encoding: str = "utf-8") -> Dict[st
                 "default": "iso"
             }
         }
-    }
+    },
+    execution="inline"
 )
 def current_time(format: str = "iso") -> Dict[str, Any]:
     """获取当前时间工具"""
@@ -245,6 +575,15 @@ def current_time(format: str = "iso") -> Dict[str, Any]:
         "timezone": str(now.astimezone().tzinfo)
     }
 
+def _list_files_paths(arguments: Dict[str, Any]) -> Optional[List[str]]:
+    """list_files结果依赖的目录：模式中的目录部分不含通配符时是glob实际列出的目录，否则不缓存"""
+    import glob
+    
+    subdirectory = os.path.dirname(str(arguments["pattern"]))
+    if glob.has_magic(subdirectory):
+        return None
+    return [os.path.join(str(arguments["directory"]), subdirectory)]
+
 @mcp_server.register_tool(
     name="list_files",
     description="列出目录中的文件",
@@ -262,7 +601,13 @@ def current_time(format: str = "iso") -> Dict[str, Any]:
                 "default": "*"
             }
         }
-    }
+    },
+    execution="thread",
+    timeout=10,
+    max_concurrency=4,
+    max_queue=16,
+    cache="fs",
+    cache_paths=_list_files_paths
 )
 def list_files(directory: str = ".", pattern: str = "*") -> Dict[str, Any]:
     """列出文件工具"""
@@ -304,22 +649,30 @@ def list_files(directory: str = ".", pattern: str = "*") -> Dict[str, Any]:
 
 def main():
     """主函数"""
-    print("🛠️  MCP Tool Server")
-    print("=" * 50)
+    parser = argparse.ArgumentParser(description="MCP Tool Server")
+    parser.add_argument("--transport", choices=["http", "tcp", "unix", "stdio"], default="http")
+    parser.add_argument("--host", default=None, help="默认MCP_SERVER_HOST")
+    parser.add_argument("--port", type=int, default=None, help="默认MCP_SERVER_PORT")
+    parser.add_argument("--path", default="/tmp/mcp_server.sock", help="Unix socket路径")
+    args = parser.parse_args()
+    out = sys.stderr if args.transport == "stdio" else sys.stdout
+    
+    print("🛠️  MCP Tool Server", file=out)
+    print("=" * 50, file=out)
     
     # 显示可用工具
     tools = mcp_server.get_tools_schema()
-    print(f"✅ 已注册 {len(tools)} 个工具:")
+    print(f"✅ 已注册 {len(tools)} 个工具:", file=out)
     for name, tool in tools.items():
-        print(f"  📋 {name}: {tool['description']}")
+        print(f"  📋 {name}: {tool['description']}", file=out)
     
-    print("\n💡 使用示例:")
-    print("  python mcp_client.py calculator '2 + 3 * 4'")
-    print("  python mcp_client.py current_time")
-    print("  python mcp_client.py list_files")
+    print("\n💡 使用示例:", file=out)
+    print("  python mcp_client.py calculator '2 + 3 * 4'", file=out)
+    print("  python mcp_client.py current_time", file=out)
+    print("  python mcp_client.py list_files", file=out)
     
     # 启动服务器
-    mcp_server.start_server()
+    mcp_server.start_server(args.host, args.port, transport=args.transport, path=args.path)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
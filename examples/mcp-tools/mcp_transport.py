@@ -0,0 +1,549 @@
+"""
+MCP JSON-RPC传输层
+按行分隔的JSON-RPC 2.0，支持stdio、TCP和Unix socket，同一连接上可以有多个并发请求(按id匹配)
+
+方法:
+- tools/list                         -> get_tools_schema()
+- tools/call {"name", "arguments"}   -> call_tool(name, arguments)
+- tools/stream {"name", "arguments", "window"} -> stream_tool(name, arguments)，每块以通知
+                                        tools/chunk {"id", "chunk"} 发送，最后响应 {"success", "chunks"}
+- ping                               -> "pong"
+
+tools/stream的流控按流进行：window为客户端初始授予的块数，服务器用完额度后暂停该流，
+客户端每消费一部分块发送通知 tools/credit {"id", "credits"} 补充额度，提前结束时发送 tools/cancel {"id"}。
+连接的读取循环从不等待某一个流的消费者，慢的流不影响同一连接上的其他请求。
+"""
+import asyncio
+import itertools
+import json
+import logging
+import os
+import shlex
+import sys
+from typing import Dict, Any, AsyncIterator, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# 单条消息上限(StreamReader的行长度限制)；更大的文件用tools/stream分块读取
+MAX_MESSAGE_BYTES = 16 * 1024 * 1024
+# 客户端为每个流授予的块数额度(流控窗口)，即每个流最多缓存的块数
+STREAM_WINDOW = 16
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+REQUEST_CANCELLED = -32800
+
+
+class JSONRPCError(Exception):
+    """服务端返回的JSON-RPC错误"""
+
+    def __init__(self, code: int, message: str, data: Any = None):
+        super().__init__(f"JSON-RPC error {code}: {message}")
+        self.code = code
+        self.message = message
+        self.data = data
+
+
+def _encode(message: Dict[str, Any]) -> bytes:
+    return (json.dumps(message, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+
+
+def _error(request_id: Any, code: int, message: str) -> Dict[str, Any]:
+    return {"jsonrpc": "2.0", "id": request_id, "error": {"code": code, "message": message}}
+
+
+def _is_control(line: bytes) -> bool:
+    # 先按字节粗筛，大多数请求不需要额外解析一次
+    return b'"tools/credit"' in line or b'"tools/cancel"' in line
+
+
+class _StreamCredits:
+    """一个流的剩余额度，用完后等待客户端的tools/credit通知"""
+
+    def __init__(self, window: int):
+        self.available = window
+        self.cancelled = False
+        self._changed = asyncio.Event()
+
+    async def acquire(self):
+        while self.available <= 0 and not self.cancelled:
+            self._changed.clear()
+            await self._changed.wait()
+        if self.cancelled:
+            raise JSONRPCError(REQUEST_CANCELLED, "Stream cancelled by client")
+        self.available -= 1
+
+    def grant(self, credits: int):
+        self.available += credits
+        self._changed.set()
+
+    def cancel(self):
+        self.cancelled = True
+        self._changed.set()
+
+
+class _Connection:
+    """一个连接上的写入端，多个并发请求的响应串行写出，drain提供写方向的背压"""
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.lock = asyncio.Lock()
+        # 使用流控的tools/stream请求id -> 剩余额度
+        self.streams: Dict[Any, _StreamCredits] = {}
+
+    def control(self, method: str, params: Any) -> bool:
+        """处理流控通知，返回是否是流控通知；在读取循环中直接执行，不占用在途名额"""
+        if method not in ("tools/credit", "tools/cancel"):
+            return False
+        credits = self.streams.get(params.get("id")) if isinstance(params, dict) else None
+        if credits is not None:
+            if method == "tools/cancel":
+                credits.cancel()
+            elif isinstance(params.get("credits"), int) and params["credits"] > 0:
+                credits.grant(params["credits"])
+        return True
+
+    async def send(self, message: Dict[str, Any]):
+        async with self.lock:
+            self.writer.write(_encode(message))
+            await self.writer.drain()
+
+
+class JSONRPCServer:
+    """把MCPServer暴露为JSON-RPC服务
+
+    每个连接按行读取请求，每个请求在独立任务中执行，响应完成即写回(不保证顺序)；
+    单连接在途请求达到max_inflight时暂停读取，由TCP窗口把背压传回客户端。
+    关闭时停止接受新连接和新请求，等待在途请求完成后再断开。
+    """
+
+    def __init__(self, mcp_server, max_inflight: int = 64, drain_timeout: float = 30.0):
+        self.mcp_server = mcp_server
+        self.max_inflight = max_inflight
+        self.drain_timeout = drain_timeout
+        self._servers = []
+        self._connections: Set[asyncio.Task] = set()
+        self._closing: Optional[asyncio.Event] = None
+
+    # ==================== 请求处理 ====================
+
+    async def _dispatch(self, method: str, params: Any) -> Any:
+        if method == "tools/list":
+            return self.mcp_server.get_tools_schema()
+        if method == "tools/call":
+            if not isinstance(params, dict) or not isinstance(params.get("name"), str):
+                raise JSONRPCError(INVALID_PARAMS, "tools/call expects {\"name\", \"arguments\"}")
+            return await self.mcp_server.call_tool(params["name"], params.get("arguments") or {})
+        if method == "ping":
+            return "pong"
+        raise JSONRPCError(METHOD_NOT_FOUND, f"Method not found: {method}")
+
+    async def _stream(self, connection: _Connection, request_id: Any, params: Any) -> Dict[str, Any]:
+        """逐块发送tools/chunk通知；请求带window时按客户端授予的额度发送，否则只受写入drain的反压"""
+        if request_id is None:
+            raise JSONRPCError(INVALID_REQUEST, "tools/stream requires a request id")
+        if not isinstance(params, dict) or not isinstance(params.get("name"), str):
+            raise JSONRPCError(INVALID_PARAMS, "tools/stream expects {\"name\", \"arguments\"}")
+        window = params.get("window")
+        credits = None
+        if isinstance(window, int) and window > 0:
+            credits = connection.streams[request_id] = _StreamCredits(window)
+        chunks = 0
+        try:
+            async for chunk in self.mcp_server.stream_tool(params["name"], params.get("arguments") or {}):
+                if credits is not None:
+                    await credits.acquire()
+                await connection.send({
+                    "jsonrpc": "2.0",
+                    "method": "tools/chunk",
+                    "params": {"id": request_id, "chunk": chunk}
+                })
+                chunks += 1
+        except (ValueError, TypeError) as e:
+            raise JSONRPCError(INVALID_PARAMS, str(e))
+        finally:
+            if credits is not None:
+                connection.streams.pop(request_id, None)
+        return {"success": True, "chunks": chunks}
+
+    async def _handle_request(self, connection: _Connection, line: bytes, slots: asyncio.Semaphore):
+        request_id = None
+        try:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                await connection.send(_error(None, PARSE_ERROR, "Parse error"))
+                return
+            if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+                await connection.send(_error(request.get("id") if isinstance(request, dict) else None,
+                                             INVALID_REQUEST, "Invalid request"))
+                return
+
+            request_id = request.get("id")
+            try:
+                if request["method"] == "tools/stream":
+                    result = await self._stream(connection, request_id, request.get("params"))
+                else:
+                    result = await self._dispatch(request["method"], request.get("params"))
+                response = {"jsonrpc": "2.0", "id": request_id, "result": result}
+            except JSONRPCError as e:
+                response = _error(request_id, e.code, e.message)
+            except Exception as e:
+                logger.error(f"JSON-RPC method {request['method']} failed: {e}")
+                response = _error(request_id, INTERNAL_ERROR, str(e))
+            # 没有id的是通知，不需要响应
+            if "id" in request:
+                await connection.send(response)
+        except (ConnectionError, RuntimeError):
+            # 客户端已断开，响应无处可写
+            pass
+        finally:
+            slots.release()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """处理一个连接直到对端关闭或服务器关闭"""
+        connection = _Connection(writer)
+        slots = asyncio.Semaphore(self.max_inflight)
+        pending: Set[asyncio.Task] = set()
+        stop = asyncio.ensure_future(self._closing_event().wait())
+        try:
+            while True:
+                read = asyncio.ensure_future(reader.readline())
+                await asyncio.wait({read, stop}, return_when=asyncio.FIRST_COMPLETED)
+                if not read.done():
+                    # 服务器关闭：不再读取新请求
+                    read.cancel()
+                    break
+                try:
+                    line = read.result()
+                except ValueError:
+                    await connection.send(_error(None, INVALID_REQUEST, "Message too large"))
+                    break
+                if not line.strip():
+                    if not line:
+                        break
+                    continue
+                if _is_control(line) and self._control(connection, line):
+                    continue
+                # 在途请求达到上限时在这里暂停读取；流控通知不经过这里，等待额度的流不会阻塞补充额度
+                await slots.acquire()
+                task = asyncio.ensure_future(self._handle_request(connection, line, slots))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            stop.cancel()
+            # 优雅排空：等待已接收的请求完成并写回响应
+            if pending:
+                _, not_done = await asyncio.wait(pending, timeout=self.drain_timeout)
+                for task in not_done:
+                    task.cancel()
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except (ConnectionError, RuntimeError):
+                pass
+
+    @staticmethod
+    def _control(connection: _Connection, line: bytes) -> bool:
+        try:
+            message = json.loads(line)
+        except ValueError:
+            return False
+        return isinstance(message, dict) and connection.control(message.get("method"), message.get("params"))
+
+    def _closing_event(self) -> asyncio.Event:
+        # 在运行中的事件循环里懒创建
+        if self._closing is None:
+            self._closing = asyncio.Event()
+        return self._closing
+
+    def _track(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.ensure_future(self.handle_connection(reader, writer))
+        self._connections.add(task)
+        task.add_done_callback(self._connections.discard)
+        return task
+
+    # ==================== 监听 ====================
+
+    async def start_tcp(self, host: str, port: int):
+        """开始监听TCP端口"""
+        self._closing_event()
+        server = await asyncio.start_server(self._track, host, port, limit=MAX_MESSAGE_BYTES)
+        self._servers.append(server)
+        return server
+
+    async def start_unix(self, path: str):
+        """开始监听Unix socket"""
+        self._closing_event()
+        if os.path.exists(path):
+            os.unlink(path)
+        server = await asyncio.start_unix_server(self._track, path, limit=MAX_MESSAGE_BYTES)
+        self._servers.append(server)
+        return server
+
+    async def serve_stdio(self):
+        """在标准输入/输出上服务单个连接(作为子进程被启动时使用)，stdin关闭后返回"""
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader(limit=MAX_MESSAGE_BYTES)
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+        transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, sys.stdout)
+        writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+        await self._track(reader, writer)
+
+    async def serve_forever(self):
+        """运行直到close()被调用"""
+        await self._closing_event().wait()
+        await self.wait_closed()
+
+    async def close(self):
+        """停止接受新连接和新请求，等待在途请求完成"""
+        self._closing_event().set()
+        for server in self._servers:
+            server.close()
+        await self.wait_closed()
+
+    async def wait_closed(self):
+        for server in self._servers:
+            await server.wait_closed()
+        if self._connections:
+            await asyncio.wait(set(self._connections), timeout=self.drain_timeout)
+
+
+class JSONRPCClient:
+    """JSON-RPC客户端，同一连接上可以并发发出多个请求(流水线)，响应按id匹配"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, process=None):
+        self.reader = reader
+        self.writer = writer
+        self.process = process
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, asyncio.Future] = {}
+        # 流式请求id -> 收到的块和最终响应
+        self._streams: Dict[int, asyncio.Queue] = {}
+        self._write_lock = asyncio.Lock()
+        self._reader_task = asyncio.ensure_future(self._read_loop())
+
+    @classmethod
+    async def connect(cls, url: str) -> "JSONRPCClient":
+        """按URL连接: tcp://host:port、unix:///path/to.sock、stdio:<启动服务器的命令>"""
+        if url.startswith("tcp://"):
+            host, _, port = url[len("tcp://"):].rpartition(":")
+            reader, writer = await asyncio.open_connection(host, int(port), limit=MAX_MESSAGE_BYTES)
+            return cls(reader, writer)
+        if url.startswith("unix://"):
+            reader, writer = await asyncio.open_unix_connection(url[len("unix://"):], limit=MAX_MESSAGE_BYTES)
+            return cls(reader, writer)
+        if url.startswith("stdio:"):
+            process = await asyncio.create_subprocess_exec(
+                *shlex.split(url[len("stdio:"):]),
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                limit=MAX_MESSAGE_BYTES
+            )
+            return cls(process.stdout, process.stdin, process)
+        raise ValueError(f"Unsupported MCP server url: {url}")
+
+    async def _read_loop(self):
+        error: Exception = ConnectionError("MCP server closed the connection")
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    logger.warning("Ignoring malformed JSON-RPC message")
+                    continue
+                if message.get("method") == "tools/chunk":
+                    params = message.get("params") or {}
+                    request_id = params.get("id")
+                    queue = self._streams.get(request_id)
+                    if queue is None:
+                        continue
+                    if queue.qsize() >= STREAM_WINDOW:
+                        # 服务器没有遵守流控额度，结束该流而不是无限缓存或阻塞读取循环
+                        del self._streams[request_id]
+                        queue.put_nowait(("error", JSONRPCError(
+                            INTERNAL_ERROR, f"MCP server exceeded the stream window of {STREAM_WINDOW} chunks"
+                        )))
+                    else:
+                        queue.put_nowait(("chunk", params.get("chunk")))
+                    continue
+                queue = self._streams.get(message.get("id"))
+                if queue is not None:
+                    queue.put_nowait(("response", message))
+                    continue
+                future = self._pending.pop(message.get("id"), None)
+                if future is None or future.done():
+                    continue
+                if "error" in message:
+                    err = message["error"]
+                    future.set_exception(
+                        JSONRPCError(err.get("code", INTERNAL_ERROR), err.get("message", ""), err.get("data"))
+                    )
+                else:
+                    future.set_result(message.get("result"))
+        except Exception as e:
+            error = e
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(error)
+            self._pending.clear()
+            for queue in self._streams.values():
+                queue.put_nowait(("error", error))
+
+    async def request(self, method: str, params: Any = None) -> Any:
+        """发送请求并等待对应id的响应"""
+        if self._reader_task.done():
+            raise ConnectionError("MCP server connection is closed")
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        message = {"jsonrpc": "2.0", "id": request_id, "method": method}
+        if params is not None:
+            message["params"] = params
+        try:
+            async with self._write_lock:
+                self.writer.write(_encode(message))
+                await self.writer.drain()
+            return await future
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def stream(self, method: str, params: Any = None) -> AsyncIterator[Any]:
+        """发送流式请求，逐个产出tools/chunk通知中的块，收到最终响应后结束
+
+        每个流最多缓存STREAM_WINDOW块：服务器只在客户端授予的额度内发送，消费者每取走半个窗口的块
+        补充一次额度。消费慢只会暂停这个流，读取循环和同一连接上的其他请求不受影响。
+        """
+        if self._reader_task.done():
+            raise ConnectionError("MCP server connection is closed")
+        request_id = next(self._ids)
+        queue: asyncio.Queue = asyncio.Queue()
+        self._streams[request_id] = queue
+        message = {"jsonrpc": "2.0", "id": request_id, "method": method}
+        if params is not None:
+            message["params"] = {**params, "window": STREAM_WINDOW} if isinstance(params, dict) else params
+        finished = False
+        consumed = 0
+        try:
+            async with self._write_lock:
+                self.writer.write(_encode(message))
+                await self.writer.drain()
+            while True:
+                kind, payload = await queue.get()
+                if kind == "chunk":
+                    yield payload
+                    consumed += 1
+                    if consumed >= STREAM_WINDOW // 2:
+                        await self.notify("tools/credit", {"id": request_id, "credits": consumed})
+                        consumed = 0
+                elif kind == "error":
+                    finished = True
+                    raise payload
+                else:
+                    finished = True
+                    if "error" in payload:
+                        err = payload["error"]
+                        raise JSONRPCError(err.get("code", INTERNAL_ERROR), err.get("message", ""), err.get("data"))
+                    return
+        finally:
+            self._streams.pop(request_id, None)
+            if not finished and not self._reader_task.done():
+                # 提前结束：通知服务器停止该流，否则它会一直等待额度
+                try:
+                    await self.notify("tools/cancel", {"id": request_id})
+                except (ConnectionError, RuntimeError, OSError):
+                    pass
+
+    async def notify(self, method: str, params: Any = None):
+        """发送不需要响应的通知"""
+        message = {"jsonrpc": "2.0", "method": method}
+        if params is not None:
+            message["params"] = params
+        async with self._write_lock:
+            self.writer.write(_encode(message))
+            await self.writer.drain()
+
+    async def close(self):
+        """关闭连接；stdio模式下等待服务器子进程退出"""
+        try:
+            if self.writer.can_write_eof():
+                self.writer.write_eof()
+            if self.process is None:
+                self.writer.close()
+        except (ConnectionError, RuntimeError, OSError):
+            pass
+        # 等服务器处理完在途请求并关闭连接
+        try:
+            await asyncio.wait_for(asyncio.shield(self._reader_task), timeout=5.0)
+        except asyncio.TimeoutError:
+            self._reader_task.cancel()
+        if self.process is not None:
+            await self.process.wait()
+
+
+class RemoteMCPServer:
+    """远程工具服务器代理，接口与MCPServer一致，可直接传给MCPClient或网关"""
+
+    def __init__(self, client: JSONRPCClient, tools_schema: Dict[str, Any]):
+        self.client = client
+        self._tools_schema = tools_schema
+
+    @classmethod
+    async def connect(cls, url: str) -> "RemoteMCPServer":
+        client = await JSONRPCClient.connect(url)
+        return cls(client, await client.request("tools/list"))
+
+    @property
+    def tools(self) -> Dict[str, Any]:
+        return self._tools_schema
+
+    async def refresh_tools(self) -> Dict[str, Any]:
+        """重新拉取工具列表"""
+        self._tools_schema = await self.client.request("tools/list")
+        return self._tools_schema
+
+    def get_tools_schema(self) -> Dict[str, Any]:
+        return self._tools_schema
+
+    async def call_tool(self, tool_name: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            return await self.client.request("tools/call", {"name": tool_name, "arguments": parameters})
+        except (JSONRPCError, ConnectionError) as e:
+            return {"success": False, "error": str(e)}
+
+    async def stream_tool(self, tool_name: str, parameters: Dict[str, Any]) -> AsyncIterator[Any]:
+        """流式调用远程工具，逐块产出结果"""
+        async for chunk in self.client.stream("tools/stream", {"name": tool_name, "arguments": parameters}):
+            yield chunk
+
+    async def close(self):
+        await self.client.close()
+
+
+async def run_server(mcp_server, transport: str = "tcp", host: str = "localhost",
+                     port: int = 3000, path: Optional[str] = None):
+    """按传输方式运行服务器直到被中断"""
+    server = JSONRPCServer(mcp_server)
+    if transport == "stdio":
+        await server.serve_stdio()
+        return
+    if transport == "tcp":
+        await server.start_tcp(host, port)
+    elif transport == "unix":
+        await server.start_unix(path or "/tmp/mcp_server.sock")
+    else:
+        raise ValueError(f"Unsupported transport: {transport}")
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+
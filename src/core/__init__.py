@@ -2,5 +2,19 @@
 核心模块
 """
 from .llm_client import LLMClient
+from .cache import ResponseCache
+from .rate_limiter import AdaptiveRateLimiter, get_rate_limiter
+from .router import RouterClient
+from .http_pool import get_http_client, close_http_clients
+from .singleflight import SingleFlight
+from .batch_job import BatchJob
+from .tokens import TokenCounter, ContextTrimmer
+from .metrics import get_metrics_registry, start_metrics_server
+from .scheduler import RequestScheduler, DeadlineExceeded, get_scheduler
 
-__all__ = ["LLMClient"] 
\ No newline at end of file
+__all__ = [
+    "LLMClient", "ResponseCache", "AdaptiveRateLimiter", "get_rate_limiter",
+    "RouterClient", "get_http_client", "close_http_clients", "SingleFlight",
+    "BatchJob", "TokenCounter", "ContextTrimmer", "get_metrics_registry",
+    "start_metrics_server", "RequestScheduler", "DeadlineExceeded", "get_scheduler"
+] 
\ No newline at end of file
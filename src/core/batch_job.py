@@ -0,0 +1,292 @@
+"""
+JSONL批处理任务模块
+流式读取输入JSONL，有界并发调用LLMClient，增量写出结果并记录检查点，崩溃后可断点续跑
+
+输入每行: {"id": 可选, "messages": [...]} 或 {"id": 可选, "prompt": "..."}，可带 "kwargs"
+输出每行: {"id", "line", "success", "response"} 或 {"id", "line", "success", "error"}
+
+用法:
+    python -m src.core.batch_job input.jsonl output.jsonl --provider openrouter --concurrency 16
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Any, Iterator, Set, Tuple, IO
+from config.settings import get_settings
+from .llm_client import LLMClient
+
+logger = logging.getLogger(__name__)
+
+
+def _usage_tokens(usage: Optional[Dict[str, Any]]) -> Tuple[int, int]:
+    """从usage中取出(输入token, 输出token)，兼容OpenAI与Anthropic字段"""
+    if not usage:
+        return 0, 0
+    prompt = usage.get("prompt_tokens") or usage.get("input_tokens") or 0
+    completion = usage.get("completion_tokens") or usage.get("output_tokens") or 0
+    return int(prompt), int(completion)
+
+
+class BatchJob:
+    """可恢复的JSONL批处理任务
+
+    - 输入按行惰性读取，内存占用与并发数成正比，与文件大小无关
+    - 每完成一行立即追加写出，检查点记录"此前所有行都已完成"的水位线
+    - 续跑时跳过水位线之前的行，并扫描水位线之后已写出的行避免重复调用
+    - retry_failed时重新执行所有从未成功过的行，包括水位线之前的
+    """
+
+    def __init__(
+        self,
+        client: LLMClient,
+        input_path: str,
+        output_path: str,
+        concurrency: Optional[int] = None,
+        checkpoint_path: Optional[str] = None,
+        checkpoint_every: int = 100,
+        report_interval: float = 10.0,
+        retry_failed: bool = False,
+        **request_kwargs
+    ):
+        self.client = client
+        self.input_path = input_path
+        self.output_path = output_path
+        self.concurrency = concurrency or get_settings().llm_batch_concurrency
+        self.checkpoint_path = checkpoint_path or f"{output_path}.ckpt"
+        self.checkpoint_every = checkpoint_every
+        self.report_interval = report_interval
+        self.retry_failed = retry_failed
+        # 批处理默认以batch优先级排队，只使用交互请求之外的剩余容量(客户端启用schedule时生效)
+        request_kwargs.setdefault("priority", "batch")
+        self.request_kwargs = request_kwargs
+
+        self.lines_read = 0
+        self.pending: Set[int] = set()
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._since_checkpoint = 0
+        self._started = 0.0
+        self._last_report = 0.0
+        self._output: Optional[IO[str]] = None
+
+    # ==================== 检查点 ====================
+
+    def _load_watermark(self) -> int:
+        if not os.path.exists(self.checkpoint_path):
+            return 0
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                return int(json.load(f).get("watermark", 0))
+        except (ValueError, OSError):
+            return 0
+
+    def _scan_output(self, watermark: int) -> Tuple[Set[int], Set[int]]:
+        """扫描已有输出，返回(水位线之后已完成的行, 水位线之前需要重试的失败行)
+
+        失败的行同样会推进水位线，retry_failed时需要从输出中找回水位线之前从未成功过的行。
+        """
+        succeeded: Set[int] = set()
+        failed: Set[int] = set()
+        if os.path.exists(self.output_path):
+            with open(self.output_path, "r", encoding="utf-8") as f:
+                for raw in f:
+                    try:
+                        row = json.loads(raw)
+                    except ValueError:
+                        # 崩溃时写了一半的行
+                        continue
+                    if not isinstance(row, dict) or not isinstance(row.get("line"), int):
+                        continue
+                    (succeeded if row.get("success") else failed).add(row["line"])
+        if not self.retry_failed:
+            return {line for line in succeeded | failed if line >= watermark}, set()
+        return (
+            {line for line in succeeded if line >= watermark},
+            {line for line in failed - succeeded if line < watermark}
+        )
+
+    def _watermark(self) -> int:
+        return min(self.pending) if self.pending else self.lines_read
+
+    def _write_checkpoint(self):
+        """先落盘输出，再原子替换检查点文件"""
+        if self._output is not None:
+            self._output.flush()
+            os.fsync(self._output.fileno())
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "watermark": self._watermark(),
+                "completed": self.completed,
+                "failed": self.failed,
+                "updated_at": time.time()
+            }, f)
+        os.replace(tmp_path, self.checkpoint_path)
+        self._since_checkpoint = 0
+
+    # ==================== 输入输出 ====================
+
+    def _iter_rows(self, watermark: int, done: Set[int],
+                   retry: Set[int]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """惰性读取待处理的输入行，retry中的行即使在水位线之前也会重新执行"""
+        with open(self.input_path, "r", encoding="utf-8") as f:
+            for line_number, raw in enumerate(f):
+                self.lines_read = line_number + 1
+                if ((line_number < watermark and line_number not in retry)
+                        or line_number in done or not raw.strip()):
+                    self.skipped += 1
+                    continue
+                self.pending.add(line_number)
+                try:
+                    row = json.loads(raw)
+                except ValueError as e:
+                    row = {"_error": f"Invalid JSON: {e}"}
+                if not isinstance(row, dict):
+                    row = {"_error": "Row must be a JSON object"}
+                yield line_number, row
+
+    def _open_output(self) -> IO[str]:
+        # 上次崩溃可能留下不完整的最后一行，补一个换行避免与新结果粘连
+        needs_newline = False
+        if os.path.exists(self.output_path) and os.path.getsize(self.output_path) > 0:
+            with open(self.output_path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b"\n"
+        output = open(self.output_path, "a", encoding="utf-8")
+        if needs_newline:
+            output.write("\n")
+        return output
+
+    def _write_result(self, result: Dict[str, Any]):
+        assert self._output is not None
+        self._output.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+        self._output.flush()
+        self.pending.discard(result["line"])
+        self._since_checkpoint += 1
+        if self._since_checkpoint >= self.checkpoint_every:
+            self._write_checkpoint()
+
+    # ==================== 执行 ====================
+
+    @staticmethod
+    def _row_messages(row: Dict[str, Any]) -> List[Dict[str, str]]:
+        if "messages" in row:
+            return row["messages"]
+        if "prompt" in row:
+            return [{"role": "user", "content": row["prompt"]}]
+        raise ValueError("Row must contain 'messages' or 'prompt'")
+
+    async def _process(self, line_number: int, row: Dict[str, Any]) -> Dict[str, Any]:
+        row_id = row.get("id", line_number)
+        try:
+            if "_error" in row:
+                raise ValueError(row["_error"])
+            kwargs = {**self.request_kwargs, **row.get("kwargs", {})}
+            response = await self.client.chat_completion(self._row_messages(row), **kwargs)
+        except Exception as e:
+            self.failed += 1
+            return {"id": row_id, "line": line_number, "success": False, "error": str(e)}
+
+        prompt_tokens, completion_tokens = _usage_tokens(response.get("usage"))
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.completed += 1
+        return {"id": row_id, "line": line_number, "success": True, "response": response}
+
+    def stats(self) -> Dict[str, Any]:
+        """获取运行统计"""
+        elapsed = max(time.perf_counter() - self._started, 1e-9)
+        processed = self.completed + self.failed
+        return {
+            "completed": self.completed,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "in_flight": len(self.pending),
+            "elapsed_s": elapsed,
+            "rows_per_s": processed / elapsed,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "tokens_per_s": (self.prompt_tokens + self.completion_tokens) / elapsed
+        }
+
+    def _maybe_report(self):
+        now = time.perf_counter()
+        if now - self._last_report >= self.report_interval:
+            self._last_report = now
+            stats = self.stats()
+            logger.info(
+                "batch progress: %d done, %d failed, %d skipped, %.1f rows/s, %.0f tokens/s",
+                stats["completed"], stats["failed"], stats["skipped"],
+                stats["rows_per_s"], stats["tokens_per_s"]
+            )
+
+    async def run(self) -> Dict[str, Any]:
+        """运行任务直到输入耗尽，返回统计信息"""
+        watermark = self._load_watermark()
+        done, retry = self._scan_output(watermark)
+        if watermark or done or retry:
+            logger.info(
+                "resuming batch job from line %d (%d rows done after watermark, %d failed rows to retry)",
+                watermark, len(done), len(retry)
+            )
+
+        self._started = self._last_report = time.perf_counter()
+        rows = self._iter_rows(watermark, done, retry)
+        self._output = self._open_output()
+
+        async def worker():
+            # 所有worker共享同一个惰性迭代器
+            for line_number, row in rows:
+                self._write_result(await self._process(line_number, row))
+                self._maybe_report()
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        finally:
+            self._write_checkpoint()
+            self._output.close()
+            self._output = None
+
+        stats = self.stats()
+        logger.info("batch finished: %s", json.dumps(stats))
+        return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="可恢复的JSONL批处理任务")
+    parser.add_argument("input", help="输入JSONL文件")
+    parser.add_argument("output", help="输出JSONL文件(追加写入)")
+    parser.add_argument("--provider", default="openrouter")
+    parser.add_argument("--concurrency", type=int, default=None)
+    parser.add_argument("--max-tokens", type=int, default=None)
+    parser.add_argument("--rate-limit", action="store_true", help="启用客户端自适应限流")
+    parser.add_argument("--schedule", action="store_true", help="经过请求调度器，与交互请求共享配额")
+    parser.add_argument("--retry-failed", action="store_true", help="续跑时重试之前失败的行")
+    parser.add_argument("--checkpoint-every", type=int, default=100)
+    parser.add_argument("--report-interval", type=float, default=10.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=get_settings().log_level)
+    request_kwargs = {"max_tokens": args.max_tokens} if args.max_tokens else {}
+    job = BatchJob(
+        LLMClient(provider=args.provider, rate_limit=args.rate_limit, schedule=args.schedule),
+        args.input,
+        args.output,
+        concurrency=args.concurrency,
+        checkpoint_every=args.checkpoint_every,
+        report_interval=args.report_interval,
+        retry_failed=args.retry_failed,
+        **request_kwargs
+    )
+    stats = asyncio.run(job.run())
+    print(json.dumps(stats, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
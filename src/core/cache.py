@@ -0,0 +1,266 @@
+"""
+LLM响应缓存模块
+两级缓存：进程内LRU + 基于SQLite的持久化缓存或多worker共享的Redis缓存
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Any, Tuple
+from config.settings import get_settings
+
+
+def make_cache_key(
+    provider: str,
+    model: Optional[str],
+    messages: List[Dict[str, Any]],
+    **kwargs
+) -> str:
+    """根据提供商、模型、消息和采样参数生成缓存键"""
+    normalized_messages = [
+        {key: value for key, value in msg.items() if value is not None}
+        for msg in messages
+    ]
+    payload = {
+        "provider": provider,
+        "model": model,
+        "messages": normalized_messages,
+        "kwargs": kwargs
+    }
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def sqlite_path_from_url(database_url: str) -> str:
+    """从sqlite:///path形式的URL中解析文件路径"""
+    prefix = "sqlite:///"
+    if not database_url.startswith(prefix):
+        raise ValueError(f"Unsupported cache database url: {database_url}")
+    return database_url[len(prefix):] or ":memory:"
+
+
+class MemoryCache:
+    """进程内LRU缓存，按条目数和TTL淘汰"""
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[Optional[float], Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        """读取缓存，命中时移动到队尾"""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at < time.time():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else None
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        """删除缓存条目"""
+        self._data.pop(key, None)
+
+    def clear(self):
+        """清空缓存"""
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteCache:
+    """基于SQLite的持久化缓存"""
+
+    def __init__(self, path: str, ttl: Optional[float] = 86400):
+        import sqlite3
+
+        self.path = path
+        self.ttl = ttl
+        directory = os.path.dirname(path)
+        if directory and path != ":memory:":
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_response_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            )
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        """读取缓存，过期条目会被删除"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM llm_response_cache WHERE key = ?",
+                (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at < time.time():
+                self._conn.execute("DELETE FROM llm_response_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+        return json.loads(value)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """写入缓存"""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_response_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False, default=str), expires_at)
+            )
+            self._conn.commit()
+
+    def delete(self, key: str):
+        """删除缓存条目"""
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_response_cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_response_cache")
+            self._conn.commit()
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+
+class ResponseCache:
+    """两级LLM响应缓存
+
+    先查进程内LRU，未命中再查第二级(SQLite或Redis)，命中后回填内存层。
+    Redis后端由多个worker进程共享。
+    只缓存显式指定 temperature <= 0 的请求(未指定或 > 0 时跳过)，除非调用方显式force。
+    """
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        ttl: Optional[float] = None,
+        database_url: Optional[str] = None,
+        persistent: bool = True,
+        backend: Optional[str] = None,
+        redis_client=None
+    ):
+        settings = get_settings()
+        ttl = settings.llm_cache_ttl if ttl is None else ttl
+        backend = (backend or settings.llm_cache_backend) if persistent else "none"
+        self.memory = MemoryCache(
+            max_entries=max_entries or settings.llm_cache_max_entries,
+            ttl=ttl
+        )
+        self.disk: Optional[SQLiteCache] = None
+        self.remote = None
+        if backend == "sqlite":
+            self.disk = SQLiteCache(
+                sqlite_path_from_url(database_url or settings.database_url),
+                ttl=ttl
+            )
+        elif backend == "redis":
+            from .redis_backend import RedisCache
+            self.remote = RedisCache(client=redis_client, ttl=ttl)
+        elif backend != "none":
+            raise ValueError(f"Unsupported cache backend: {backend}")
+        self.hits = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    @staticmethod
+    def is_cacheable(force: bool = False, **kwargs) -> bool:
+        """判断请求是否可以缓存"""
+        if force:
+            return True
+        if kwargs.get("stream"):
+            return False
+        # 未指定temperature时提供商使用非零默认值(通常为1.0)，结果不确定，不缓存
+        temperature = kwargs.get("temperature")
+        return temperature is not None and temperature <= 0
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """按内存 -> 第二级的顺序读取缓存"""
+        value = self.memory.get(key)
+        if value is not None:
+            self.hits += 1
+            self.memory_hits += 1
+            return value
+
+        if self.remote is not None:
+            value = await self.remote.get(key)
+        elif self.disk is not None:
+            value = await asyncio.to_thread(self.disk.get, key)
+        if value is not None:
+            self.hits += 1
+            self.disk_hits += 1
+            self.memory.set(key, value)
+            return value
+
+        self.misses += 1
+        return None
+
+    async def prefetch(self, keys: List[str]) -> int:
+        """批量预取Redis中的条目到内存层(一次往返)，返回预取到的条目数"""
+        if self.remote is None:
+            return 0
+        missing = [key for key in dict.fromkeys(keys) if self.memory.get(key) is None]
+        found = 0
+        for key, value in zip(missing, await self.remote.get_many(missing)):
+            if value is not None:
+                self.memory.set(key, value)
+                found += 1
+        return found
+
+    async def set(self, key: str, value: Dict[str, Any]):
+        """同时写入内存和第二级缓存"""
+        self.memory.set(key, value)
+        if self.remote is not None:
+            await self.remote.set(key, value)
+        elif self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, value)
+
+    def record_bypass(self):
+        """记录一次跳过缓存的请求"""
+        self.bypassed += 1
+
+    def clear(self):
+        """清空两级缓存(Redis后端只清空内存层，共享数据用 await cache.remote.clear())"""
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取命中统计"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory)
+        }
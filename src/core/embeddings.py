@@ -0,0 +1,58 @@
+"""
+本地embeddings模块
+不依赖任何服务的确定性embedder，用于离线测试和示例
+"""
+import hashlib
+import math
+import re
+from typing import Dict, List, Any
+from .llm_client import BaseLLMClient
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+class HashingEmbedder(BaseLLMClient):
+    """特征哈希embedder
+
+    把小写单词和字符三元组哈希到固定维度(带符号，减少碰撞偏差)，再做L2归一化。
+    相同文本在任何进程、任何机器上得到相同向量；字面相近的文本余弦相似度更高。
+    只支持embed：LLMClient(provider="hashing")，或 LLMClient(provider, embedder=HashingEmbedder()) 只替换embeddings。
+    """
+
+    max_embed_batch = 4096
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.model = f"hashing-{dim}"
+
+    def _features(self, text: str) -> List[str]:
+        words = _WORD.findall(text.lower())
+        features = [f"w:{word}" for word in words]
+        for word in words:
+            padded = f"#{word}#"
+            features.extend(f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2))
+        return features
+
+    def embed_text(self, text: str) -> List[float]:
+        vector = [0.0] * self.dim
+        for feature in self._features(text):
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            vector[value % self.dim] += 1.0 if (value >> 63) & 1 else -1.0
+        norm = math.sqrt(sum(x * x for x in vector))
+        return [x / norm for x in vector] if norm else vector
+
+    async def embed(self, texts: List[str], **kwargs) -> Dict[str, Any]:
+        """本地计算embeddings，忽略model等提供商参数"""
+        tokens = sum(len(_WORD.findall(text)) for text in texts)
+        return {
+            "embeddings": [self.embed_text(text) for text in texts],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            "model": self.model
+        }
+
+    async def chat_completion(self, messages: List[Dict[str, str]], **kwargs) -> Dict[str, Any]:
+        raise NotImplementedError("HashingEmbedder only supports embeddings")
+
+    async def text_completion(self, prompt: str, **kwargs) -> str:
+        raise NotImplementedError("HashingEmbedder only supports embeddings")
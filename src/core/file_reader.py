@@ -0,0 +1,157 @@
+"""
+文件分段读取模块
+按字节范围或行范围读取大文件，只读取和解码请求的部分；行定位直接扫描字节中的换行符，
+大文件通过只读mmap扫描，读取日志末尾的开销与请求的字节数成正比，与文件大小无关
+"""
+import codecs
+import mmap
+import os
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, Optional, Tuple
+
+# 不小于该大小的文件按行读取时使用mmap
+MMAP_THRESHOLD = 1024 * 1024
+# 向前跳行时每次计数的字节数
+_SCAN_CHUNK = 1024 * 1024
+
+
+@contextmanager
+def _mapped(path: str) -> Iterator[Tuple[Any, int]]:
+    """返回可切片、可find/rfind的文件内容和文件大小：大文件为只读mmap，小文件直接读入"""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield mapped, size
+        else:
+            yield f.read(), size
+
+
+def _decode(data: bytes, encoding: str, final: bool) -> Tuple[str, int]:
+    """解码一段字节，末尾不完整的多字节字符留给下一段；返回文本和实际消耗的字节数"""
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    text = decoder.decode(data, final=final)
+    return text, len(data) - len(decoder.getstate()[0])
+
+
+def _char_start(data: bytes, encoding: str) -> int:
+    """UTF-8下从字符中间开始时，跳过开头的续字节"""
+    if codecs.lookup(encoding).name != "utf-8":
+        return 0
+    skip = 0
+    while skip < min(3, len(data)) and data[skip] & 0xC0 == 0x80:
+        skip += 1
+    return skip
+
+
+def _skip_lines(data: Any, size: int, pos: int, count: int) -> int:
+    """从pos开始跳过count行，返回下一行开头的偏移；不足count行时返回size"""
+    while count > 0 and pos < size:
+        chunk = data[pos:pos + _SCAN_CHUNK]
+        newlines = chunk.count(b"\n")
+        if newlines < count:
+            count -= newlines
+            pos += len(chunk)
+            continue
+        for _ in range(count):
+            pos = data.find(b"\n", pos) + 1
+        return pos
+    return min(pos, size)
+
+
+def _tail_start(data: Any, size: int, count: int) -> int:
+    """最后count行的起始偏移，从文件末尾向前查找换行符"""
+    pos = size
+    # 文件末尾的换行属于最后一行
+    if pos > 0 and data[pos - 1:pos] == b"\n":
+        pos -= 1
+    for _ in range(count):
+        newline = data.rfind(b"\n", 0, pos)
+        if newline < 0:
+            return 0
+        pos = newline
+    return pos + 1
+
+
+def read_range(path: str, offset: int = 0, length: Optional[int] = None,
+               encoding: str = "utf-8") -> Dict[str, Any]:
+    """读取字节范围 [offset, offset + length)，负的offset表示从文件末尾倒数
+
+    返回的next_offset是下一段的起点，不会把多字节字符切成两半。
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if offset < 0:
+            offset = max(0, size + offset)
+        offset = min(offset, size)
+        end = size if length is None else min(size, offset + max(0, length))
+        f.seek(offset)
+        data = f.read(end - offset)
+    skip = _char_start(data, encoding) if offset > 0 else 0
+    content, consumed = _decode(data[skip:], encoding, final=end >= size)
+    next_offset = offset + skip + consumed
+    return {
+        "content": content,
+        "offset": offset + skip,
+        "next_offset": next_offset,
+        "file_size": size,
+        "eof": next_offset >= size
+    }
+
+
+def read_lines(path: str, start_line: int, end_line: Optional[int] = None,
+               encoding: str = "utf-8", max_bytes: Optional[int] = None) -> Dict[str, Any]:
+    """读取行范围 [start_line, end_line](从1开始，含两端)；start_line为负数时读取最后 -start_line 行
+
+    超过max_bytes时在最后一个完整行处截断(truncated=True)，next_offset可用于继续按字节读取。
+    """
+    if start_line == 0:
+        raise ValueError("start_line starts from 1, or is negative to read from the end")
+    with _mapped(path) as (data, size):
+        if start_line > 0:
+            start = _skip_lines(data, size, 0, start_line - 1)
+            end = size if end_line is None else _skip_lines(data, size, start, max(0, end_line - start_line + 1))
+        else:
+            start = _tail_start(data, size, -start_line)
+            end = size
+        truncated = max_bytes is not None and end - start > max_bytes
+        if truncated:
+            end = start + max_bytes
+            newline = data.rfind(b"\n", start, end)
+            if newline >= start:
+                end = newline + 1
+        raw = bytes(data[start:end])
+    # 按字节截断时末尾可能是半个字符，留给next_offset之后的读取
+    content, consumed = _decode(raw, encoding, final=not truncated)
+    lines = content.count("\n") + (1 if content and not content.endswith("\n") else 0)
+    result = {
+        "content": content,
+        "lines": lines,
+        "offset": start,
+        "next_offset": start + consumed,
+        "file_size": size,
+        "eof": start + consumed >= size,
+        "truncated": truncated
+    }
+    if start_line > 0:
+        result["start_line"] = start_line
+        result["end_line"] = start_line + lines - 1
+    return result
+
+
+def iter_chunks(path: str, offset: int = 0, length: Optional[int] = None,
+                chunk_size: int = 256 * 1024, encoding: str = "utf-8") -> Iterator[Dict[str, Any]]:
+    """从offset开始按chunk_size逐段读取，直到文件末尾或读满length字节"""
+    chunk_size = max(chunk_size, 4)
+    end = None
+    while True:
+        remaining = length if end is None else end - offset
+        chunk = read_range(path, offset, chunk_size if remaining is None else min(chunk_size, remaining), encoding)
+        if end is None:
+            # 负的offset在第一次读取时确定位置
+            end = chunk["file_size"] if length is None else min(chunk["file_size"], chunk["offset"] + length)
+        yield chunk
+        offset = chunk["next_offset"]
+        # 剩余字节不足一个完整字符时不再前进
+        if chunk["eof"] or offset >= end or offset == chunk["offset"]:
+            return
@@ -0,0 +1,295 @@
+"""
+HTTP网关模块
+用FastAPI对外提供LLMClient(含SSE流式)和MCPServer工具注册表，由uvicorn多worker进程运行
+
+每个worker进程持有自己的LLMClient和上游连接池；配置Redis后端时，响应缓存和提供商配额在worker间共享。
+工具可以读写本机文件：挂载的工具只有在设置了GATEWAY_API_KEY或GATEWAY_TOOL_ALLOWLIST后才对外提供。
+运行: python -m src.core.gateway --workers 4
+"""
+import argparse
+import importlib
+import importlib.util
+import json
+import logging
+import os
+import secrets
+import sys
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Any, AsyncIterator, Sequence, Set
+
+from fastapi import Depends, FastAPI, Header, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, ConfigDict
+
+from config.settings import get_settings
+from .cache import ResponseCache
+from .http_pool import close_http_clients
+from .llm_client import LLMClient, RateLimitError
+from .metrics import get_metrics_registry
+from .scheduler import DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+
+class ChatRequest(BaseModel):
+    """聊天请求，messages之外的字段(max_tokens、temperature、priority、deadline等)原样传给LLMClient"""
+
+    model_config = ConfigDict(extra="allow")
+
+    messages: List[Dict[str, Any]]
+    provider: Optional[str] = None
+    stream: bool = False
+    # 使用网关挂载的MCP工具，执行原生工具调用循环
+    mcp_tools: bool = False
+    max_rounds: Optional[int] = None
+
+
+class EmbeddingRequest(BaseModel):
+    """embeddings请求，其他字段(model、dimensions等)原样传给LLMClient.embed"""
+
+    model_config = ConfigDict(extra="allow")
+
+    input: List[str]
+    provider: Optional[str] = None
+
+
+def load_mcp_server(spec: str):
+    """按 "模块:属性" 或 "文件路径.py:属性" 加载MCPServer实例"""
+    target, _, attr = spec.partition(":")
+    if target.endswith(".py"):
+        name = os.path.splitext(os.path.basename(target))[0]
+        module = sys.modules.get(name)
+        if module is None:
+            module_spec = importlib.util.spec_from_file_location(name, target)
+            module = importlib.util.module_from_spec(module_spec)
+            sys.modules[name] = module
+            module_spec.loader.exec_module(module)
+    else:
+        module = importlib.import_module(target)
+    return getattr(module, attr or "mcp_server")
+
+
+class Gateway:
+    """单个worker进程内的网关状态：按提供商缓存的LLMClient和MCP工具注册表
+
+    api_key/tool_allowlist默认取GATEWAY_API_KEY/GATEWAY_TOOL_ALLOWLIST；两者都未设置时工具接口返回403，
+    只设置API key时开放全部工具，设置了白名单时只开放白名单中的工具。
+    """
+
+    def __init__(self, default_provider: Optional[str] = None, mcp_server=None,
+                 api_key: Optional[str] = None, tool_allowlist: Optional[Sequence[str]] = None):
+        settings = get_settings()
+        self.default_provider = (default_provider or settings.gateway_provider).lower()
+        self.mcp_server = mcp_server
+        self.api_key = settings.gateway_api_key if api_key is None else api_key
+        if tool_allowlist is None:
+            tool_allowlist = [name.strip() for name in settings.gateway_tool_allowlist.split(",") if name.strip()]
+        # None表示不按名称限制
+        self.tool_allowlist: Optional[Set[str]] = set(tool_allowlist) if tool_allowlist else None
+        self.cache: Optional[ResponseCache] = None
+        self.clients: Dict[str, LLMClient] = {}
+
+    def client(self, provider: Optional[str] = None) -> LLMClient:
+        """获取提供商对应的LLMClient，同一worker内复用"""
+        provider = (provider or self.default_provider).lower()
+        client = self.clients.get(provider)
+        if client is None:
+            if self.cache is None and get_settings().llm_cache_backend != "none":
+                self.cache = ResponseCache()
+            client = self.clients[provider] = LLMClient(
+                provider=provider, cache=self.cache, rate_limit=True, coalesce=True, schedule=True
+            )
+        return client
+
+    def authenticate(self, token: Optional[str]):
+        """设置了API key时校验请求携带的key"""
+        if self.api_key and not (token and secrets.compare_digest(token.encode(), self.api_key.encode())):
+            raise HTTPException(status_code=401, detail="Invalid or missing API key",
+                                headers={"WWW-Authenticate": "Bearer"})
+
+    def require_tools(self):
+        """未挂载工具时返回404，未配置API key或白名单时返回403"""
+        if self.mcp_server is None:
+            raise HTTPException(status_code=404, detail="No MCP server mounted")
+        if not self.api_key and self.tool_allowlist is None:
+            raise HTTPException(status_code=403,
+                                detail="Tool routes are disabled; set GATEWAY_API_KEY or GATEWAY_TOOL_ALLOWLIST")
+
+    def tool_allowed(self, name: str) -> bool:
+        return self.tool_allowlist is None or name in self.tool_allowlist
+
+    def tools_schema(self) -> Dict[str, Any]:
+        """对外开放的工具schema"""
+        self.require_tools()
+        return {
+            name: schema for name, schema in self.mcp_server.get_tools_schema().items() if self.tool_allowed(name)
+        }
+
+    async def call_tool(self, name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """调用对外开放的工具；也作为工具调用循环的executor，模型请求未开放的工具时返回错误结果"""
+        self.require_tools()
+        if not self.tool_allowed(name):
+            return {"success": False, "error": f"Tool '{name}' is not allowed"}
+        return await self.mcp_server.call_tool(name, arguments)
+
+    async def close(self):
+        # 不等待执行池中未完成的工具调用，避免阻塞事件循环
+        if self.mcp_server is not None and hasattr(self.mcp_server, "shutdown"):
+            self.mcp_server.shutdown(wait=False)
+        await close_http_clients()
+        if "src.core.redis_backend" in sys.modules:
+            from .redis_backend import close_redis_clients
+            await close_redis_clients()
+
+
+def _error_status(error: Exception) -> int:
+    if isinstance(error, DeadlineExceeded):
+        return 504
+    if isinstance(error, RateLimitError):
+        return 429
+    if isinstance(error, ValueError):
+        return 400
+    if isinstance(error, NotImplementedError):
+        return 501
+    return 502
+
+
+def _sse(event: Dict[str, Any]) -> str:
+    return f"data: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+
+
+async def _sse_stream(events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    """把增量事件编码为SSE；客户端断开时生成器被关闭，上游流随之取消"""
+    try:
+        async for event in events:
+            yield _sse(event)
+    except Exception as e:
+        logger.warning("stream failed: %s", e)
+        yield _sse({"type": "error", "error": str(e), "status": _error_status(e)})
+    yield "data: [DONE]\n\n"
+
+
+def create_app(gateway: Optional[Gateway] = None) -> FastAPI:
+    """创建网关应用；uvicorn以factory方式在每个worker进程中调用"""
+    if gateway is None:
+        spec = get_settings().gateway_mcp_server
+        gateway = Gateway(mcp_server=load_mcp_server(spec) if spec else None)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        yield
+        await gateway.close()
+
+    app = FastAPI(title="agent_learning gateway", lifespan=lifespan)
+    app.state.gateway = gateway
+
+    async def require_api_key(authorization: Optional[str] = Header(None), x_api_key: Optional[str] = Header(None)):
+        token = x_api_key
+        if authorization and authorization.lower().startswith("bearer "):
+            token = authorization[len("bearer "):].strip()
+        gateway.authenticate(token)
+
+    # /health和/metrics供探活和抓取使用，不需要API key
+    auth = [Depends(require_api_key)]
+
+    @app.get("/health")
+    async def health():
+        return {
+            "status": "ok",
+            "worker": os.getpid(),
+            "providers": list(gateway.clients),
+            "tools": list(gateway.mcp_server.tools) if gateway.mcp_server is not None else []
+        }
+
+    @app.post("/v1/chat/completions", dependencies=auth)
+    async def chat_completions(body: ChatRequest):
+        kwargs = dict(body.model_extra or {})
+        try:
+            client = gateway.client(body.provider)
+            if body.mcp_tools:
+                tools = gateway.tools_schema()
+                if body.stream:
+                    events = client.stream_tools(body.messages, tools, gateway.call_tool, body.max_rounds, **kwargs)
+                    return StreamingResponse(_sse_stream(events), media_type="text/event-stream")
+                return await client.run_tools(body.messages, tools, gateway.call_tool, body.max_rounds, **kwargs)
+            if body.stream:
+                events = client.stream_chat_completion(body.messages, **kwargs)
+                return StreamingResponse(_sse_stream(events), media_type="text/event-stream")
+            return await client.chat_completion(body.messages, **kwargs)
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error("chat completion failed: %s", e)
+            return JSONResponse({"error": str(e)}, status_code=_error_status(e))
+
+    @app.post("/v1/embeddings", dependencies=auth)
+    async def embeddings(body: EmbeddingRequest):
+        try:
+            vectors = await gateway.client(body.provider).embed(body.input, **(body.model_extra or {}))
+        except Exception as e:
+            logger.error("embeddings failed: %s", e)
+            return JSONResponse({"error": str(e)}, status_code=_error_status(e))
+        return {"embeddings": vectors.tolist()}
+
+    @app.get("/v1/tools", dependencies=auth)
+    async def list_tools():
+        return gateway.tools_schema()
+
+    @app.post("/v1/tools/{name}", dependencies=auth)
+    async def call_tool(name: str, arguments: Optional[Dict[str, Any]] = None):
+        gateway.require_tools()
+        if not gateway.tool_allowed(name):
+            raise HTTPException(status_code=403, detail=f"Tool '{name}' is not allowed")
+        return await gateway.call_tool(name, arguments or {})
+
+    @app.get("/v1/stats", dependencies=auth)
+    async def stats():
+        return {
+            "worker": os.getpid(),
+            "cache": gateway.cache.stats() if gateway.cache is not None else None,
+            "providers": {
+                provider: {
+                    "rate_limit": client.client.rate_limiter.stats() if client.client.rate_limiter else None,
+                    "scheduler": client.scheduler.stats() if client.scheduler else None
+                }
+                for provider, client in gateway.clients.items()
+            },
+            "tool_pools": gateway.mcp_server.pool_stats() if hasattr(gateway.mcp_server, "pool_stats") else None,
+            "tool_cache": gateway.mcp_server.cache_stats() if hasattr(gateway.mcp_server, "cache_stats") else None
+        }
+
+    @app.get("/metrics")
+    async def metrics():
+        # 多worker时每次抓取只看到处理该请求的worker，按worker分别抓取或每个实例只运行一个worker
+        return PlainTextResponse(
+            get_metrics_registry().render_prometheus(),
+            media_type="text/plain; version=0.0.4",
+            headers={"X-Gateway-Worker": str(os.getpid())}
+        )
+
+    return app
+
+
+def main():
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="LLM/MCP HTTP网关")
+    parser.add_argument("--host", default=settings.app_host)
+    parser.add_argument("--port", type=int, default=settings.app_port)
+    parser.add_argument("--workers", type=int, default=settings.app_workers)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    logging.basicConfig(level=settings.log_level)
+    uvicorn.run(
+        "src.core.gateway:create_app",
+        factory=True,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        log_level=settings.log_level.lower()
+    )
+
+
+if __name__ == "__main__":
+    main()
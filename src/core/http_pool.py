@@ -0,0 +1,81 @@
+"""
+HTTP连接池模块
+进程内按base_url复用httpx.AsyncClient和SDK客户端，避免重复的DNS/TLS握手
+"""
+import asyncio
+import importlib.util
+from typing import Dict, List, Any, Callable, Hashable, TYPE_CHECKING
+from config.settings import get_settings
+
+if TYPE_CHECKING:
+    import httpx
+
+
+# httpx在首次创建连接池时才导入
+_http_clients: Dict[str, "httpx.AsyncClient"] = {}
+_sdk_clients: Dict[Hashable, Any] = {}
+
+
+def _http2_available() -> bool:
+    """HTTP/2需要安装h2包"""
+    return importlib.util.find_spec("h2") is not None
+
+
+def get_http_client(base_url: str) -> "httpx.AsyncClient":
+    """获取base_url对应的共享httpx.AsyncClient"""
+    import httpx
+
+    key = base_url.rstrip("/")
+    client = _http_clients.get(key)
+    if client is None or client.is_closed:
+        settings = get_settings()
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.llm_http_max_connections,
+                max_keepalive_connections=settings.llm_http_max_keepalive,
+                keepalive_expiry=settings.llm_http_keepalive_expiry
+            ),
+            timeout=httpx.Timeout(settings.llm_http_timeout, connect=settings.llm_http_connect_timeout),
+            http2=settings.llm_http2 and _http2_available(),
+            follow_redirects=True
+        )
+        _http_clients[key] = client
+    return client
+
+
+def get_shared_client(key: Hashable, factory: Callable[[], Any]) -> Any:
+    """按key复用SDK客户端，不存在时调用factory创建"""
+    client = _sdk_clients.get(key)
+    if client is None:
+        client = factory()
+        _sdk_clients[key] = client
+    return client
+
+
+async def warmup(base_url: str, connections: int = 1) -> int:
+    """预先建立到base_url的连接，返回成功建立的连接数
+
+    只关心握手是否完成，响应状态码(如401/404)不影响预热效果。
+    """
+    import httpx
+
+    client = get_http_client(base_url)
+
+    async def touch() -> bool:
+        try:
+            await client.head(base_url)
+            return True
+        except httpx.HTTPError:
+            return False
+
+    results = await asyncio.gather(*(touch() for _ in range(max(1, connections))))
+    return sum(results)
+
+
+async def close_http_clients():
+    """关闭所有共享连接池"""
+    clients: List["httpx.AsyncClient"] = list(_http_clients.values())
+    _http_clients.clear()
+    _sdk_clients.clear()
+    await asyncio.gather(*(client.aclose() for client in clients), return_exceptions=True)
+
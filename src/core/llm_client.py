@@ -3,16 +3,75 @@ LLM客户端模块
 支持OpenAI、OpenRouter、Anthropic等多种LLM API
 """
 import os
-from typing import Dict, List, Optional, Any
+import time
+import asyncio
+import contextlib
+import weakref
+from typing import Dict, List, Optional, Any, AsyncIterator, Callable
 from abc import ABC, abstractmethod
-import openai
-import anthropic
 from config.settings import get_settings
+from .cache import ResponseCache, make_cache_key
+from .rate_limiter import AdaptiveRateLimiter, get_rate_limiter, parse_reset_seconds
+from .singleflight import SingleFlight, get_singleflight
+from .tokens import TokenCounter, ContextTrimmer
+from .scheduler import RequestScheduler, DeadlineExceeded, get_scheduler, scheduler_dropped
+from . import prompt_cache
+from . import metrics
+from . import tools as tool_calling
+from . import http_pool
+
+
+class RateLimitError(Exception):
+    """提供商返回429限流错误"""
+    
+    def __init__(self, message: str, retry_after: Optional[float] = None, headers: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.headers = headers or {}
+
+
+def _provider_error(provider_name: str, error: Exception) -> Exception:
+    """把SDK异常转换为统一的错误，429单独转换为RateLimitError"""
+    message = f"{provider_name} API error: {str(error)}"
+    if getattr(error, "status_code", None) == 429:
+        response = getattr(error, "response", None)
+        headers = dict(response.headers) if response is not None else {}
+        return RateLimitError(
+            message,
+            retry_after=parse_reset_seconds(headers.get("retry-after")),
+            headers=headers
+        )
+    return Exception(message)
 
 
 class BaseLLMClient(ABC):
     """LLM客户端基类"""
     
+    # 由LLMClient在启用限流时注入，用于根据响应头校准配额
+    rate_limiter: Optional[AdaptiveRateLimiter] = None
+    
+    # 为False时LLMClient不记录该客户端的token用量(如RouterClient，由内部客户端各自记录)
+    records_usage = True
+    
+    # 单次embeddings请求的最大输入条数，LLMClient.embed按此切分批次
+    max_embed_batch = 2048
+    
+    def _observe_headers(self, headers: Any):
+        """把响应头交给限流器"""
+        if self.rate_limiter is not None and headers is not None:
+            self.rate_limiter.update_from_headers(headers)
+    
+    def enable_rate_limit(self, provider: str):
+        """启用提供商限流"""
+        self.rate_limiter = get_rate_limiter(provider)
+    
+    async def warmup(self, connections: int = 1) -> int:
+        """预先建立到提供商的连接，返回建立的连接数"""
+        base_url = getattr(self, "base_url", None)
+        if not base_url:
+            return 0
+        return await http_pool.warmup(base_url, connections)
+    
     @abstractmethod
     async def chat_completion(
         self, 
@@ -30,6 +89,88 @@ class BaseLLMClient(ABC):
     ) -> str:
         """文本完成接口"""
         pass
+    
+    async def embed(self, texts: List[str], **kwargs) -> Dict[str, Any]:
+        """embeddings接口(单次请求)，返回 {"embeddings": [[float]], "usage", "model"}"""
+        raise NotImplementedError(f"{type(self).__name__} does not support embeddings")
+    
+    async def stream_chat_completion(
+        self, 
+        messages: List[Dict[str, str]], 
+        **kwargs
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """流式聊天完成接口
+        
+        依次产出归一化的增量事件:
+        - {"type": "text", "content": str}
+        - {"type": "tool_call_delta", "index": int, "id", "name", "arguments": 参数JSON片段}
+        - {"type": "tool_call_end", "index": int} (提供商给出单个工具调用结束标记时)
+        - {"type": "usage", "usage": dict}
+        - {"type": "done", "model": str, "ttft": float, "latency": float}
+        
+        默认实现退化为一次性调用chat_completion，子类可覆盖为真正的流式实现。
+        """
+        start = time.perf_counter()
+        response = await self.chat_completion(messages, **kwargs)
+        elapsed = time.perf_counter() - start
+        if response.get("content"):
+            yield {"type": "text", "content": response["content"]}
+        for event in tool_calling.tool_call_deltas(response.get("tool_calls") or []):
+            yield event
+        if response.get("usage"):
+            yield {"type": "usage", "usage": response["usage"]}
+        yield {
+            "type": "done",
+            "model": response.get("model"),
+            "ttft": elapsed,
+            "latency": elapsed
+        }
+
+
+async def _iter_openai_stream(stream, start: float) -> AsyncIterator[Dict[str, Any]]:
+    """把OpenAI兼容接口的流式chunk转换为归一化增量事件"""
+    ttft = None
+    model = None
+    async for chunk in stream:
+        model = chunk.model or model
+        if chunk.choices:
+            delta = chunk.choices[0].delta
+            if ttft is None and (delta.content or delta.tool_calls):
+                ttft = time.perf_counter() - start
+            if delta.content:
+                yield {"type": "text", "content": delta.content}
+            for call in delta.tool_calls or []:
+                yield {
+                    "type": "tool_call_delta",
+                    "index": call.index,
+                    "id": call.id,
+                    "name": call.function.name if call.function else None,
+                    "arguments": (call.function.arguments if call.function else None) or ""
+                }
+        if getattr(chunk, "usage", None):
+            yield {"type": "usage", "usage": prompt_cache.cache_usage_openai(chunk.usage.dict())}
+    yield {
+        "type": "done",
+        "model": model,
+        "ttft": ttft,
+        "latency": time.perf_counter() - start
+    }
+
+
+async def _openai_embed(client: BaseLLMClient, texts: List[str], **kwargs) -> Dict[str, Any]:
+    """OpenAI兼容接口的embeddings请求"""
+    raw = await client.client.embeddings.with_raw_response.create(
+        model=kwargs.pop("model", None) or client.embedding_model,
+        input=texts,
+        **kwargs
+    )
+    client._observe_headers(raw.headers)
+    response = raw.parse()
+    return {
+        "embeddings": [item.embedding for item in sorted(response.data, key=lambda item: item.index)],
+        "usage": response.usage.dict() if response.usage else None,
+        "model": response.model
+    }
 
 
 class OpenAIClient(BaseLLMClient):
@@ -40,15 +181,31 @@ class OpenAIClient(BaseLLMClient):
         self.api_key = api_key or self.settings.openai_api_key
         self.base_url = base_url or self.settings.openai_api_base
         self.model = self.settings.openai_model
+        self.embedding_model = self.settings.openai_embedding_model
+        self.prompt_cache = self.settings.llm_prompt_cache
         
         if not self.api_key:
             raise ValueError("OpenAI API key is required")
         
-        self.client = openai.AsyncOpenAI(
-            api_key=self.api_key,
-            base_url=self.base_url
+        # SDK在首次实例化时才导入，相同api_key/base_url的客户端在进程内共享连接池
+        import openai
+        
+        self.client = http_pool.get_shared_client(
+            ("openai", self.api_key, self.base_url),
+            lambda: openai.AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                http_client=http_pool.get_http_client(self.base_url)
+            )
         )
     
+    def _prepare_messages(self, messages: List[Dict[str, str]], kwargs: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """转换工具定义；OpenAI自动缓存相同前缀，只需保证消息序列化字节稳定"""
+        kwargs.pop("prompt_cache", None)
+        if kwargs.get("tools"):
+            kwargs["tools"] = tool_calling.to_openai_tools(kwargs["tools"])
+        return prompt_cache.stable_messages(tool_calling.to_openai_messages(messages))
+    
     async def chat_completion(
         self, 
         messages: List[Dict[str, str]], 
@@ -56,18 +213,52 @@ class OpenAIClient(BaseLLMClient):
     ) -> Dict[str, Any]:
         """OpenAI聊天完成"""
         try:
-            response = await self.client.chat.completions.create(
+            messages = self._prepare_messages(messages, kwargs)
+            raw = await self.client.chat.completions.with_raw_response.create(
                 model=self.model,
                 messages=messages,  # type: ignore
                 **kwargs
             )
+            self._observe_headers(raw.headers)
+            response = raw.parse()
+            message = response.choices[0].message
             return {
-                "content": response.choices[0].message.content,
-                "usage": response.usage.dict() if response.usage else None,
+                "content": message.content,
+                "tool_calls": tool_calling.from_openai_tool_calls(message.tool_calls),
+                "usage": prompt_cache.cache_usage_openai(response.usage.dict() if response.usage else None),
                 "model": response.model
             }
         except Exception as e:
-            raise Exception(f"OpenAI API error: {str(e)}")
+            raise _provider_error("OpenAI", e)
+    
+    async def stream_chat_completion(
+        self, 
+        messages: List[Dict[str, str]], 
+        **kwargs
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """OpenAI流式聊天完成"""
+        start = time.perf_counter()
+        try:
+            messages = self._prepare_messages(messages, kwargs)
+            raw = await self.client.chat.completions.with_raw_response.create(
+                model=self.model,
+                messages=messages,  # type: ignore
+                stream=True,
+                stream_options={"include_usage": True},
+                **kwargs
+            )
+            self._observe_headers(raw.headers)
+            async for delta in _iter_openai_stream(raw.parse(), start):
+                yield delta
+        except Exception as e:
+            raise _provider_error("OpenAI", e)
+    
+    async def embed(self, texts: List[str], **kwargs) -> Dict[str, Any]:
+        """OpenAI embeddings"""
+        try:
+            return await _openai_embed(self, texts, **kwargs)
+        except Exception as e:
+            raise _provider_error("OpenAI", e)
     
     async def text_completion(self, prompt: str, **kwargs) -> str:
         """OpenAI文本完成"""
@@ -84,15 +275,32 @@ class OpenRouterClient(BaseLLMClient):
         self.api_key = api_key or self.settings.openrouter_api_key
         self.base_url = base_url or self.settings.openrouter_api_base
         self.model = self.settings.openrouter_model
+        self.embedding_model = self.settings.openrouter_embedding_model
+        self.prompt_cache = self.settings.llm_prompt_cache
         
         if not self.api_key:
             raise ValueError("OpenRouter API key is required")
         
-        self.client = openai.AsyncOpenAI(
-            api_key=self.api_key,
-            base_url=self.base_url
+        # SDK在首次实例化时才导入，相同api_key/base_url的客户端在进程内共享连接池
+        import openai
+        
+        self.client = http_pool.get_shared_client(
+            ("openai", self.api_key, self.base_url),
+            lambda: openai.AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                http_client=http_pool.get_http_client(self.base_url)
+            )
         )
     
+    def _prepare_messages(self, messages: List[Dict[str, str]], kwargs: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """转换工具定义并保持消息字节稳定；路由到Anthropic模型时显式设置缓存断点"""
+        mode = kwargs.pop("prompt_cache", self.prompt_cache)
+        if kwargs.get("tools"):
+            kwargs["tools"] = tool_calling.to_openai_tools(kwargs["tools"])
+        messages = prompt_cache.stable_messages(tool_calling.to_openai_messages(messages))
+        return prompt_cache.mark_openrouter_messages(messages, self.model, mode)
+    
     async def chat_completion(
         self, 
         messages: List[Dict[str, str]], 
@@ -100,18 +308,52 @@ class OpenRouterClient(BaseLLMClient):
     ) -> Dict[str, Any]:
         """OpenRouter聊天完成"""
         try:
-            response = await self.client.chat.completions.create(
+            messages = self._prepare_messages(messages, kwargs)
+            raw = await self.client.chat.completions.with_raw_response.create(
                 model=self.model,
                 messages=messages,  # type: ignore
                 **kwargs
             )
+            self._observe_headers(raw.headers)
+            response = raw.parse()
+            message = response.choices[0].message
             return {
-                "content": response.choices[0].message.content,
-                "usage": response.usage.dict() if response.usage else None,
+                "content": message.content,
+                "tool_calls": tool_calling.from_openai_tool_calls(message.tool_calls),
+                "usage": prompt_cache.cache_usage_openai(response.usage.dict() if response.usage else None),
                 "model": response.model
             }
         except Exception as e:
-            raise Exception(f"OpenRouter API error: {str(e)}")
+            raise _provider_error("OpenRouter", e)
+    
+    async def stream_chat_completion(
+        self, 
+        messages: List[Dict[str, str]], 
+        **kwargs
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """OpenRouter流式聊天完成"""
+        start = time.perf_counter()
+        try:
+            messages = self._prepare_messages(messages, kwargs)
+            raw = await self.client.chat.completions.with_raw_response.create(
+                model=self.model,
+                messages=messages,  # type: ignore
+                stream=True,
+                stream_options={"include_usage": True},
+                **kwargs
+            )
+            self._observe_headers(raw.headers)
+            async for delta in _iter_openai_stream(raw.parse(), start):
+                yield delta
+        except Exception as e:
+            raise _provider_error("OpenRouter", e)
+    
+    async def embed(self, texts: List[str], **kwargs) -> Dict[str, Any]:
+        """OpenRouter embeddings"""
+        try:
+            return await _openai_embed(self, texts, **kwargs)
+        except Exception as e:
+            raise _provider_error("OpenRouter", e)
     
     async def text_completion(self, prompt: str, **kwargs) -> str:
         """OpenRouter文本完成"""
@@ -123,14 +365,76 @@ class OpenRouterClient(BaseLLMClient):
 class AnthropicClient(BaseLLMClient):
     """Anthropic客户端"""
     
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None):
         self.settings = get_settings()
         self.api_key = api_key or self.settings.anthropic_api_key
+        self.base_url = base_url or self.settings.anthropic_api_base
+        self.model = "claude-3-sonnet-20240229"
+        self.prompt_cache = self.settings.llm_prompt_cache
         
         if not self.api_key:
             raise ValueError("Anthropic API key is required")
         
-        self.client = anthropic.AsyncAnthropic(api_key=self.api_key)
+        import anthropic
+        
+        self.client = http_pool.get_shared_client(
+            ("anthropic", self.api_key, self.base_url),
+            lambda: anthropic.AsyncAnthropic(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                http_client=http_pool.get_http_client(self.base_url)
+            )
+        )
+    
+    def _build_create_kwargs(
+        self, 
+        messages: List[Dict[str, str]], 
+        **kwargs
+    ) -> Dict[str, Any]:
+        """把通用消息格式转换为Anthropic messages.create参数
+        
+        所有system消息按顺序合并为system前缀；启用prompt_cache时在tools和system末尾
+        设置cache_control断点，conversation模式下再标记最后一条消息。
+        """
+        mode = kwargs.pop("prompt_cache", self.prompt_cache)
+        
+        # 转换消息格式，tool结果转换为user消息中的tool_result块
+        system_messages = []
+        anthropic_messages = []
+        for msg in messages:
+            if msg["role"] == "system":
+                system_messages.append(msg["content"])
+            elif msg["role"] in ["user", "assistant", "tool"]:
+                anthropic_messages.append(tool_calling.to_anthropic_message(msg))
+        anthropic_messages = tool_calling.merge_anthropic_messages(anthropic_messages)
+        
+        # 准备参数
+        create_kwargs = {
+            "model": self.model,
+            "messages": prompt_cache.mark_anthropic_messages(anthropic_messages, mode),
+            **kwargs
+        }
+        if create_kwargs.get("tools"):
+            create_kwargs["tools"] = prompt_cache.mark_anthropic_tools(
+                tool_calling.to_anthropic_tools(create_kwargs["tools"]), mode
+            )
+        
+        # 只有在有system消息时才添加
+        if system_messages:
+            create_kwargs["system"] = prompt_cache.build_anthropic_system(system_messages, mode)
+        
+        return create_kwargs
+    
+    @staticmethod
+    def _usage(usage: Any) -> Dict[str, int]:
+        """Anthropic usage，附带缓存读写token数"""
+        cache_read, cache_write = prompt_cache.cache_usage_anthropic(usage)
+        return {
+            "input_tokens": usage.input_tokens,
+            "output_tokens": usage.output_tokens,
+            "cache_read_tokens": cache_read,
+            "cache_write_tokens": cache_write
+        }
     
     async def chat_completion(
         self, 
@@ -139,47 +443,73 @@ class AnthropicClient(BaseLLMClient):
     ) -> Dict[str, Any]:
         """Anthropic聊天完成"""
         try:
-            # 转换消息格式
-            system_message = ""
-            user_messages = []
-            
-            for msg in messages:
-                if msg["role"] == "system":
-                    system_message = msg["content"]
-                elif msg["role"] in ["user", "assistant"]:
-                    user_messages.append(msg)
-            
-            # 构建Anthropic格式的消息
-            anthropic_messages = []
-            for msg in user_messages:
-                anthropic_messages.append({
-                    "role": msg["role"],
-                    "content": msg["content"]
-                })
-            
-            # 准备参数
-            create_kwargs = {
-                "model": "claude-3-sonnet-20240229",
-                "messages": anthropic_messages,
-                **kwargs
-            }
-            
-            # 只有在有system消息时才添加
-            if system_message:
-                create_kwargs["system"] = system_message
-            
-            response = await self.client.messages.create(**create_kwargs)
+            create_kwargs = self._build_create_kwargs(messages, **kwargs)
+            raw = await self.client.messages.with_raw_response.create(**create_kwargs)
+            self._observe_headers(raw.headers)
+            response = raw.parse()
             
             return {
-                "content": response.content[0].text,
-                "usage": {
-                    "input_tokens": response.usage.input_tokens,
-                    "output_tokens": response.usage.output_tokens
-                },
+                **tool_calling.from_anthropic_content(response.content),
+                "usage": self._usage(response.usage),
                 "model": response.model
             }
         except Exception as e:
-            raise Exception(f"Anthropic API error: {str(e)}")
+            raise _provider_error("Anthropic", e)
+    
+    async def stream_chat_completion(
+        self, 
+        messages: List[Dict[str, str]], 
+        **kwargs
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Anthropic流式聊天完成"""
+        start = time.perf_counter()
+        ttft = None
+        model = None
+        usage = {"input_tokens": 0, "output_tokens": 0, "cache_read_tokens": 0, "cache_write_tokens": 0}
+        try:
+            create_kwargs = self._build_create_kwargs(messages, **kwargs)
+            raw = await self.client.messages.with_raw_response.create(stream=True, **create_kwargs)
+            self._observe_headers(raw.headers)
+            stream = raw.parse()
+            tool_blocks = set()
+            async for event in stream:
+                if event.type == "message_start":
+                    model = event.message.model
+                    usage.update(self._usage(event.message.usage))
+                elif event.type == "content_block_start" and event.content_block.type == "tool_use":
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                    tool_blocks.add(event.index)
+                    yield {
+                        "type": "tool_call_delta",
+                        "index": event.index,
+                        "id": event.content_block.id,
+                        "name": event.content_block.name,
+                        "arguments": ""
+                    }
+                elif event.type == "content_block_delta":
+                    if event.delta.type == "input_json_delta":
+                        yield {"type": "tool_call_delta", "index": event.index, "arguments": event.delta.partial_json}
+                        continue
+                    text = getattr(event.delta, "text", None)
+                    if text:
+                        if ttft is None:
+                            ttft = time.perf_counter() - start
+                        yield {"type": "text", "content": text}
+                elif event.type == "content_block_stop" and event.index in tool_blocks:
+                    yield {"type": "tool_call_end", "index": event.index}
+                elif event.type == "message_delta":
+                    usage["output_tokens"] = event.usage.output_tokens
+        except Exception as e:
+            raise _provider_error("Anthropic", e)
+        
+        yield {"type": "usage", "usage": usage}
+        yield {
+            "type": "done",
+            "model": model,
+            "ttft": ttft,
+            "latency": time.perf_counter() - start
+        }
     
     async def text_completion(self, prompt: str, **kwargs) -> str:
         """Anthropic文本完成"""
@@ -188,36 +518,678 @@ class AnthropicClient(BaseLLMClient):
         return response["content"]
 
 
+# 提供商注册表：名称 -> 客户端工厂，SDK在工厂首次调用时才导入
+PROVIDER_ENTRY_POINT_GROUP = "agent_learning.llm_providers"
+_provider_factories: Dict[str, Callable[[], BaseLLMClient]] = {}
+
+
+def register_provider(name: str, factory: Callable[[], BaseLLMClient]):
+    """注册LLM提供商"""
+    _provider_factories[name.lower()] = factory
+
+
+def _create_router_client() -> BaseLLMClient:
+    from .router import RouterClient
+    return RouterClient()
+
+
+def _create_hashing_embedder() -> BaseLLMClient:
+    from .embeddings import HashingEmbedder
+    return HashingEmbedder()
+
+
+def _load_entry_point_provider(name: str) -> Optional[Callable[[], BaseLLMClient]]:
+    """从已安装包的entry points中查找第三方提供商"""
+    from importlib.metadata import entry_points
+    
+    for entry_point in entry_points(group=PROVIDER_ENTRY_POINT_GROUP):
+        if entry_point.name.lower() == name:
+            factory = entry_point.load()
+            register_provider(name, factory)
+            return factory
+    return None
+
+
+def get_provider_factory(name: str) -> Callable[[], BaseLLMClient]:
+    """获取提供商工厂，内置提供商未命中时再查找entry points"""
+    name = name.lower()
+    factory = _provider_factories.get(name) or _load_entry_point_provider(name)
+    if factory is None:
+        raise ValueError(f"Unsupported LLM provider: {name}")
+    return factory
+
+
+register_provider("openai", OpenAIClient)
+register_provider("openrouter", OpenRouterClient)
+register_provider("anthropic", AnthropicClient)
+register_provider("router", _create_router_client)
+register_provider("hashing", _create_hashing_embedder)
+
+# 调度参数只影响排队，不传给提供商，也不参与缓存键
+_SCHEDULE_KWARGS = ("priority", "tenant", "deadline")
+
+# 每个提供商共享的批量并发上限；asyncio.Semaphore绑定事件循环，按循环分别保存
+_batch_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_batch_semaphore(provider: str) -> asyncio.Semaphore:
+    """获取提供商共享的批量并发信号量(大小为LLM_BATCH_CONCURRENCY)，同时进行的多个批次共用同一上限"""
+    semaphores = _batch_semaphores.setdefault(asyncio.get_running_loop(), {})
+    if provider not in semaphores:
+        semaphores[provider] = asyncio.Semaphore(get_settings().llm_batch_concurrency)
+    return semaphores[provider]
+
+
 class LLMClient:
-    """LLM客户端管理器"""
+    """LLM客户端管理器
+    
+    provider为"router"时同时持有多个提供商，按延迟路由并对冲慢请求。
+    schedule=True时请求经过进程内共享的调度器，按priority/tenant/deadline排队，见scheduler模块。
+    """
     
-    def __init__(self, provider: str = "openrouter"):
+    def __init__(
+        self, 
+        provider: str = "openrouter", 
+        cache: Optional[ResponseCache] = None, 
+        rate_limit: bool = False, 
+        coalesce: bool = False, 
+        context_budget: Optional[int] = None, 
+        trim_strategy: Optional[str] = None, 
+        schedule: bool = False, 
+        embedder: Optional[BaseLLMClient] = None
+    ):
+        settings = get_settings()
         self.provider = provider.lower()
+        self.cache = cache
+        self.rate_limit = rate_limit
+        self.singleflight: Optional[SingleFlight] = get_singleflight() if coalesce else None
+        self.context_budget = settings.llm_context_budget if context_budget is None else context_budget
+        self.trim_strategy = trim_strategy or settings.llm_trim_strategy
+        self.schedule = schedule
+        # 不为None时embed使用该客户端(如离线的HashingEmbedder)，而不是当前提供商
+        self.embedder = embedder
         self.client = self._create_client()
     
     def _create_client(self) -> BaseLLMClient:
         """创建对应的LLM客户端"""
-        if self.provider == "openai":
-            return OpenAIClient()
-        elif self.provider == "openrouter":
-            return OpenRouterClient()
-        elif self.provider == "anthropic":
-            return AnthropicClient()
-        else:
-            raise ValueError(f"Unsupported LLM provider: {self.provider}")
+        client = get_provider_factory(self.provider)()
+        if self.rate_limit:
+            client.enable_rate_limit(self.provider)
+        self.scheduler: Optional[RequestScheduler] = get_scheduler(self.provider) if self.schedule else None
+        
+        # token计数器与上下文裁剪器跟随提供商/模型切换
+        self.token_counter = TokenCounter.for_model(getattr(client, "model", None))
+        self.trimmer: Optional[ContextTrimmer] = None
+        if self.context_budget:
+            self.trimmer = ContextTrimmer(
+                self.context_budget,
+                counter=self.token_counter,
+                strategy=self.trim_strategy,
+                summarizer=self._summarize_messages,
+                summary_tokens=get_settings().llm_summary_tokens,
+                step=get_settings().llm_trim_step
+            )
+        return client
+    
+    def count_tokens(self, messages: List[Dict[str, Any]]) -> int:
+        """计算消息列表的token数"""
+        return self.token_counter.count_messages(messages)
+    
+    def _estimate_request_tokens(self, messages: List[Dict[str, str]], **kwargs) -> int:
+        """估计一次请求消耗的token数(输入token + 输出上限)"""
+        return self.count_tokens(messages) + int(kwargs.get("max_tokens") or 0)
+    
+    async def _summarize_messages(self, messages: List[Dict[str, Any]]) -> str:
+        """把被裁剪的对话压缩为摘要"""
+        transcript = "\n".join(f"{msg.get('role')}: {msg.get('content')}" for msg in messages)
+        response = await self._limited_chat_completion(
+            [
+                {"role": "system", "content": "Summarize the following conversation concisely, keeping facts, decisions and open questions."},
+                {"role": "user", "content": transcript}
+            ],
+            max_tokens=get_settings().llm_summary_tokens
+        )
+        return response["content"] or ""
+    
+    async def _fit_context(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """按token预算裁剪上下文"""
+        if self.trimmer is None:
+            return messages
+        return await self.trimmer.trim(messages)
+    
+    def _model_label(self, model: Optional[str] = None) -> str:
+        return model or getattr(self.client, "model", None) or self.provider
+    
+    async def _upstream_chat_completion(
+        self, 
+        messages: List[Dict[str, str]], 
+        **kwargs
+    ) -> Dict[str, Any]:
+        """调用提供商并记录延迟、token用量和错误指标"""
+        start = time.perf_counter()
+        try:
+            response = await self.client.chat_completion(messages, **kwargs)
+        except Exception as e:
+            metrics.llm_errors.inc((self.provider, self._model_label(), type(e).__name__))
+            raise
+        latency = time.perf_counter() - start
+        model = self._model_label(response.get("model"))
+        metrics.llm_requests.inc((self.provider, model, "false"))
+        metrics.llm_latency.observe((self.provider, model, "false"), latency)
+        if self.client.records_usage:
+            metrics.record_llm_usage(self.provider, model, response.get("usage"), latency)
+        return response
+    
+    async def _upstream_stream_chat_completion(
+        self, 
+        messages: List[Dict[str, str]], 
+        **kwargs
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """调用提供商流式接口，在done事件时记录延迟、TTFT和token用量"""
+        usage = None
+        try:
+            async for delta in self.client.stream_chat_completion(messages, **kwargs):
+                if delta["type"] == "usage":
+                    usage = delta["usage"]
+                elif delta["type"] == "done":
+                    model = self._model_label(delta.get("model"))
+                    metrics.llm_requests.inc((self.provider, model, "true"))
+                    metrics.llm_latency.observe((self.provider, model, "true"), delta["latency"])
+                    if delta.get("ttft") is not None:
+                        metrics.llm_ttft.observe((self.provider, model), delta["ttft"])
+                    if self.client.records_usage:
+                        metrics.record_llm_usage(self.provider, model, usage, delta["latency"])
+                yield delta
+        except Exception as e:
+            metrics.llm_errors.inc((self.provider, self._model_label(), type(e).__name__))
+            raise
+    
+    async def _limited_chat_completion(
+        self, 
+        messages: List[Dict[str, str]], 
+        **kwargs
+    ) -> Dict[str, Any]:
+        """经过限流器的聊天完成，遇到429时排队重试而不是直接失败"""
+        limiter = self.client.rate_limiter
+        if limiter is None:
+            return await self._upstream_chat_completion(messages, **kwargs)
+        
+        estimated = self._estimate_request_tokens(messages, **kwargs)
+        max_retries = get_settings().llm_rate_limit_max_retries
+        attempt = 0
+        while True:
+            async with limiter.slot(estimated):
+                try:
+                    response = await self._upstream_chat_completion(messages, **kwargs)
+                except RateLimitError as e:
+                    limiter.on_rate_limited(e.retry_after, attempt, e.headers)
+                    if attempt >= max_retries:
+                        raise
+                    attempt += 1
+                    continue
+            
+            usage = response.get("usage") or {}
+            used = (usage.get("total_tokens")
+                    or (usage.get("input_tokens") or 0) + (usage.get("output_tokens") or 0))
+            limiter.on_success(used - estimated if used else 0)
+            return response
+    
+    @staticmethod
+    def _pop_schedule(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """取出调度参数，deadline为相对当前时刻的秒数，转换为绝对时间"""
+        deadline = kwargs.pop("deadline", None)
+        return {
+            "priority": kwargs.pop("priority", "default"),
+            "tenant": kwargs.pop("tenant", "default"),
+            "deadline": time.monotonic() + deadline if deadline is not None else None
+        }
+    
+    def _deadline_exceeded(self, schedule: Dict[str, Any], reason: str) -> DeadlineExceeded:
+        scheduler_dropped.inc((self.provider, schedule["priority"], reason))
+        return DeadlineExceeded(f"{self.provider} request exceeded its deadline ({reason})")
+    
+    async def _scheduled_chat_completion(
+        self, 
+        messages: List[Dict[str, str]], 
+        schedule: Dict[str, Any], 
+        **kwargs
+    ) -> Dict[str, Any]:
+        """经过调度器的聊天完成，执行中超过deadline时取消底层SDK调用"""
+        deadline = schedule["deadline"]
+        scheduler = self.scheduler
+        if scheduler is None:
+            if deadline is None:
+                return await self._limited_chat_completion(messages, **kwargs)
+            try:
+                return await asyncio.wait_for(
+                    self._limited_chat_completion(messages, **kwargs), max(0.0, deadline - time.monotonic())
+                )
+            except asyncio.TimeoutError:
+                raise self._deadline_exceeded(schedule, "timeout") from None
+        
+        cost = self._estimate_request_tokens(messages, **kwargs)
+        async with scheduler.slot(schedule["priority"], schedule["tenant"], deadline, cost):
+            kwargs = scheduler.fit_deadline(schedule["priority"], deadline, kwargs)
+            start = time.perf_counter()
+            call = self._limited_chat_completion(messages, **kwargs)
+            try:
+                if deadline is None:
+                    response = await call
+                else:
+                    response = await asyncio.wait_for(call, max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                raise self._deadline_exceeded(schedule, "timeout") from None
+        
+        usage = response.get("usage") or {}
+        scheduler.observe(
+            time.perf_counter() - start, usage.get("completion_tokens") or usage.get("output_tokens") or 0
+        )
+        return response
+    
+    async def _scheduled_stream_chat_completion(
+        self, 
+        messages: List[Dict[str, str]], 
+        schedule: Dict[str, Any], 
+        **kwargs
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """经过调度器的流式聊天完成，每个增量之间检查deadline，超时后关闭上游流"""
+        deadline = schedule["deadline"]
+        scheduler = self.scheduler
+        if scheduler is None and deadline is None:
+            async for delta in self._limited_stream_chat_completion(messages, **kwargs):
+                yield delta
+            return
+        
+        slot = contextlib.nullcontext()
+        if scheduler is not None:
+            cost = self._estimate_request_tokens(messages, **kwargs)
+            slot = scheduler.slot(schedule["priority"], schedule["tenant"], deadline, cost)
+        async with slot:
+            if scheduler is not None:
+                kwargs = scheduler.fit_deadline(schedule["priority"], deadline, kwargs)
+            stream = self._limited_stream_chat_completion(messages, **kwargs)
+            usage = None
+            try:
+                while True:
+                    try:
+                        if deadline is None:
+                            delta = await stream.__anext__()
+                        else:
+                            delta = await asyncio.wait_for(
+                                stream.__anext__(), max(0.0, deadline - time.monotonic())
+                            )
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError:
+                        raise self._deadline_exceeded(schedule, "timeout") from None
+                    if delta["type"] == "usage":
+                        usage = delta["usage"]
+                    elif delta["type"] == "done" and scheduler is not None:
+                        usage = usage or {}
+                        scheduler.observe(
+                            delta["latency"], usage.get("completion_tokens") or usage.get("output_tokens") or 0
+                        )
+                    yield delta
+            finally:
+                # 关闭上游流，取消仍在进行的SDK请求
+                await stream.aclose()
+    
+    def _cache_key(self, messages: List[Dict[str, Any]], **kwargs) -> str:
+        return make_cache_key(self.provider, getattr(self.client, "model", None), messages, **kwargs)
     
     async def chat_completion(
         self, 
         messages: List[Dict[str, str]], 
         **kwargs
     ) -> Dict[str, Any]:
-        """聊天完成"""
-        return await self.client.chat_completion(messages, **kwargs)
+        """聊天完成
+        
+        配置了cache时，确定性请求(显式指定temperature <= 0)会先查缓存；
+        传入force_cache=True可强制缓存任意请求。
+        启用coalesce时，进行中的相同请求(同一优先级)只向上游发送一次；传入coalesce=False可单次关闭。
+        带deadline的请求不合并，各自按自己的截止时间排队、降级和取消。
+        设置了context_budget时，超出预算的对话会保留system消息和最近轮次，裁剪中间部分。
+        priority(interactive/default/batch)、tenant和deadline(秒)交给调度器，缓存命中的请求不排队。
+        """
+        force_cache = kwargs.pop("force_cache", False)
+        coalesce = kwargs.pop("coalesce", True)
+        schedule = self._pop_schedule(kwargs)
+        messages = await self._fit_context(messages)
+        use_cache = self.cache is not None and self.cache.is_cacheable(force=force_cache, **kwargs)
+        if self.cache is not None and not use_cache:
+            self.cache.record_bypass()
+            metrics.llm_cache_requests.inc((self.provider, "bypass"))
+        use_singleflight = self.singleflight is not None and coalesce and schedule["deadline"] is None
+        
+        key = None
+        if use_cache or use_singleflight:
+            key = self._cache_key(messages, **kwargs)
+        
+        if use_cache:
+            cached = await self.cache.get(key)
+            metrics.llm_cache_requests.inc((self.provider, "miss" if cached is None else "hit"))
+            if cached is not None:
+                return {**cached, "cached": True}
+        
+        if use_singleflight:
+            # 不同优先级不合并，避免交互请求等待在批处理请求的优先级上
+            response = await self.singleflight.do(
+                f"{key}:{schedule['priority']}", lambda: self._scheduled_chat_completion(messages, schedule, **kwargs)
+            )
+            # 合并的调用方共享同一个结果，返回副本避免互相修改
+            response = dict(response)
+        else:
+            response = await self._scheduled_chat_completion(messages, schedule, **kwargs)
+        
+        if use_cache:
+            await self.cache.set(key, response)
+        return response
+    
+    async def stream_chat_completion(
+        self, 
+        messages: List[Dict[str, str]], 
+        **kwargs
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """流式聊天完成，产出text/usage/done增量事件
+        
+        启用coalesce时，相同的进行中流式请求(同一优先级、不带deadline)共享一个上游流。
+        """
+        coalesce = kwargs.pop("coalesce", True)
+        schedule = self._pop_schedule(kwargs)
+        messages = await self._fit_context(messages)
+        if self.singleflight is None or not coalesce or schedule["deadline"] is not None:
+            async for delta in self._scheduled_stream_chat_completion(messages, schedule, **kwargs):
+                yield delta
+            return
+        
+        key = make_cache_key(
+            self.provider, getattr(self.client, "model", None), messages, stream=True,
+            priority=schedule["priority"], **kwargs
+        )
+        async for delta in self.singleflight.stream(
+            key, lambda: self._scheduled_stream_chat_completion(messages, schedule, **kwargs)
+        ):
+            yield delta
+    
+    async def _limited_stream_chat_completion(
+        self, 
+        messages: List[Dict[str, str]], 
+        **kwargs
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """经过限流器的流式聊天完成"""
+        limiter = self.client.rate_limiter
+        if limiter is None:
+            async for delta in self._upstream_stream_chat_completion(messages, **kwargs):
+                yield delta
+            return
+        
+        estimated = self._estimate_request_tokens(messages, **kwargs)
+        max_retries = get_settings().llm_rate_limit_max_retries
+        attempt = 0
+        while True:
+            started = False
+            async with limiter.slot(estimated):
+                try:
+                    async for delta in self._upstream_stream_chat_completion(messages, **kwargs):
+                        started = True
+                        yield delta
+                except RateLimitError as e:
+                    # 已经输出内容后无法透明重试
+                    limiter.on_rate_limited(e.retry_after, attempt, e.headers)
+                    if started or attempt >= max_retries:
+                        raise
+                    attempt += 1
+                    continue
+            limiter.on_success()
+            return
+    
+    async def _batch_item(
+        self, 
+        index: int, 
+        messages: List[Dict[str, str]], 
+        **kwargs
+    ) -> Dict[str, Any]:
+        """执行批量中的单个请求，把异常转换为单条错误结果"""
+        try:
+            response = await self.chat_completion(messages, **kwargs)
+            return {"index": index, "success": True, "response": response}
+        except Exception as e:
+            return {"index": index, "success": False, "error": str(e)}
+    
+    async def chat_completion_as_completed(
+        self, 
+        messages_list: List[List[Dict[str, str]]], 
+        concurrency: Optional[int] = None, 
+        **kwargs
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """有界并发批量聊天完成，按完成顺序产出结果
+        
+        每条结果为 {"index", "success", "response"} 或 {"index", "success", "error"}，
+        单条失败不会中断整个批次。concurrency限制本批次的并发；同一提供商同时进行的所有批次
+        还共享LLM_BATCH_CONCURRENCY的总上限。
+        """
+        concurrency = concurrency or get_settings().llm_batch_concurrency
+        total = len(messages_list)
+        if total == 0:
+            return
+        
+        # 共享缓存(Redis)时一次往返预取整批结果，命中的请求直接从内存层返回
+        request_kwargs = {
+            key: value for key, value in kwargs.items()
+            if key not in ("force_cache", "coalesce", *_SCHEDULE_KWARGS)
+        }
+        if (self.cache is not None and self.trimmer is None
+                and self.cache.is_cacheable(force=kwargs.get("force_cache", False), **request_kwargs)):
+            await self.cache.prefetch([self._cache_key(messages, **request_kwargs) for messages in messages_list])
+        
+        items = iter(enumerate(messages_list))
+        results: asyncio.Queue = asyncio.Queue()
+        shared = get_batch_semaphore(self.provider)
+        
+        async def worker():
+            # 所有worker共享同一个迭代器，worker数量即本批次的并发上限；每条请求还要占用提供商共享的名额
+            for index, messages in items:
+                async with shared:
+                    result = await self._batch_item(index, messages, **kwargs)
+                await results.put(result)
+        
+        workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, total))]
+        try:
+            for _ in range(total):
+                yield await results.get()
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+    
+    async def chat_completion_many(
+        self, 
+        messages_list: List[List[Dict[str, str]]], 
+        concurrency: Optional[int] = None, 
+        **kwargs
+    ) -> List[Dict[str, Any]]:
+        """有界并发批量聊天完成，按输入顺序返回结果"""
+        ordered: List[Optional[Dict[str, Any]]] = [None] * len(messages_list)
+        async for result in self.chat_completion_as_completed(
+            messages_list, concurrency=concurrency, **kwargs
+        ):
+            ordered[result["index"]] = result
+        return ordered  # type: ignore
+    
+    async def _limited_embed(self, embedder: BaseLLMClient, texts: List[str], **kwargs) -> Dict[str, Any]:
+        """经过限流器的单个embeddings请求，遇到429时排队重试"""
+        limiter = embedder.rate_limiter
+        if limiter is None:
+            return await embedder.embed(texts, **kwargs)
+        
+        estimated = sum(self.token_counter.count_text(text) for text in texts)
+        max_retries = get_settings().llm_rate_limit_max_retries
+        attempt = 0
+        while True:
+            async with limiter.slot(estimated):
+                try:
+                    response = await embedder.embed(texts, **kwargs)
+                except RateLimitError as e:
+                    limiter.on_rate_limited(e.retry_after, attempt, e.headers)
+                    if attempt >= max_retries:
+                        raise
+                    attempt += 1
+                    continue
+            used = (response.get("usage") or {}).get("total_tokens")
+            limiter.on_success(used - estimated if used else 0)
+            return response
+    
+    async def embed(
+        self, 
+        texts: List[str], 
+        batch_size: Optional[int] = None, 
+        concurrency: Optional[int] = None, 
+        **kwargs
+    ):
+        """批量embeddings，返回按输入顺序排列的float32矩阵(len(texts), dim)
+        
+        重复文本只请求一次；其余按提供商上限切分为多个请求，有界并发执行。
+        """
+        import numpy as np
+        
+        settings = get_settings()
+        embedder = self.embedder or self.client
+        unique = list(dict.fromkeys(texts))
+        if not unique:
+            return np.zeros((0, 0), dtype=np.float32)
+        
+        batch_size = max(1, min(batch_size or settings.llm_embed_batch_size, embedder.max_embed_batch))
+        semaphore = asyncio.Semaphore(concurrency or settings.llm_embed_concurrency)
+        
+        async def run(batch: List[str]) -> List[List[float]]:
+            async with semaphore:
+                return (await self._limited_embed(embedder, batch, **kwargs))["embeddings"]
+        
+        batches = await asyncio.gather(*(
+            run(unique[start:start + batch_size]) for start in range(0, len(unique), batch_size)
+        ))
+        vectors = np.asarray([vector for batch in batches for vector in batch], dtype=np.float32)
+        if len(unique) == len(texts):
+            return vectors
+        rows = {text: row for row, text in enumerate(unique)}
+        return vectors[[rows[text] for text in texts]]
+    
+    async def run_tools(
+        self, 
+        messages: List[Dict[str, Any]], 
+        tools: Any, 
+        executor: tool_calling.ToolExecutor, 
+        max_rounds: Optional[int] = None, 
+        early_dispatch: bool = False, 
+        **kwargs
+    ) -> Dict[str, Any]:
+        """原生工具调用循环
+        
+        tools可直接传入MCPServer.get_tools_schema()；executor为 async (name, arguments) -> result，
+        例如 MCPClient.call_tool。一次响应中的多个工具调用并发执行，结果回填后继续对话，
+        直到模型不再调用工具或达到max_rounds(此时返回的响应中tool_calls未执行)。
+        返回最后一次响应，附带完整对话messages和已执行的轮数tool_rounds。
+        early_dispatch=True时使用流式接口，见stream_tools。
+        """
+        if early_dispatch:
+            async for event in self.stream_tools(messages, tools, executor, max_rounds, **kwargs):
+                if event["type"] == "done":
+                    return {key: value for key, value in event.items() if key != "type"}
+        max_rounds = max_rounds or get_settings().llm_max_tool_rounds
+        messages = list(messages)
+        rounds = 0
+        while True:
+            response = await self.chat_completion(messages, tools=tools, **kwargs)
+            if not response.get("tool_calls") or rounds >= max_rounds:
+                break
+            messages.append(tool_calling.assistant_message(response))
+            messages.extend(await tool_calling.execute_tool_calls(response["tool_calls"], executor))
+            rounds += 1
+        return {**response, "messages": messages, "tool_rounds": rounds}
+    
+    async def stream_tools(
+        self, 
+        messages: List[Dict[str, Any]], 
+        tools: Any, 
+        executor: tool_calling.ToolExecutor, 
+        max_rounds: Optional[int] = None, 
+        **kwargs
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """流式工具调用循环，工具参数一闭合就调度执行，工具耗时与模型后续生成重叠
+        
+        产出text/usage事件，以及:
+        - {"type": "tool_call", "tool_call": {...}} 工具调用参数完整并已开始执行
+        - {"type": "tool_result", "message": tool消息} 工具执行完成
+        - {"type": "max_rounds", "tool_calls", "tool_rounds"} 已达到max_rounds，模型本轮请求的工具
+          不会执行，也不会为它们产出tool_call事件；之后紧跟done
+        - {"type": "done", "content", "tool_calls", "messages", "tool_rounds"} 循环结束
+        """
+        max_rounds = max_rounds or get_settings().llm_max_tool_rounds
+        messages = list(messages)
+        rounds = 0
+        while True:
+            dispatch = rounds < max_rounds
+            assembler = tool_calling.ToolCallAssembler()
+            tasks: Dict[str, asyncio.Task] = {}
+            text: List[str] = []
+            
+            def start(call: Dict[str, Any]) -> Dict[str, Any]:
+                tasks[call["id"]] = asyncio.ensure_future(tool_calling.run_tool_call(call, executor))
+                return {"type": "tool_call", "tool_call": call}
+            
+            try:
+                async for delta in self.stream_chat_completion(messages, tools=tools, **kwargs):
+                    if delta["type"] in ("tool_call_delta", "tool_call_end"):
+                        # 达到max_rounds后仍要组装参数，但不再执行，也不报告tool_call
+                        for call in assembler.feed(delta):
+                            if dispatch:
+                                yield start(call)
+                    elif delta["type"] in ("text", "usage"):
+                        if delta["type"] == "text":
+                            text.append(delta["content"])
+                        yield delta
+                for call in assembler.flush():
+                    if dispatch:
+                        yield start(call)
+                
+                tool_calls = assembler.calls()
+                if not tool_calls:
+                    break
+                if not dispatch:
+                    yield {"type": "max_rounds", "tool_calls": tool_calls, "tool_rounds": rounds}
+                    break
+                results: Dict[str, Dict[str, Any]] = {}
+                for finished in asyncio.as_completed(list(tasks.values())):
+                    message = await finished
+                    results[message["tool_call_id"]] = message
+                    yield {"type": "tool_result", "message": message}
+            finally:
+                # 调用方提前退出或流出错时取消仍在执行的工具
+                for task in tasks.values():
+                    task.cancel()
+            
+            messages.append({"role": "assistant", "content": "".join(text) or None, "tool_calls": tool_calls})
+            messages.extend(results[call["id"]] for call in tool_calls)
+            rounds += 1
+        
+        yield {
+            "type": "done",
+            "content": "".join(text),
+            "tool_calls": tool_calls,
+            "messages": messages,
+            "tool_rounds": rounds
+        }
     
     async def text_completion(self, prompt: str, **kwargs) -> str:
         """文本完成"""
         return await self.client.text_completion(prompt, **kwargs)
     
+    async def warmup(self, connections: int = 1) -> int:
+        """预热到当前提供商的连接，避免首个请求承担握手延迟"""
+        return await self.client.warmup(connections)
+    
     def switch_provider(self, provider: str):
         """切换LLM提供商"""
         self.provider = provider.lower()
@@ -0,0 +1,350 @@
+"""
+指标模块
+进程内的计数器/仪表/直方图注册表，支持Prometheus文本格式导出和程序化快照
+"""
+import bisect
+import threading
+from typing import Dict, List, Optional, Any, Tuple, Sequence
+
+# 延迟类直方图的默认分桶(秒)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# 吞吐类直方图的默认分桶(token/秒)
+THROUGHPUT_BUCKETS = (1, 5, 10, 25, 50, 100, 200, 400, 800, 1600)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Child:
+    """单组标签值对应的时间序列"""
+
+    __slots__ = ("_family", "_key")
+
+    def __init__(self, family: "_Family", key: Tuple[str, ...]):
+        self._family = family
+        self._key = key
+
+    def inc(self, amount: float = 1.0):
+        self._family.inc(self._key, amount)
+
+    def observe(self, value: float):
+        self._family.observe(self._key, value)
+
+    def set(self, value: float):
+        self._family.set(self._key, value)
+
+
+class _Family:
+    """同名指标的所有时间序列"""
+
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Metric {self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def labels(self, **labels) -> _Child:
+        """绑定标签值，热路径上可缓存返回的对象"""
+        return _Child(self, self._key(labels))
+
+
+class Counter(_Family):
+    """单调递增计数器"""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, key: Tuple[str, ...] = (), amount: float = 1.0):
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def collect(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            items = list(self._values.items())
+        return [{"labels": dict(zip(self.labelnames, key)), "value": value} for key, value in items]
+
+    def expose(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Family):
+    """可增可减的瞬时值，如队列深度"""
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, key: Tuple[str, ...] = (), value: float = 0.0):
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, key: Tuple[str, ...] = (), amount: float = 1.0):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def collect(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            items = list(self._values.items())
+        return [{"labels": dict(zip(self.labelnames, key)), "value": value} for key, value in items]
+
+    def expose(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Family):
+    """固定分桶直方图"""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签: [各分桶计数..., +Inf计数, 总和]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, key: Tuple[str, ...], value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def _cumulative(self, series: List[float]) -> Tuple[List[float], float, float]:
+        counts = []
+        total = 0.0
+        for count in series[:-1]:
+            total += count
+            counts.append(total)
+        return counts, total, series[-1]
+
+    def _quantile(self, counts: List[float], total: float, q: float) -> Optional[float]:
+        """按分桶线性插值估计分位数"""
+        if total == 0:
+            return None
+        rank = q * total
+        index = bisect.bisect_left(counts, rank)
+        if index >= len(self.buckets):
+            return self.buckets[-1] if self.buckets else None
+        lower = self.buckets[index - 1] if index > 0 else 0.0
+        below = counts[index - 1] if index > 0 else 0.0
+        in_bucket = counts[index] - below
+        if in_bucket <= 0:
+            return self.buckets[index]
+        return lower + (self.buckets[index] - lower) * (rank - below) / in_bucket
+
+    def collect(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._values.items()]
+        samples = []
+        for key, series in items:
+            counts, total, value_sum = self._cumulative(series)
+            samples.append({
+                "labels": dict(zip(self.labelnames, key)),
+                "count": total,
+                "sum": value_sum,
+                "mean": value_sum / total if total else None,
+                "p50": self._quantile(counts, total, 0.50),
+                "p95": self._quantile(counts, total, 0.95),
+                "p99": self._quantile(counts, total, 0.99)
+            })
+        return samples
+
+    def expose(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._values.items()]
+        lines = []
+        bounds = self.buckets + (float("inf"),)
+        for key, series in items:
+            counts, total, value_sum = self._cumulative(series)
+            for bound, count in zip(bounds, counts):
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {_format_value(count)}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(value_sum)}")
+            lines.append(f"{self.name}_count{labels} {_format_value(total)}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表，同名指标重复注册时返回已有实例"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Family] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} already registered as {metric.type}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """获取所有指标的当前值"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {
+            metric.name: {"type": metric.type, "help": metric.documentation, "samples": metric.collect()}
+            for metric in metrics
+        }
+
+    def render_prometheus(self) -> str:
+        """导出Prometheus文本格式"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    """获取进程内共享的指标注册表"""
+    return _registry
+
+
+# ==================== LLM与工具调用指标 ====================
+
+LLM_LABELS = ("provider", "model")
+
+llm_requests = _registry.counter("llm_requests_total", "LLM requests sent upstream", LLM_LABELS + ("stream",))
+llm_errors = _registry.counter("llm_errors_total", "LLM request errors by exception type", LLM_LABELS + ("error_type",))
+llm_latency = _registry.histogram("llm_request_duration_seconds", "LLM request latency", LLM_LABELS + ("stream",))
+llm_ttft = _registry.histogram("llm_time_to_first_token_seconds", "Streaming time to first token", LLM_LABELS)
+llm_tokens = _registry.counter("llm_tokens_total", "LLM tokens by direction (input/output/cache_read/cache_write)", LLM_LABELS + ("direction",))
+llm_tokens_per_second = _registry.histogram(
+    "llm_output_tokens_per_second", "LLM output tokens per second of request latency", LLM_LABELS,
+    buckets=THROUGHPUT_BUCKETS
+)
+llm_cache_requests = _registry.counter("llm_cache_requests_total", "Response cache lookups by result (hit/miss/bypass)", ("provider", "result"))
+
+tool_calls = _registry.counter("mcp_tool_calls_total", "MCP tool calls by status", ("tool", "status"))
+tool_latency = _registry.histogram("mcp_tool_duration_seconds", "MCP tool call latency", ("tool",))
+tool_pool_inflight = _registry.gauge("mcp_tool_pool_inflight", "Tool calls submitted to an execution pool and not finished", ("pool",))
+tool_pool_queue_depth = _registry.gauge("mcp_tool_pool_queue_depth", "Tool calls waiting for a free pool worker", ("pool",))
+tool_cache_requests = _registry.counter("mcp_tool_cache_requests_total", "Tool result cache lookups by result (hit/miss)", ("tool", "result"))
+
+
+def record_llm_usage(provider: str, model: str, usage: Optional[Dict[str, Any]], latency: float):
+    """记录一次LLM调用的token用量和吞吐"""
+    if not usage:
+        return
+    prompt = int(usage.get("prompt_tokens") or usage.get("input_tokens") or 0)
+    completion = int(usage.get("completion_tokens") or usage.get("output_tokens") or 0)
+    for direction, count in (
+        ("input", prompt),
+        ("output", completion),
+        ("cache_read", int(usage.get("cache_read_tokens") or 0)),
+        ("cache_write", int(usage.get("cache_write_tokens") or 0))
+    ):
+        if count:
+            llm_tokens.inc((provider, model, direction), count)
+    if completion and latency > 0:
+        llm_tokens_per_second.observe((provider, model), completion / latency)
+
+
+def record_tool_call(tool: str, success: bool, latency: float, status: Optional[str] = None):
+    """记录一次工具调用，status可以细分失败原因(timeout/rejected)"""
+    tool_calls.inc((tool, status or ("success" if success else "error")))
+    tool_latency.observe((tool,), latency)
+
+
+# ==================== HTTP导出 ====================
+
+_server = None
+
+
+def start_metrics_server(port: Optional[int] = None, host: Optional[str] = None):
+    """在后台线程中启动 /metrics HTTP端点，重复调用返回同一个服务器"""
+    global _server
+    if _server is not None:
+        return _server
+
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from config.settings import get_settings
+
+    settings = get_settings()
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = _registry.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    _server = ThreadingHTTPServer(
+        (host or settings.metrics_host, settings.metrics_port if port is None else port),
+        MetricsHandler
+    )
+    threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+    return _server
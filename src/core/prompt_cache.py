@@ -0,0 +1,91 @@
+"""
+提示词前缀缓存模块
+为Anthropic标记cache_control断点，为OpenAI兼容接口保持消息字节稳定，并统一缓存命中的usage字段
+"""
+from typing import Dict, List, Optional, Any, Tuple
+
+# 缓存模式：off 不标记；prefix 标记tools和system前缀；conversation 额外标记最后一条消息
+EPHEMERAL = {"type": "ephemeral"}
+
+# OpenAI兼容接口按请求体字节匹配前缀，统一消息内字段顺序
+_MESSAGE_KEY_ORDER = ("role", "name", "content", "tool_calls", "tool_call_id")
+
+
+def _text_blocks(content: Any) -> List[Dict[str, Any]]:
+    """把字符串content转换为content block列表"""
+    if isinstance(content, list):
+        return [dict(block) for block in content]
+    return [{"type": "text", "text": content or ""}]
+
+
+def _mark_last_block(blocks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    if blocks:
+        blocks[-1] = {**blocks[-1], "cache_control": EPHEMERAL}
+    return blocks
+
+
+def build_anthropic_system(system_messages: List[str], mode: str) -> Any:
+    """合并所有system消息；启用缓存时在system末尾设置断点"""
+    if mode == "off":
+        return "\n\n".join(system_messages)
+    blocks = [{"type": "text", "text": text} for text in system_messages if text]
+    return _mark_last_block(blocks)
+
+
+def mark_anthropic_tools(tools: Optional[List[Dict[str, Any]]], mode: str) -> Optional[List[Dict[str, Any]]]:
+    """在最后一个工具定义上设置断点(tools位于缓存前缀的最前面)"""
+    if not tools or mode == "off":
+        return tools
+    marked = [dict(tool) for tool in tools]
+    marked[-1]["cache_control"] = EPHEMERAL
+    return marked
+
+
+def mark_anthropic_messages(messages: List[Dict[str, Any]], mode: str) -> List[Dict[str, Any]]:
+    """conversation模式下在最后一条消息上设置断点，下一轮对话可读取整段历史"""
+    if mode != "conversation" or not messages:
+        return messages
+    marked = list(messages)
+    last = marked[-1]
+    marked[-1] = {**last, "content": _mark_last_block(_text_blocks(last["content"]))}
+    return marked
+
+
+def stable_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """按固定字段顺序重建消息，保证相同内容序列化出相同字节"""
+    stable = []
+    for msg in messages:
+        ordered = {key: msg[key] for key in _MESSAGE_KEY_ORDER if key in msg}
+        ordered.update((key, value) for key, value in msg.items() if key not in ordered)
+        stable.append(ordered)
+    return stable
+
+
+def mark_openrouter_messages(messages: List[Dict[str, Any]], model: str, mode: str) -> List[Dict[str, Any]]:
+    """OpenRouter上的Anthropic模型需要在content block中显式设置cache_control"""
+    if mode == "off" or not model.startswith("anthropic/"):
+        return messages
+    marked = list(messages)
+    last_system = max((i for i, msg in enumerate(marked) if msg.get("role") == "system"), default=None)
+    if last_system is not None:
+        msg = marked[last_system]
+        marked[last_system] = {**msg, "content": _mark_last_block(_text_blocks(msg["content"]))}
+    return mark_anthropic_messages(marked, mode)
+
+
+def cache_usage_openai(usage: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """在OpenAI格式usage中补充统一的缓存读写token字段"""
+    if not usage:
+        return usage
+    details = usage.get("prompt_tokens_details") or {}
+    usage["cache_read_tokens"] = int(details.get("cached_tokens") or 0)
+    usage["cache_write_tokens"] = int(usage.get("cache_write_tokens") or 0)
+    return usage
+
+
+def cache_usage_anthropic(usage: Any) -> Tuple[int, int]:
+    """从Anthropic usage对象中取出(缓存读取, 缓存写入)token数"""
+    return (
+        int(getattr(usage, "cache_read_input_tokens", 0) or 0),
+        int(getattr(usage, "cache_creation_input_tokens", 0) or 0)
+    )
@@ -0,0 +1,288 @@
+"""
+提供商限流模块
+令牌桶(RPM/TPM) + AIMD自适应并发控制，按提供商共享
+"""
+import asyncio
+import re
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Dict, Optional, Any, Mapping, AsyncIterator, Deque
+from config.settings import get_settings
+
+
+_DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_reset_seconds(value: Optional[str]) -> Optional[float]:
+    """解析限流响应头中的重置时间，返回距离现在的秒数
+
+    支持纯数字秒数、OpenAI的"6m0s"/"20ms"格式以及Anthropic的RFC 3339时间戳。
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    matches = _DURATION_PATTERN.findall(value)
+    if matches and "".join(num + unit for num, unit in matches) == value:
+        return sum(float(num) * _DURATION_UNITS[unit] for num, unit in matches)
+
+    try:
+        reset_at = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if reset_at.tzinfo is None:
+        reset_at = reset_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (reset_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def _header_int(headers: Mapping[str, str], *names: str) -> Optional[int]:
+    """按顺序读取第一个存在的整数响应头"""
+    for name in names:
+        value = headers.get(name)
+        if value is not None:
+            try:
+                return int(float(value))
+            except ValueError:
+                continue
+    return None
+
+
+class TokenBucket:
+    """按分钟配额匀速补充的令牌桶，rate_per_minute <= 0 表示不限制"""
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self.tokens = float(rate_per_minute)
+        self._updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.capacity <= 0
+
+    def set_capacity(self, rate_per_minute: float):
+        """根据响应头中的配额调整容量；从不限制切换为限制时桶按满额开始(再由剩余额度校准)"""
+        was_unlimited = self.unlimited
+        self._refill()
+        self.capacity = float(rate_per_minute)
+        self.tokens = self.capacity if was_unlimited else min(self.tokens, self.capacity)
+
+    def _refill(self):
+        now = time.monotonic()
+        if not self.unlimited:
+            self.tokens = min(
+                self.capacity,
+                self.tokens + (now - self._updated) * self.capacity / 60.0
+            )
+        self._updated = now
+
+    def delay_for(self, amount: float) -> float:
+        """返回获取amount个令牌还需等待的秒数，0表示可立即获取"""
+        if self.unlimited:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) * 60.0 / self.capacity
+
+    def consume(self, amount: float):
+        """扣除令牌，允许透支(用于按实际用量补扣)"""
+        if self.unlimited:
+            return
+        self._refill()
+        self.tokens -= amount
+
+    def sync_remaining(self, remaining: float):
+        """用提供商返回的剩余额度校准本地估计"""
+        if self.unlimited:
+            return
+        self._refill()
+        self.tokens = min(self.tokens, float(remaining))
+
+
+class AdaptiveRateLimiter:
+    """单个提供商的自适应限流器
+
+    - RPM/TPM两个令牌桶控制速率，配额可由响应头动态校准
+    - 并发上限按AIMD调整：成功时加性增长，遇到429时乘性减半
+    - 超出配额的调用方排队等待，而不是直接失败
+    """
+
+    def __init__(
+        self,
+        provider: str,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_concurrency: Optional[int] = None,
+        min_concurrency: int = 1,
+        increase_step: float = 1.0,
+        decrease_factor: float = 0.5
+    ):
+        settings = get_settings()
+        self.provider = provider
+        self.requests = TokenBucket(
+            settings.llm_rate_limit_rpm if requests_per_minute is None else requests_per_minute
+        )
+        self.tokens = TokenBucket(
+            settings.llm_rate_limit_tpm if tokens_per_minute is None else tokens_per_minute
+        )
+        self.max_concurrency = max_concurrency or settings.llm_max_concurrency
+        self.min_concurrency = min_concurrency
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.concurrency_limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.rate_limited_count = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    def _has_capacity(self) -> bool:
+        return self.in_flight < max(self.min_concurrency, int(self.concurrency_limit))
+
+    async def _acquire_concurrency(self):
+        """等待并发槽位，按FIFO顺序唤醒"""
+        while not self._has_capacity():
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # 已被唤醒却被取消时，把名额让给下一个等待者
+                if waiter.done() and not waiter.cancelled():
+                    self._wake_waiters()
+                raise
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        self.in_flight += 1
+
+    def _release_concurrency(self):
+        self.in_flight -= 1
+        self._wake_waiters()
+
+    def _wake_waiters(self):
+        # 槽位数可能因AIMD增长而一次增加多个
+        available = max(self.min_concurrency, int(self.concurrency_limit)) - self.in_flight
+        for waiter in list(self._waiters)[:max(0, available)]:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def _acquire_rate(self, estimated_tokens: float):
+        """等待RPM/TPM令牌以及提供商要求的冷却时间"""
+        while True:
+            delay = max(
+                self.blocked_until - time.monotonic(),
+                self.requests.delay_for(1),
+                self.tokens.delay_for(estimated_tokens)
+            )
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+        self.requests.consume(1)
+        self.tokens.consume(estimated_tokens)
+
+    @asynccontextmanager
+    async def slot(self, estimated_tokens: float = 0) -> AsyncIterator[None]:
+        """获取一个请求槽位，退出时释放并发占用"""
+        await self._acquire_concurrency()
+        try:
+            await self._acquire_rate(estimated_tokens)
+            yield
+        finally:
+            self._release_concurrency()
+
+    def on_success(self, token_correction: float = 0):
+        """请求成功：加性增加并发上限，并按实际token用量修正TPM"""
+        if token_correction:
+            self.tokens.consume(token_correction)
+        self.concurrency_limit = min(
+            float(self.max_concurrency),
+            self.concurrency_limit + self.increase_step / max(self.concurrency_limit, 1.0)
+        )
+        self._wake_waiters()
+
+    def on_rate_limited(self, retry_after: Optional[float] = None, attempt: int = 0,
+                        headers: Optional[Mapping[str, str]] = None):
+        """收到429：乘性降低并发上限，并在retry_after内暂停发送；429响应的限流头同样用于校准配额"""
+        self.update_from_headers(headers)
+        self.rate_limited_count += 1
+        self.concurrency_limit = max(
+            float(self.min_concurrency),
+            self.concurrency_limit * self.decrease_factor
+        )
+        if retry_after is None:
+            retry_after = min(60.0, 2.0 ** attempt)
+        self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+    def update_from_headers(self, headers: Optional[Mapping[str, str]]):
+        """根据OpenAI/OpenRouter/Anthropic的限流响应头校准配额"""
+        if not headers:
+            return
+
+        limit_requests = _header_int(
+            headers, "x-ratelimit-limit-requests", "anthropic-ratelimit-requests-limit"
+        )
+        limit_tokens = _header_int(
+            headers, "x-ratelimit-limit-tokens", "anthropic-ratelimit-tokens-limit"
+        )
+        if limit_requests:
+            self.requests.set_capacity(limit_requests)
+        if limit_tokens:
+            self.tokens.set_capacity(limit_tokens)
+
+        remaining_requests = _header_int(
+            headers, "x-ratelimit-remaining-requests", "anthropic-ratelimit-requests-remaining"
+        )
+        remaining_tokens = _header_int(
+            headers, "x-ratelimit-remaining-tokens", "anthropic-ratelimit-tokens-remaining"
+        )
+        if remaining_requests is not None:
+            self.requests.sync_remaining(remaining_requests)
+        if remaining_tokens is not None:
+            self.tokens.sync_remaining(remaining_tokens)
+
+        # 额度耗尽时等到重置时间再发送
+        if remaining_requests == 0:
+            reset = parse_reset_seconds(
+                headers.get("x-ratelimit-reset-requests")
+                or headers.get("anthropic-ratelimit-requests-reset")
+            )
+            if reset:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + reset)
+
+    def stats(self) -> Dict[str, Any]:
+        """获取限流器状态"""
+        return {
+            "provider": self.provider,
+            "concurrency_limit": self.concurrency_limit,
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "requests_available": self.requests.tokens,
+            "tokens_available": self.tokens.tokens,
+            "rate_limited_count": self.rate_limited_count
+        }
+
+
+_rate_limiters: Dict[str, AdaptiveRateLimiter] = {}
+
+
+def get_rate_limiter(provider: str) -> AdaptiveRateLimiter:
+    """获取进程内共享的提供商限流器
+
+    LLM_RATE_LIMIT_BACKEND=redis时配额保存在Redis中，由所有worker进程共享。
+    """
+    provider = provider.lower()
+    if provider not in _rate_limiters:
+        if get_settings().llm_rate_limit_backend == "redis":
+            from .redis_backend import RedisRateLimiter
+            _rate_limiters[provider] = RedisRateLimiter(provider)
+        else:
+            _rate_limiters[provider] = AdaptiveRateLimiter(provider)
+    return _rate_limiters[provider]
@@ -0,0 +1,227 @@
+"""
+Redis后端模块
+多个worker进程共享的LLM响应缓存和提供商限流配额
+"""
+import asyncio
+import json
+from typing import Dict, List, Optional, Any, Mapping, Set
+from config.settings import get_settings
+from .rate_limiter import AdaptiveRateLimiter, _header_int
+
+_clients: Dict[str, Any] = {}
+
+
+def get_redis(url: Optional[str] = None):
+    """获取进程内共享的Redis异步客户端，redis包在首次调用时才导入"""
+    url = url or get_settings().redis_url
+    client = _clients.get(url)
+    if client is None:
+        import redis.asyncio as redis
+        client = _clients[url] = redis.from_url(url)
+    return client
+
+
+async def close_redis_clients():
+    """关闭所有共享的Redis客户端"""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
+
+
+def _key_prefix() -> str:
+    return get_settings().redis_key_prefix
+
+
+class RedisCache:
+    """基于Redis的响应缓存，值以JSON保存，过期由Redis负责"""
+
+    def __init__(self, client=None, prefix: Optional[str] = None, ttl: Optional[float] = 3600):
+        self.client = client or get_redis()
+        self.prefix = prefix or f"{_key_prefix()}cache:"
+        self.ttl = ttl
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    async def get(self, key: str) -> Optional[Any]:
+        raw = await self.client.get(self._key(key))
+        return json.loads(raw) if raw is not None else None
+
+    async def get_many(self, keys: List[str]) -> List[Optional[Any]]:
+        """一次往返读取多个键"""
+        if not keys:
+            return []
+        raws = await self.client.mget([self._key(key) for key in keys])
+        return [json.loads(raw) if raw is not None else None for raw in raws]
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        await self.client.set(
+            self._key(key),
+            json.dumps(value, ensure_ascii=False, default=str),
+            px=int(ttl * 1000) if ttl else None
+        )
+
+    async def set_many(self, items: Mapping[str, Any], ttl: Optional[float] = None):
+        """流水线批量写入"""
+        ttl = self.ttl if ttl is None else ttl
+        async with self.client.pipeline(transaction=False) as pipe:
+            for key, value in items.items():
+                pipe.set(
+                    self._key(key),
+                    json.dumps(value, ensure_ascii=False, default=str),
+                    px=int(ttl * 1000) if ttl else None
+                )
+            await pipe.execute()
+
+    async def delete(self, key: str):
+        await self.client.delete(self._key(key))
+
+    async def clear(self):
+        """删除本前缀下的所有缓存条目"""
+        keys = [key async for key in self.client.scan_iter(match=f"{self.prefix}*", count=500)]
+        for start in range(0, len(keys), 500):
+            await self.client.delete(*keys[start:start + 500])
+
+
+# 原子地检查并扣除RPM/TPM两个令牌桶，任一不足时都不扣除并返回需要等待的秒数。
+# 时间取Redis服务器时钟，避免各worker时钟偏差；容量<=0表示不限制。
+# KEYS: 请求桶, token桶, 冷却标记   ARGV: RPM容量, TPM容量, 本次token数
+_ACQUIRE_SCRIPT = """
+local blocked = redis.call('PTTL', KEYS[3])
+if blocked > 0 then
+  return tostring(blocked / 1000)
+end
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local amounts = {1, tonumber(ARGV[3])}
+local levels = {}
+local wait = 0
+for i = 1, 2 do
+  local capacity = tonumber(ARGV[i])
+  if capacity > 0 then
+    local state = redis.call('HMGET', KEYS[i], 'tokens', 'updated')
+    local tokens = tonumber(state[1]) or capacity
+    local updated = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - updated) * capacity / 60)
+    local need = math.min(amounts[i], capacity)
+    if tokens < need then
+      wait = math.max(wait, (need - tokens) * 60 / capacity)
+    end
+    levels[i] = tokens
+  end
+end
+if wait > 0 then
+  return tostring(wait)
+end
+for i = 1, 2 do
+  if levels[i] ~= nil then
+    redis.call('HSET', KEYS[i], 'tokens', tostring(levels[i] - amounts[i]), 'updated', tostring(now))
+    redis.call('EXPIRE', KEYS[i], 120)
+  end
+end
+return '0'
+"""
+
+# 调整单个令牌桶：mode为consume时直接扣除(允许透支)，为sync时与提供商返回的剩余额度取较小值
+# KEYS: 令牌桶   ARGV: 容量, 数值, mode
+_ADJUST_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+if capacity <= 0 then
+  return '0'
+end
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * capacity / 60)
+if ARGV[3] == 'consume' then
+  tokens = tokens - tonumber(ARGV[2])
+else
+  tokens = math.min(tokens, tonumber(ARGV[2]))
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], 120)
+return tostring(tokens)
+"""
+
+
+class RedisRateLimiter(AdaptiveRateLimiter):
+    """配额保存在Redis中的限流器
+
+    RPM/TPM令牌桶和429冷却在所有worker间共享，由Lua脚本原子地检查和扣除；
+    AIMD并发控制仍按进程进行。
+    """
+
+    def __init__(self, provider: str, client=None, **kwargs):
+        super().__init__(provider, **kwargs)
+        self.client = client or get_redis()
+        prefix = f"{_key_prefix()}ratelimit:{provider}:"
+        self.requests_key = prefix + "requests"
+        self.tokens_key = prefix + "tokens"
+        self.blocked_key = prefix + "blocked"
+        self._acquire = self.client.register_script(_ACQUIRE_SCRIPT)
+        self._adjust = self.client.register_script(_ADJUST_SCRIPT)
+        self._background: Set[asyncio.Task] = set()
+
+    def _spawn(self, coro):
+        """同步回调中发起的Redis写操作在后台完成"""
+        try:
+            task = asyncio.get_running_loop().create_task(coro)
+        except RuntimeError:
+            coro.close()
+            return
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _acquire_rate(self, estimated_tokens: float):
+        while True:
+            delay = float(await self._acquire(
+                keys=[self.requests_key, self.tokens_key, self.blocked_key],
+                args=[self.requests.capacity, self.tokens.capacity, estimated_tokens]
+            ))
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    def on_success(self, token_correction: float = 0):
+        super().on_success()
+        if token_correction:
+            self._spawn(self._adjust(
+                keys=[self.tokens_key], args=[self.tokens.capacity, token_correction, "consume"]
+            ))
+
+    def on_rate_limited(self, retry_after: Optional[float] = None, attempt: int = 0,
+                        headers: Optional[Mapping[str, str]] = None):
+        super().on_rate_limited(retry_after, attempt, headers)
+        cooldown = retry_after if retry_after is not None else min(60.0, 2.0 ** attempt)
+        # 一个worker收到429后，其他worker也暂停发送
+        self._spawn(self.client.set(self.blocked_key, "1", px=max(1, int(cooldown * 1000))))
+
+    def update_from_headers(self, headers: Optional[Mapping[str, str]]):
+        super().update_from_headers(headers)
+        if not headers:
+            return
+        for key, bucket, names in (
+            (self.requests_key, self.requests, ("x-ratelimit-remaining-requests", "anthropic-ratelimit-requests-remaining")),
+            (self.tokens_key, self.tokens, ("x-ratelimit-remaining-tokens", "anthropic-ratelimit-tokens-remaining"))
+        ):
+            remaining = _header_int(headers, *names)
+            if remaining is not None:
+                self._spawn(self._adjust(keys=[key], args=[bucket.capacity, remaining, "sync"]))
+
+    async def shared_stats(self) -> Dict[str, Any]:
+        """读取Redis中的共享配额状态"""
+        requests, tokens = await asyncio.gather(
+            self.client.hget(self.requests_key, "tokens"),
+            self.client.hget(self.tokens_key, "tokens")
+        )
+        blocked = await self.client.pttl(self.blocked_key)
+        return {
+            **self.stats(),
+            "shared_requests_available": float(requests) if requests is not None else None,
+            "shared_tokens_available": float(tokens) if tokens is not None else None,
+            "shared_blocked_for": max(0, blocked) / 1000
+        }
@@ -0,0 +1,319 @@
+"""
+多提供商路由模块
+按滚动延迟选择提供商，慢请求对冲(hedging)到第二提供商，不健康的提供商熔断
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Dict, List, Optional, Any, AsyncIterator, Deque
+from config.settings import get_settings
+from .llm_client import BaseLLMClient, LLMClient
+
+
+class LatencyTracker:
+    """滚动窗口内的延迟与错误率统计"""
+
+    def __init__(self, window: int = 100):
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+
+    def record_success(self, latency: float):
+        self.latencies.append(latency)
+        self.outcomes.append(True)
+
+    def record_outcome(self, success: bool):
+        """只记录成败，不记录延迟"""
+        self.outcomes.append(success)
+
+    def record_failure(self):
+        self.record_outcome(False)
+
+    def record_censored(self, elapsed: float):
+        """记录被取消请求的已耗时，作为延迟下界避免慢提供商一直被当作未探测"""
+        self.latencies.append(elapsed)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """返回延迟的q分位数，没有样本时返回None"""
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+        return ordered[index]
+
+    @property
+    def p50(self) -> Optional[float]:
+        return self.percentile(0.5)
+
+    @property
+    def p95(self) -> Optional[float]:
+        return self.percentile(0.95)
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+
+class CircuitBreaker:
+    """熔断器：closed -> open -> half_open -> closed"""
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+
+    def allow_request(self) -> bool:
+        """判断是否允许发送请求，open状态超时后放行一个试探请求"""
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.recovery_timeout:
+            self.state = "half_open"
+            self.trial_in_flight = False
+        if self.state == "closed":
+            return True
+        if self.state == "half_open" and not self.trial_in_flight:
+            return True
+        return False
+
+    def on_request(self):
+        if self.state == "half_open":
+            self.trial_in_flight = True
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.state = "closed"
+        self.trial_in_flight = False
+
+    def record_failure(self, error_rate: float = 0.0, error_rate_threshold: float = 1.0):
+        self.consecutive_failures += 1
+        if (self.state == "half_open"
+                or self.consecutive_failures >= self.failure_threshold
+                or error_rate >= error_rate_threshold):
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.trial_in_flight = False
+
+    def release(self):
+        """试探请求被取消时释放half_open名额"""
+        self.trial_in_flight = False
+
+
+class RouterClient(BaseLLMClient):
+    """同时持有多个提供商的路由客户端
+
+    - 优先选择滚动p50延迟最低的健康提供商
+    - 首选请求超过其p95仍未返回时，向第二提供商发送对冲请求，先返回者胜出，另一个被取消
+    - 连续失败或错误率过高的提供商被熔断，冷却后放行试探请求
+    """
+
+    # 各提供商的LLMClient已记录token用量，外层不再重复计入
+    records_usage = False
+
+    def __init__(
+        self,
+        providers: Optional[List[str]] = None,
+        rate_limit: bool = False,
+        hedge: bool = True
+    ):
+        self.settings = get_settings()
+        names = providers or [
+            name.strip() for name in self.settings.llm_router_providers.split(",") if name.strip()
+        ]
+        self.clients: Dict[str, LLMClient] = {}
+        for name in names:
+            try:
+                self.clients[name] = LLMClient(provider=name, rate_limit=rate_limit)
+            except ValueError:
+                # 未配置API密钥的提供商不参与路由
+                continue
+
+        if not self.clients:
+            raise ValueError("Router requires at least one configured LLM provider")
+
+        self.model = None
+        self.hedge = hedge
+        # 完整请求的延迟(路由和对冲延迟)与错误率
+        self.trackers = {name: LatencyTracker(self.settings.llm_router_window) for name in self.clients}
+        # 流式请求的首个增量延迟(TTFT)，只用于流式路由，不影响完整请求的对冲延迟
+        self.ttft_trackers = {name: LatencyTracker(self.settings.llm_router_window) for name in self.clients}
+        self.breakers = {
+            name: CircuitBreaker(
+                failure_threshold=self.settings.llm_breaker_failure_threshold,
+                recovery_timeout=self.settings.llm_breaker_recovery_timeout
+            )
+            for name in self.clients
+        }
+        self.hedged_requests = 0
+        self.hedge_wins = 0
+
+    def enable_rate_limit(self, provider: str):
+        """为每个子提供商启用各自的限流器"""
+        for name, client in self.clients.items():
+            client.rate_limit = True
+            client.client.enable_rate_limit(name)
+
+    def _candidates(self, trackers: Optional[Dict[str, LatencyTracker]] = None) -> List[str]:
+        """按p50延迟排序的可用提供商，无样本的提供商优先被探测"""
+        trackers = trackers or self.trackers
+        available = [name for name in self.clients if self.breakers[name].allow_request()]
+        return sorted(available, key=lambda name: trackers[name].p50 or 0.0)
+
+    def _hedge_delay(self, provider: str) -> float:
+        tracker = self.trackers[provider]
+        if len(tracker.latencies) < self.settings.llm_router_min_samples:
+            return self.settings.llm_hedge_default_delay
+        return max(self.settings.llm_hedge_min_delay, tracker.p95 or 0.0)
+
+    def _record_failure(self, provider: str):
+        """记录一次失败，样本足够时按错误率熔断；流式与非流式调用共用"""
+        tracker = self.trackers[provider]
+        tracker.record_failure()
+        self.breakers[provider].record_failure(
+            tracker.error_rate if len(tracker.outcomes) >= self.settings.llm_router_min_samples else 0.0,
+            self.settings.llm_breaker_error_rate
+        )
+
+    def _record_success(self, provider: str, latency: float):
+        self.trackers[provider].record_success(latency)
+        self.breakers[provider].record_success()
+
+    async def _call(self, provider: str, messages: List[Dict[str, str]], **kwargs) -> Dict[str, Any]:
+        """调用单个提供商并记录延迟、错误与熔断状态"""
+        tracker = self.trackers[provider]
+        breaker = self.breakers[provider]
+        breaker.on_request()
+        start = time.perf_counter()
+        try:
+            response = await self.clients[provider].chat_completion(messages, **kwargs)
+        except asyncio.CancelledError:
+            elapsed = time.perf_counter() - start
+            if elapsed >= self._hedge_delay(provider):
+                tracker.record_censored(elapsed)
+            breaker.release()
+            raise
+        except Exception:
+            self._record_failure(provider)
+            raise
+        self._record_success(provider, time.perf_counter() - start)
+        return response
+
+    async def chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        **kwargs
+    ) -> Dict[str, Any]:
+        """路由聊天完成，返回结果中附带实际服务的provider"""
+        remaining = self._candidates()
+        if not remaining:
+            raise Exception("Router error: no healthy LLM provider available")
+
+        pending: Dict[asyncio.Task, str] = {}
+        last_error: Optional[Exception] = None
+        hedged = False
+
+        def launch() -> float:
+            provider = remaining.pop(0)
+            pending[asyncio.create_task(self._call(provider, messages, **kwargs))] = provider
+            return self._hedge_delay(provider)
+
+        primary = remaining[0]
+        hedge_delay = launch()
+        try:
+            while pending:
+                timeout = hedge_delay if (self.hedge and not hedged and remaining) else None
+                done, _ = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # 首选请求超过p95，向下一个提供商发送对冲请求
+                    hedged = True
+                    self.hedged_requests += 1
+                    launch()
+                    continue
+
+                for task in done:
+                    provider = pending.pop(task)
+                    try:
+                        response = task.result()
+                    except Exception as e:
+                        last_error = e
+                        continue
+                    if hedged and provider != primary:
+                        self.hedge_wins += 1
+                    return {**response, "provider": provider}
+
+                # 有请求失败时立即补发到下一个提供商
+                if remaining:
+                    hedge_delay = launch()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise last_error or Exception("Router error: all LLM providers failed")
+
+    async def stream_chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        **kwargs
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """路由流式聊天完成，按TTFT选择提供商，首个增量到达前失败会切换到下一个提供商"""
+        last_error: Optional[Exception] = None
+        for provider in self._candidates(self.ttft_trackers):
+            breaker = self.breakers[provider]
+            breaker.on_request()
+            start = time.perf_counter()
+            started = False
+            try:
+                async for delta in self.clients[provider].stream_chat_completion(messages, **kwargs):
+                    if not started:
+                        started = True
+                        self.ttft_trackers[provider].record_success(time.perf_counter() - start)
+                        self.trackers[provider].record_outcome(True)
+                        breaker.record_success()
+                    if delta["type"] == "done":
+                        delta = {**delta, "provider": provider}
+                    yield delta
+                return
+            except (asyncio.CancelledError, GeneratorExit):
+                # 调用方取消或提前关闭流：不计为失败，但要释放half_open的试探名额
+                breaker.release()
+                raise
+            except Exception as e:
+                if started:
+                    raise
+                self._record_failure(provider)
+                last_error = e
+        raise last_error or Exception("Router error: no healthy LLM provider available")
+
+    async def text_completion(self, prompt: str, **kwargs) -> str:
+        """路由文本完成"""
+        messages = [{"role": "user", "content": prompt}]
+        response = await self.chat_completion(messages, **kwargs)
+        return response["content"]
+
+    async def warmup(self, connections: int = 1) -> int:
+        """并发预热所有提供商的连接"""
+        results = await asyncio.gather(
+            *(client.warmup(connections) for client in self.clients.values())
+        )
+        return sum(results)
+
+    def stats(self) -> Dict[str, Any]:
+        """获取各提供商的延迟、错误率与熔断状态"""
+        return {
+            "hedged_requests": self.hedged_requests,
+            "hedge_wins": self.hedge_wins,
+            "providers": {
+                name: {
+                    "p50": self.trackers[name].p50,
+                    "p95": self.trackers[name].p95,
+                    "ttft_p50": self.ttft_trackers[name].p50,
+                    "error_rate": self.trackers[name].error_rate,
+                    "samples": len(self.trackers[name].latencies),
+                    "breaker": self.breakers[name].state
+                }
+                for name in self.clients
+            }
+        }
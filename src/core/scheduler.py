@@ -0,0 +1,243 @@
+"""
+请求调度模块
+位于提供商之前的优先级 + 截止时间感知调度器，同一优先级内按租户加权公平排队
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Any, AsyncIterator, Tuple
+from config.settings import get_settings
+from . import metrics
+
+# 优先级类别，数值越小越优先；高优先级有排队请求时，低优先级不会被放行
+PRIORITIES = {"interactive": 0, "default": 1, "batch": 2}
+
+scheduler_wait = metrics.get_metrics_registry().histogram(
+    "llm_scheduler_wait_seconds", "Time spent queued in the request scheduler", ("provider", "priority")
+)
+scheduler_dropped = metrics.get_metrics_registry().counter(
+    "llm_scheduler_dropped_total", "Requests dropped or downgraded by the scheduler", ("provider", "priority", "reason")
+)
+
+
+class DeadlineExceeded(Exception):
+    """请求无法在截止时间前完成"""
+
+
+class _Ticket:
+    """排队中的请求"""
+
+    __slots__ = ("priority", "tenant", "deadline", "future", "cancelled")
+
+    def __init__(self, priority: int, tenant: str, deadline: Optional[float]):
+        self.priority = priority
+        self.tenant = tenant
+        self.deadline = deadline
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.cancelled = False
+
+
+class RequestScheduler:
+    """单个提供商的请求调度器
+
+    - 优先级：interactive > default > batch，并为interactive预留并发名额，
+      batch只能使用剩余容量，交互请求不会排在长批处理请求之后
+    - 加权公平排队：同一优先级内每个租户按 cost / weight 累积虚拟完成时间，最小者先出队
+    - 截止时间：排队超时的请求直接失败；按观测到的每token耗时估计，来不及完成的请求
+      被丢弃(drop)或降低max_tokens(downgrade)；执行中超时会取消底层SDK调用
+    """
+
+    def __init__(
+        self,
+        provider: str,
+        max_concurrency: Optional[int] = None,
+        interactive_reserve: Optional[int] = None,
+        weights: Optional[Dict[str, float]] = None,
+        deadline_policy: Optional[str] = None
+    ):
+        settings = get_settings()
+        self.provider = provider
+        self.max_concurrency = max_concurrency or settings.llm_scheduler_concurrency
+        self.interactive_reserve = (
+            settings.llm_scheduler_interactive_reserve if interactive_reserve is None else interactive_reserve
+        )
+        self.weights: Dict[str, float] = dict(weights or {})
+        self.deadline_policy = deadline_policy or settings.llm_deadline_policy
+        self.running = 0
+        self._queues: Dict[int, List[Tuple[float, int, _Ticket]]] = {level: [] for level in PRIORITIES.values()}
+        self._virtual_time: Dict[int, float] = {level: 0.0 for level in PRIORITIES.values()}
+        self._tenant_finish: Dict[Tuple[int, str], float] = {}
+        self._sequence = itertools.count()
+        # 耗时估计(EWMA)：单次请求延迟和每个输出token的耗时
+        self.latency_ewma: Optional[float] = None
+        self.seconds_per_token: Optional[float] = None
+        self.dropped = 0
+        self.downgraded = 0
+
+    def set_weight(self, tenant: str, weight: float):
+        """设置租户权重，默认1.0"""
+        self.weights[tenant] = weight
+
+    # ==================== 排队 ====================
+
+    def _capacity_for(self, priority: int) -> int:
+        if priority == PRIORITIES["interactive"]:
+            return self.max_concurrency
+        return max(1, self.max_concurrency - self.interactive_reserve)
+
+    def _enqueue(self, ticket: _Ticket, cost: float):
+        key = (ticket.priority, ticket.tenant)
+        start = max(self._virtual_time[ticket.priority], self._tenant_finish.get(key, 0.0))
+        finish = start + max(cost, 1.0) / self.weights.get(ticket.tenant, 1.0)
+        self._tenant_finish[key] = finish
+        heapq.heappush(self._queues[ticket.priority], (finish, next(self._sequence), ticket))
+
+    def _dispatch(self):
+        """按优先级和虚拟完成时间放行请求，直到没有可用容量"""
+        now = time.monotonic()
+        for priority in sorted(self._queues):
+            queue = self._queues[priority]
+            while queue:
+                finish, _, ticket = queue[0]
+                if ticket.cancelled or ticket.future.done():
+                    heapq.heappop(queue)
+                    continue
+                if ticket.deadline is not None and ticket.deadline <= now:
+                    heapq.heappop(queue)
+                    ticket.future.set_exception(DeadlineExceeded("Deadline expired while queued"))
+                    continue
+                if self.running >= self._capacity_for(priority):
+                    # 高优先级仍在排队时不放行低优先级
+                    return
+                heapq.heappop(queue)
+                self._virtual_time[priority] = finish
+                self.running += 1
+                ticket.future.set_result(None)
+
+    async def _acquire(self, priority: int, tenant: str, deadline: Optional[float], cost: float):
+        ticket = _Ticket(priority, tenant, deadline)
+        self._enqueue(ticket, cost)
+        self._dispatch()
+        if ticket.future.done():
+            return ticket.future.result()
+
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket.future), timeout)
+        except asyncio.TimeoutError:
+            ticket.cancelled = True
+            if ticket.future.done() and not ticket.future.exception():
+                # 超时的同时被放行，归还名额
+                self._release()
+            raise DeadlineExceeded("Deadline expired while queued")
+        except asyncio.CancelledError:
+            # 调用方取消：从队列中移除，已放行则归还名额
+            ticket.cancelled = True
+            if ticket.future.done() and not ticket.future.cancelled() and not ticket.future.exception():
+                self._release()
+            raise
+
+    def _release(self):
+        self.running -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        priority: str = "default",
+        tenant: str = "default",
+        deadline: Optional[float] = None,
+        cost: float = 1.0
+    ) -> AsyncIterator[None]:
+        """获取一个执行名额，deadline为time.monotonic()时间"""
+        level = PRIORITIES.get(priority)
+        if level is None:
+            raise ValueError(f"Unknown priority: {priority}")
+        start = time.monotonic()
+        try:
+            await self._acquire(level, tenant, deadline, cost)
+        except DeadlineExceeded:
+            self.dropped += 1
+            scheduler_dropped.inc((self.provider, priority, "queued"))
+            raise
+        scheduler_wait.observe((self.provider, priority), time.monotonic() - start)
+        try:
+            yield
+        finally:
+            self._release()
+
+    # ==================== 截止时间 ====================
+
+    def observe(self, latency: float, output_tokens: int = 0, alpha: float = 0.2):
+        """记录一次完成的请求，用于估计耗时"""
+        self.latency_ewma = latency if self.latency_ewma is None else (1 - alpha) * self.latency_ewma + alpha * latency
+        if output_tokens:
+            per_token = latency / output_tokens
+            self.seconds_per_token = (
+                per_token if self.seconds_per_token is None
+                else (1 - alpha) * self.seconds_per_token + alpha * per_token
+            )
+
+    def estimate(self, max_tokens: Optional[int] = None) -> Optional[float]:
+        """估计请求耗时，没有观测数据时返回None"""
+        if max_tokens and self.seconds_per_token is not None:
+            return max_tokens * self.seconds_per_token
+        return self.latency_ewma
+
+    def fit_deadline(
+        self,
+        priority: str,
+        deadline: Optional[float],
+        kwargs: Dict[str, Any],
+        min_tokens: int = 16
+    ) -> Dict[str, Any]:
+        """检查请求能否在截止时间前完成，必要时降低max_tokens，无法完成时抛出DeadlineExceeded"""
+        if deadline is None:
+            return kwargs
+        remaining = deadline - time.monotonic()
+        estimate = self.estimate(kwargs.get("max_tokens"))
+        if remaining > 0 and (estimate is None or estimate <= remaining):
+            return kwargs
+
+        if self.deadline_policy == "downgrade" and remaining > 0 and self.seconds_per_token:
+            max_tokens = int(remaining / self.seconds_per_token * 0.8)
+            if max_tokens >= min_tokens:
+                self.downgraded += 1
+                scheduler_dropped.inc((self.provider, priority, "downgraded"))
+                return {**kwargs, "max_tokens": max_tokens}
+
+        self.dropped += 1
+        scheduler_dropped.inc((self.provider, priority, "deadline"))
+        raise DeadlineExceeded(
+            f"Request cannot finish before its deadline ({remaining:.3f}s left, estimated {estimate or 0:.3f}s)"
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """获取调度器状态"""
+        names = {level: name for name, level in PRIORITIES.items()}
+        return {
+            "provider": self.provider,
+            "running": self.running,
+            "max_concurrency": self.max_concurrency,
+            "queued": {
+                names[level]: sum(1 for _, _, ticket in queue if not ticket.cancelled and not ticket.future.done())
+                for level, queue in self._queues.items()
+            },
+            "latency_ewma": self.latency_ewma,
+            "seconds_per_token": self.seconds_per_token,
+            "dropped": self.dropped,
+            "downgraded": self.downgraded
+        }
+
+
+_schedulers: Dict[str, RequestScheduler] = {}
+
+
+def get_scheduler(provider: str) -> RequestScheduler:
+    """获取进程内共享的提供商调度器"""
+    provider = provider.lower()
+    if provider not in _schedulers:
+        _schedulers[provider] = RequestScheduler(provider)
+    return _schedulers[provider]
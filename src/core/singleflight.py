@@ -0,0 +1,141 @@
+"""
+请求合并模块
+相同的请求在进行中时只向上游发送一次，其余调用方等待同一个结果
+"""
+import asyncio
+from typing import Dict, List, Optional, Any, AsyncIterator, Awaitable, Callable
+
+
+class _Flight:
+    """一个进行中的普通请求"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class _StreamFlight:
+    """一个进行中的流式请求，缓存已产出的增量供后加入的订阅者回放"""
+
+    def __init__(self):
+        self.buffer: List[Any] = []
+        self.finished = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.get_running_loop().create_future()
+
+    def notify(self):
+        if not self._changed.done():
+            self._changed.set_result(None)
+        self._changed = asyncio.get_running_loop().create_future()
+
+    async def wait(self):
+        await asyncio.shield(self._changed)
+
+
+class SingleFlight:
+    """按key合并进行中的相同请求"""
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._streams: Dict[str, _StreamFlight] = {}
+        self.coalesced = 0
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """执行请求；已有相同key的请求在进行中时等待其结果
+
+        上游请求运行在独立task中，单个调用方被取消不影响其他等待者，
+        所有等待者都取消后才取消上游请求。
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(factory()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _forget(self, key: str, flight: Any):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def stream(
+        self,
+        key: str,
+        factory: Callable[[], AsyncIterator[Any]]
+    ) -> AsyncIterator[Any]:
+        """流式请求的合并：一个上游流扇出给所有订阅者"""
+        flight = self._streams.get(key)
+        if flight is None:
+            flight = _StreamFlight()
+            self._streams[key] = flight
+            flight.task = asyncio.ensure_future(self._pump(key, flight, factory))
+        else:
+            self.coalesced += 1
+
+        flight.subscribers += 1
+        index = 0
+        try:
+            while True:
+                if index < len(flight.buffer):
+                    yield flight.buffer[index]
+                    index += 1
+                    continue
+                if flight.finished:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await flight.wait()
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and flight.task is not None and not flight.task.done():
+                flight.task.cancel()
+                if self._streams.get(key) is flight:
+                    del self._streams[key]
+
+    async def _pump(self, key: str, flight: _StreamFlight, factory: Callable[[], AsyncIterator[Any]]):
+        """读取上游流并通知所有订阅者"""
+        try:
+            async for item in factory():
+                flight.buffer.append(item)
+                flight.notify()
+        except asyncio.CancelledError:
+            flight.error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.finished = True
+            flight.notify()
+            if self._streams.get(key) is flight:
+                del self._streams[key]
+
+    def stats(self) -> Dict[str, int]:
+        """获取合并统计"""
+        return {
+            "in_flight": len(self._flights),
+            "streams_in_flight": len(self._streams),
+            "coalesced": self.coalesced
+        }
+
+
+_default_singleflight: Optional[SingleFlight] = None
+
+
+def get_singleflight() -> SingleFlight:
+    """获取进程内共享的请求合并器"""
+    global _default_singleflight
+    if _default_singleflight is None:
+        _default_singleflight = SingleFlight()
+    return _default_singleflight
@@ -0,0 +1,178 @@
+"""
+Token预算模块
+token计数(可用时使用tiktoken精确计数，否则快速估算)与上下文窗口裁剪
+"""
+import hashlib
+import json
+import re
+from collections import OrderedDict
+from typing import Dict, List, Optional, Any, Awaitable, Callable
+
+# OpenAI聊天格式每条消息的固定开销，以及回复引导的开销
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_PRIMING_TOKENS = 3
+
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """快速估算token数：CJK字符约1 token/字，其余约4字符/token"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _message_text(message: Dict[str, Any]) -> str:
+    """取出消息中参与计数的文本，非字符串内容(如多段content、tool_calls)按JSON计"""
+    content = message.get("content")
+    text = content if isinstance(content, str) else json.dumps(content, ensure_ascii=False) if content else ""
+    for key in ("tool_calls", "name", "tool_call_id"):
+        if message.get(key):
+            text += json.dumps(message[key], ensure_ascii=False)
+    return text
+
+
+class TokenCounter:
+    """token计数器，按(编码, 文本)缓存单条消息的计数结果"""
+
+    def __init__(self, encoding_name: Optional[str] = None, cache_size: int = 4096):
+        self.encoding_name = encoding_name
+        self._encoding = None
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+        self.cache_size = cache_size
+        if encoding_name:
+            try:
+                import tiktoken
+                self._encoding = tiktoken.get_encoding(encoding_name)
+            except (ImportError, ValueError):
+                # 未安装tiktoken或编码不存在时退化为估算
+                self._encoding = None
+
+    @classmethod
+    def for_model(cls, model: Optional[str]) -> "TokenCounter":
+        """根据模型选择计数器：OpenAI系模型使用tiktoken，其余使用估算"""
+        name = (model or "").split("/")[-1]
+        if name.startswith(("gpt-4o", "gpt-4.1", "o1", "o3", "o4")):
+            return cls("o200k_base")
+        if name.startswith(("gpt-4", "gpt-3.5")):
+            return cls("cl100k_base")
+        return cls()
+
+    @property
+    def exact(self) -> bool:
+        return self._encoding is not None
+
+    def count_text(self, text: str) -> int:
+        """计算一段文本的token数"""
+        if not text:
+            return 0
+        cached = self._cache.get(text)
+        if cached is not None:
+            self._cache.move_to_end(text)
+            return cached
+        if self._encoding is not None:
+            count = len(self._encoding.encode(text, disallowed_special=()))
+        else:
+            count = estimate_tokens(text)
+        self._cache[text] = count
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return count
+
+    def count_message(self, message: Dict[str, Any]) -> int:
+        """计算单条消息的token数(含格式开销)"""
+        return MESSAGE_OVERHEAD_TOKENS + self.count_text(_message_text(message))
+
+    def count_messages(self, messages: List[Dict[str, Any]]) -> int:
+        """计算整段对话的token数"""
+        return REPLY_PRIMING_TOKENS + sum(self.count_message(msg) for msg in messages)
+
+
+class ContextTrimmer:
+    """上下文裁剪策略
+
+    保留全部system消息和尽可能多的最近轮次，使对话不超过token预算；
+    中间被裁掉的轮次直接丢弃(drop)或压缩为一条摘要(summarize)。
+    """
+
+    def __init__(
+        self,
+        budget: int,
+        counter: Optional[TokenCounter] = None,
+        strategy: str = "drop",
+        summarizer: Optional[Callable[[List[Dict[str, Any]]], Awaitable[str]]] = None,
+        summary_tokens: int = 256,
+        step: int = 1
+    ):
+        if strategy not in ("drop", "summarize"):
+            raise ValueError(f"Unsupported trim strategy: {strategy}")
+        self.budget = budget
+        self.step = max(1, step)
+        self.counter = counter or TokenCounter()
+        self.strategy = strategy
+        self.summarizer = summarizer
+        self.summary_tokens = summary_tokens
+        self._summaries: "OrderedDict[str, str]" = OrderedDict()
+        self.trimmed_requests = 0
+
+    def _select(self, messages: List[Dict[str, Any]], reserve: int) -> Optional[int]:
+        """返回保留的最近轮次起始下标，不需要裁剪时返回None"""
+        if self.counter.count_messages(messages) <= self.budget:
+            return None
+
+        system_tokens = sum(self.counter.count_message(m) for m in messages if m.get("role") == "system")
+        remaining = self.budget - REPLY_PRIMING_TOKENS - system_tokens - reserve
+        start = len(messages)
+        for index in range(len(messages) - 1, -1, -1):
+            message = messages[index]
+            if message.get("role") == "system":
+                continue
+            cost = self.counter.count_message(message)
+            # 至少保留最后一条消息
+            if cost > remaining and start < len(messages):
+                break
+            remaining -= cost
+            start = index
+
+        # 起点按step对齐，连续几轮对话裁剪出相同的前缀，便于命中提供商的前缀缓存
+        start = min(-(-start // self.step) * self.step, len(messages) - 1)
+
+        # 保留窗口以user消息开头，避免孤立的assistant/tool消息
+        while start < len(messages) - 1 and messages[start].get("role") != "user":
+            start += 1
+        return start
+
+    async def trim(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """裁剪消息列表，返回新列表，原列表不变"""
+        use_summary = self.strategy == "summarize" and self.summarizer is not None
+        start = self._select(messages, self.summary_tokens if use_summary else 0)
+        if start is None:
+            return messages
+
+        self.trimmed_requests += 1
+        systems = [m for m in messages[:start] if m.get("role") == "system"]
+        dropped = [m for m in messages[:start] if m.get("role") != "system"]
+        recent = messages[start:]
+
+        if use_summary and dropped:
+            summary = await self._summarize(dropped)
+            systems = systems + [{
+                "role": "system",
+                "content": f"Summary of the earlier conversation:\n{summary}"
+            }]
+        return systems + recent
+
+    async def _summarize(self, dropped: List[Dict[str, Any]]) -> str:
+        """生成被裁剪部分的摘要，相同的前缀只摘要一次"""
+        key = hashlib.sha256(
+            json.dumps(dropped, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+        ).hexdigest()
+        summary = self._summaries.get(key)
+        if summary is None:
+            assert self.summarizer is not None
+            summary = await self.summarizer(dropped)
+            self._summaries[key] = summary
+            if len(self._summaries) > 128:
+                self._summaries.popitem(last=False)
+        return summary
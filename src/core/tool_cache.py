@@ -0,0 +1,215 @@
+"""
+工具结果缓存模块
+按工具声明的策略缓存MCP工具的成功结果，按结果的序列化大小限制内存，LRU淘汰
+
+- pure: 结果只取决于参数，只会被LRU淘汰
+- ttl:  结果在ttl秒内有效
+- fs:   结果取决于参数中的路径，路径的mtime/大小/inode变化时失效(文件内容或目录条目变化)
+
+查询时会stat依赖的路径，异步调用方应在线程中执行lookup。
+"""
+import copy
+import inspect
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Any, Callable, NamedTuple, Optional, Sequence, Set, Tuple, Union
+
+from config.settings import get_settings
+from .metrics import tool_cache_requests
+
+CACHE_MODES = ("pure", "ttl", "fs")
+
+# 路径的状态签名，路径不存在时为None
+_PathSignature = Optional[Tuple[int, int, int]]
+
+
+def _stat_signature(path: str) -> _PathSignature:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+# 由绑定后的参数计算fs模式依赖的路径，返回None表示这次调用不缓存
+PathResolver = Callable[[Dict[str, Any]], Optional[Sequence[str]]]
+
+
+@dataclass
+class CachePolicy:
+    """工具的缓存策略
+
+    fs模式下paths为作为依赖的参数名；依赖的路径不能直接从参数取出时(如glob模式)用resolve计算
+    """
+    mode: str
+    ttl: Optional[float] = None
+    paths: Tuple[str, ...] = ()
+    signature: Optional[inspect.Signature] = field(default=None, repr=False)
+    resolve: Optional[PathResolver] = field(default=None, repr=False)
+
+    @classmethod
+    def create(cls, func: Callable, mode: str, ttl: Optional[float] = None,
+               paths: Union[Sequence[str], PathResolver] = ()) -> "CachePolicy":
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode '{mode}', expected one of {CACHE_MODES}")
+        if mode == "ttl" and not ttl:
+            raise ValueError("cache='ttl' requires cache_ttl")
+        if mode == "fs" and not paths:
+            raise ValueError("cache='fs' requires cache_paths")
+        if callable(paths):
+            return cls(mode=mode, ttl=ttl, signature=inspect.signature(func), resolve=paths)
+        return cls(mode=mode, ttl=ttl, paths=tuple(paths), signature=inspect.signature(func))
+
+
+class CacheLookup(NamedTuple):
+    """一次查询的结果；未命中时保存查询前的路径签名，供写入时使用"""
+    tool: str
+    key: str
+    paths: Tuple[str, ...]
+    signatures: Tuple[_PathSignature, ...]
+    hit: bool
+    value: Any
+
+
+class _Entry(NamedTuple):
+    tool: str
+    value: Any
+    size: int
+    expires_at: Optional[float]
+    paths: Tuple[str, ...]
+    signatures: Tuple[_PathSignature, ...]
+
+
+class ToolResultCache:
+    """进程内工具结果缓存，按字节数上限LRU淘汰，线程安全"""
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        self.max_bytes = max_bytes if max_bytes is not None else get_settings().mcp_tool_cache_max_bytes
+        self.bytes = 0
+        self._data: "OrderedDict[str, _Entry]" = OrderedDict()
+        # 绝对路径 -> 依赖该路径的缓存键
+        self._by_path: Dict[str, Set[str]] = {}
+        self._counts: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def _count(self, tool: str, event: str, n: int = 1):
+        counts = self._counts.setdefault(tool, {"hits": 0, "misses": 0, "invalidations": 0, "evictions": 0})
+        counts[event] += n
+
+    def _remove(self, key: str) -> _Entry:
+        entry = self._data.pop(key)
+        self.bytes -= entry.size
+        for path in entry.paths:
+            keys = self._by_path.get(path)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_path[path]
+        return entry
+
+    def lookup(self, tool: str, policy: CachePolicy, parameters: Dict[str, Any]) -> Optional[CacheLookup]:
+        """查询缓存；参数无法绑定到工具函数或这次调用不可缓存时返回None
+
+        命中时返回缓存值的副本，调用方修改结果不会影响缓存
+        """
+        try:
+            bound = policy.signature.bind(**parameters)
+        except TypeError:
+            return None
+        # 补齐默认值，省略参数和显式传默认值命中同一条目
+        bound.apply_defaults()
+        arguments = bound.arguments
+        if policy.resolve is not None:
+            resolved = policy.resolve(dict(arguments))
+            if resolved is None:
+                return None
+            paths = tuple(os.path.abspath(str(path)) for path in resolved)
+        else:
+            paths = tuple(
+                os.path.abspath(str(arguments[name])) for name in policy.paths if arguments.get(name) is not None
+            )
+        key = json.dumps([tool, arguments, paths], sort_keys=True, ensure_ascii=False, default=str)
+        signatures = tuple(_stat_signature(path) for path in paths)
+
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and (
+                (entry.expires_at is not None and entry.expires_at < time.monotonic())
+                or entry.signatures != signatures
+            ):
+                self._remove(key)
+                self._count(tool, "invalidations")
+                entry = None
+            if entry is not None:
+                self._data.move_to_end(key)
+                self._count(tool, "hits")
+            else:
+                self._count(tool, "misses")
+        tool_cache_requests.inc((tool, "hit" if entry is not None else "miss"))
+        value = copy.deepcopy(entry.value) if entry is not None else None
+        return CacheLookup(tool, key, paths, signatures, entry is not None, value)
+
+    def store(self, lookup: CacheLookup, value: Any, ttl: Optional[float] = None):
+        """写入未命中查询的结果；超过上限的单个结果不缓存"""
+        size = len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        # 保存副本，调用方之后修改返回给它的结果不会影响缓存
+        entry = _Entry(
+            lookup.tool, copy.deepcopy(value), size,
+            time.monotonic() + ttl if ttl else None,
+            lookup.paths, lookup.signatures
+        )
+        with self._lock:
+            if lookup.key in self._data:
+                self._remove(lookup.key)
+            self._data[lookup.key] = entry
+            self.bytes += size
+            for path in lookup.paths:
+                self._by_path.setdefault(path, set()).add(lookup.key)
+            while self.bytes > self.max_bytes:
+                evicted = self._remove(next(iter(self._data)))
+                self._count(evicted.tool, "evictions")
+
+    def invalidate_paths(self, *paths: str) -> int:
+        """使依赖这些路径或其所在目录的条目失效，返回删除的条目数"""
+        removed = 0
+        with self._lock:
+            for path in paths:
+                path = os.path.abspath(path)
+                for target in (path, os.path.dirname(path)):
+                    for key in list(self._by_path.get(target, ())):
+                        entry = self._remove(key)
+                        self._count(entry.tool, "invalidations")
+                        removed += 1
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._by_path.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """条目数、占用字节和各工具的命中率"""
+        with self._lock:
+            tools = {
+                tool: dict(counts, hit_rate=counts["hits"] / max(1, counts["hits"] + counts["misses"]))
+                for tool, counts in self._counts.items()
+            }
+            hits = sum(counts["hits"] for counts in self._counts.values())
+            misses = sum(counts["misses"] for counts in self._counts.values())
+            return {
+                "entries": len(self._data),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hit_rate": hits / max(1, hits + misses),
+                "tools": tools
+            }
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -0,0 +1,294 @@
+"""
+工具执行池模块
+同步工具不在事件循环上直接执行：阻塞IO放到线程池，CPU密集型放到进程池，
+避免一个慢调用阻塞同一服务器上的其他并发调用；每个工具可以有自己的并发隔离舱(Bulkhead)
+"""
+import asyncio
+import functools
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Deque, Dict, Any, Callable, List, Optional, Tuple
+
+from config.settings import get_settings
+from .metrics import tool_pool_inflight, tool_pool_queue_depth
+
+logger = logging.getLogger(__name__)
+
+# inline: 直接在事件循环上执行(异步工具或极快的同步工具)
+# thread: 线程池，适合阻塞IO(文件读写、目录扫描)
+# process: 进程池，适合CPU密集型计算；函数和参数、返回值都必须可pickle
+EXECUTION_MODES = ("inline", "thread", "process")
+
+
+class ToolPool:
+    """懒创建的线程/进程池，记录在途调用数和排队深度
+
+    进程池中的调用被取消(如超时)时终止该池的worker并换用新的进程池，失控的计算不会一直占用worker；
+    同一进程池中被连带终止的其他调用最多重新执行max_retries次，因此进程池中的工具应当没有副作用。
+    MCPServer为每个process工具创建独立的ToolPool，一个工具超时不会连带终止其他工具的调用。
+    """
+
+    def __init__(self, kind: str, max_workers: int, name: Optional[str] = None, max_retries: int = 1):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unsupported pool kind: {kind}")
+        self.kind = kind
+        # 指标标签，区分同类型的多个池
+        self.name = name or kind
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.inflight = 0
+        self.completed = 0
+        self.killed = 0
+        self.retried = 0
+        self._executor: Optional[Executor] = None
+        # 被主动终止worker的进程池，其中的调用失败后可以重试
+        self._killed: "weakref.WeakSet[Executor]" = weakref.WeakSet()
+        # 同一个MCPServer可能同时被多个事件循环线程使用(如SyncBridge)，计数需要加锁
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                if self.kind == "thread":
+                    self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="mcp-tool")
+                else:
+                    self._executor = ProcessPoolExecutor(self.max_workers)
+            return self._executor
+
+    def _discard(self, executor: Executor) -> bool:
+        """丢弃已损坏的进程池，下次调用时创建新的；返回该池是否是被主动终止的"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+            killed = executor in self._killed
+        executor.shutdown(wait=False)
+        return killed
+
+    def _kill(self, executor: Executor):
+        """终止进程池的所有worker并丢弃该池，池中未完成的调用以BrokenProcessPool结束"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+            if executor in self._killed:
+                return
+            self._killed.add(executor)
+            self.killed += 1
+        _kill_workers(executor)
+        executor.shutdown(wait=False)
+
+    def _update(self, delta: int):
+        with self._lock:
+            self.inflight += delta
+            if delta < 0:
+                self.completed += 1
+            inflight = self.inflight
+        tool_pool_inflight.set((self.name,), inflight)
+        tool_pool_queue_depth.set((self.name,), max(0, inflight - self.max_workers))
+
+    async def run(self, func: Callable, arguments: Dict[str, Any],
+                  on_done: Optional[Callable[[], None]] = None) -> Any:
+        """在池中执行 func(**arguments)
+
+        等待被取消(如超时)时：进程池终止执行该调用的worker；线程池中已开始的调用无法中断，
+        会继续占用线程直到完成。on_done在调用真正结束或worker被终止时(可能在其他线程)执行。
+        """
+        call = functools.partial(func, **arguments)
+        deferred = False
+        retries = 0
+        try:
+            while True:
+                executor = self._get_executor()
+                try:
+                    future = executor.submit(call)
+                except BrokenProcessPool:
+                    # 进程池已损坏但还没被丢弃，调用尚未执行，换新的池提交
+                    self._discard(executor)
+                    continue
+                self._update(1)
+                future.add_done_callback(lambda _: self._update(-1))
+                try:
+                    return await asyncio.wrap_future(future)
+                except BrokenProcessPool:
+                    # 被其他调用的超时连带终止时有限次重新执行；worker自身崩溃等情况直接报错
+                    if not self._discard(executor) or retries >= self.max_retries:
+                        raise
+                    retries += 1
+                    with self._lock:
+                        self.retried += 1
+                except asyncio.CancelledError:
+                    if self.kind == "process" and not future.done():
+                        self._kill(executor)
+                    if on_done is not None:
+                        deferred = True
+                        future.add_done_callback(lambda _: on_done())
+                    raise
+        finally:
+            if on_done is not None and not deferred:
+                on_done()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            inflight = self.inflight
+            completed = self.completed
+            killed = self.killed
+            retried = self.retried
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "inflight": inflight,
+            "queued": max(0, inflight - self.max_workers),
+            "completed": completed,
+            "killed": killed,
+            "retried": retried
+        }
+
+    def shutdown(self, wait: bool = True, timeout: float = 5.0):
+        """关闭执行池；进程池的worker在timeout秒内(wait=False时立即)没有结束的会被终止"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        if self.kind == "thread":
+            executor.shutdown(wait=wait, cancel_futures=True)
+            return
+        processes = _worker_processes(executor)
+        executor.shutdown(wait=False, cancel_futures=True)
+        if wait:
+            deadline = time.monotonic() + timeout
+            for process in processes:
+                process.join(max(0.0, deadline - time.monotonic()))
+        for process in processes:
+            if process.is_alive():
+                process.kill()
+
+
+def _worker_processes(executor: Executor) -> List[Any]:
+    """进程池的worker进程
+
+    ProcessPoolExecutor没有公开列出worker的接口，这里读取CPython的实现细节_processes
+    (关闭后会被清空，需要在关闭前取出)；读不到时返回空列表，由_kill_workers退化处理
+    """
+    processes = getattr(executor, "_processes", None)
+    if not isinstance(processes, dict):
+        return []
+    return list(processes.values())
+
+
+def _kill_workers(executor: Executor) -> bool:
+    """终止进程池的worker，返回是否终止成功
+
+    优先使用Python 3.14+的公开接口kill_workers，否则终止_worker_processes取出的进程。
+    两者都不可用时只记录警告：进程池已被替换，新的调用不受影响，但失控的worker会运行到结束，
+    它占用的隔离舱名额也要到那时才释放
+    """
+    kill = getattr(executor, "kill_workers", None)
+    if kill is not None:
+        try:
+            kill()
+            return True
+        except RuntimeError:
+            # 进程池已经关闭，worker已退出或正在退出
+            return False
+    processes = _worker_processes(executor)
+    if not processes:
+        logger.warning("Cannot kill worker processes of %r, runaway tool calls will run to completion", executor)
+        return False
+    for process in processes:
+        if process.is_alive():
+            process.kill()
+    return True
+
+
+class ToolSaturated(Exception):
+    """工具的并发名额和等待队列都已满"""
+
+
+class Bulkhead:
+    """单个工具的并发隔离舱：最多max_concurrency个调用同时执行，最多max_queue个排队，其余立即拒绝
+
+    不绑定事件循环，同一个MCPServer被多个事件循环线程使用时也能正确排队。
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int = 0):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.active = 0
+        self.rejected = 0
+        self._waiters: Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+        self._lock = threading.Lock()
+
+    async def acquire(self):
+        """获取一个执行名额，队列已满时抛出ToolSaturated"""
+        with self._lock:
+            if self.active < self.max_concurrency and not self._waiters:
+                self.active += 1
+                return
+            if len(self._waiters) >= self.max_queue:
+                self.rejected += 1
+                raise ToolSaturated(f"Tool '{self.name}' is saturated "
+                                    f"({self.active} running, {len(self._waiters)} queued)")
+            loop = asyncio.get_running_loop()
+            waiter = loop.create_future()
+            self._waiters.append((loop, waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            with self._lock:
+                try:
+                    self._waiters.remove((loop, waiter))
+                    granted = False
+                except ValueError:
+                    granted = True
+            # 名额已经转交给这个等待者(可能尚未送达)，交还给下一个
+            if granted and not (waiter.done() and waiter.cancelled()):
+                self.release()
+            raise
+
+    def _grant(self, waiter: asyncio.Future):
+        if waiter.done():
+            # 等待者在名额送达前已取消，转交给下一个
+            self.release()
+        else:
+            waiter.set_result(None)
+
+    def release(self):
+        """释放名额；有等待者时直接转交，不经过空闲状态"""
+        with self._lock:
+            if not self._waiters:
+                self.active -= 1
+                return
+            loop, waiter = self._waiters.popleft()
+        try:
+            loop.call_soon_threadsafe(self._grant, waiter)
+        except RuntimeError:
+            # 等待者所在的事件循环已关闭
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "active": self.active,
+                "queued": len(self._waiters),
+                "rejected": self.rejected
+            }
+
+
+def default_pool_sizes() -> Dict[str, int]:
+    """线程池/进程池的默认大小(MCP_THREAD_POOL_SIZE / MCP_PROCESS_POOL_SIZE，0表示自动)"""
+    settings = get_settings()
+    cpus = os.cpu_count() or 1
+    return {
+        "thread": settings.mcp_thread_pool_size or min(32, cpus + 4),
+        "process": settings.mcp_process_pool_size or cpus
+    }
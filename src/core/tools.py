@@ -0,0 +1,267 @@
+"""
+工具调用模块
+在通用格式与各提供商原生tool calling格式之间转换，并提供并发执行工具调用的循环
+
+通用格式:
+- 工具定义: MCPServer.get_tools_schema() 的返回值，或 {"name", "description", "parameters"} 列表
+- 模型返回: response["tool_calls"] = [{"id", "name", "arguments": dict}]
+- 对话消息: {"role": "assistant", "content", "tool_calls": [...]} 与
+           {"role": "tool", "tool_call_id", "name", "content"}
+"""
+import asyncio
+import json
+from typing import Dict, List, Any, Awaitable, Callable, Union
+
+ToolExecutor = Callable[[str, Dict[str, Any]], Awaitable[Any]]
+
+
+def normalize_tools(tools: Union[Dict[str, Any], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """把工具定义统一为 [{"name", "description", "parameters"}]"""
+    items = tools.values() if isinstance(tools, dict) else tools
+    normalized = []
+    for tool in items:
+        # 已经是OpenAI格式的工具定义
+        if tool.get("type") == "function" and "function" in tool:
+            tool = tool["function"]
+        normalized.append({
+            "name": tool["name"],
+            "description": tool.get("description", ""),
+            "parameters": tool.get("parameters") or tool.get("input_schema") or {"type": "object", "properties": {}}
+        })
+    return normalized
+
+
+def parse_arguments(arguments: Any) -> Dict[str, Any]:
+    """解析模型生成的参数JSON，无法解析时保留原文交给执行方报错"""
+    if isinstance(arguments, dict):
+        return arguments
+    if not arguments:
+        return {}
+    try:
+        parsed = json.loads(arguments)
+    except ValueError:
+        return {"_raw": arguments}
+    return parsed if isinstance(parsed, dict) else {"_raw": arguments}
+
+
+# ==================== OpenAI格式 ====================
+
+def to_openai_tools(tools: Union[Dict[str, Any], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    return [{"type": "function", "function": tool} for tool in normalize_tools(tools)]
+
+
+def to_openai_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """把通用格式中assistant消息的tool_calls转换为OpenAI格式，tool消息不带name字段"""
+    converted = []
+    for msg in messages:
+        if msg.get("role") == "tool" and "name" in msg:
+            msg = {key: value for key, value in msg.items() if key != "name"}
+        tool_calls = msg.get("tool_calls")
+        if msg.get("role") == "assistant" and tool_calls and "function" not in tool_calls[0]:
+            msg = {**msg, "tool_calls": [
+                {
+                    "id": call["id"],
+                    "type": "function",
+                    "function": {
+                        "name": call["name"],
+                        "arguments": json.dumps(call.get("arguments") or {}, ensure_ascii=False)
+                    }
+                }
+                for call in tool_calls
+            ]}
+        converted.append(msg)
+    return converted
+
+
+def from_openai_tool_calls(tool_calls: Any) -> List[Dict[str, Any]]:
+    """把OpenAI响应中的tool_calls转换为通用格式"""
+    return [
+        {
+            "id": call.id,
+            "name": call.function.name,
+            "arguments": parse_arguments(call.function.arguments)
+        }
+        for call in tool_calls or []
+    ]
+
+
+# ==================== Anthropic格式 ====================
+
+def to_anthropic_tools(tools: Union[Dict[str, Any], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    return [
+        {"name": tool["name"], "description": tool["description"], "input_schema": tool["parameters"]}
+        for tool in normalize_tools(tools)
+    ]
+
+
+def to_anthropic_message(msg: Dict[str, Any]) -> Dict[str, Any]:
+    """把单条通用格式消息转换为Anthropic消息(tool结果作为user消息的tool_result块)"""
+    if msg["role"] == "tool":
+        content = msg.get("content")
+        return {"role": "user", "content": [{
+            "type": "tool_result",
+            "tool_use_id": msg["tool_call_id"],
+            "content": content if isinstance(content, str) else json.dumps(content, ensure_ascii=False)
+        }]}
+    if msg["role"] == "assistant" and msg.get("tool_calls"):
+        blocks = [{"type": "text", "text": msg["content"]}] if msg.get("content") else []
+        blocks.extend(
+            {"type": "tool_use", "id": call["id"], "name": call["name"], "input": call.get("arguments") or {}}
+            for call in msg["tool_calls"]
+        )
+        return {"role": "assistant", "content": blocks}
+    return {"role": msg["role"], "content": msg["content"]}
+
+
+def merge_anthropic_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """合并连续的同角色消息，并行工具调用的多个结果需要放在同一条user消息中"""
+    merged: List[Dict[str, Any]] = []
+    for msg in messages:
+        if merged and merged[-1]["role"] == msg["role"] and msg["role"] == "user" and (
+            isinstance(msg["content"], list) and isinstance(merged[-1]["content"], list)
+        ):
+            merged[-1] = {"role": "user", "content": merged[-1]["content"] + msg["content"]}
+        else:
+            merged.append(msg)
+    return merged
+
+
+def from_anthropic_content(content: List[Any]) -> Dict[str, Any]:
+    """从Anthropic响应的content块中取出文本和tool_calls"""
+    text = "".join(block.text for block in content if block.type == "text")
+    tool_calls = [
+        {"id": block.id, "name": block.name, "arguments": dict(block.input or {})}
+        for block in content if block.type == "tool_use"
+    ]
+    return {"content": text, "tool_calls": tool_calls}
+
+
+# ==================== 流式工具调用解析 ====================
+
+class IncrementalJSONParser:
+    """增量JSON解析器：逐段喂入文本，顶层对象/数组一闭合就能取得结果，无需等待流结束"""
+
+    def __init__(self):
+        self._chunks: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self.complete = False
+
+    def feed(self, text: str) -> bool:
+        """喂入一段文本，返回顶层值是否已经完整"""
+        if self.complete or not text:
+            return self.complete
+        for index, char in enumerate(text):
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._chunks.append(text[:index + 1])
+                    self.complete = True
+                    return True
+        self._chunks.append(text)
+        return False
+
+    @property
+    def text(self) -> str:
+        return "".join(self._chunks)
+
+
+class ToolCallAssembler:
+    """把流式的tool_call_delta/tool_call_end事件组装为完整的工具调用
+
+    OpenAI的流没有单个工具调用的结束标记，参数JSON闭合即视为完成；
+    Anthropic在content_block_stop时发出tool_call_end，用于无参数的工具。
+    """
+
+    def __init__(self):
+        self._pending: Dict[int, Dict[str, Any]] = {}
+        self._completed: Dict[int, Dict[str, Any]] = {}
+
+    def feed(self, event: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """处理一个流式事件，返回因此完成的工具调用"""
+        index = event.get("index", 0)
+        if index in self._completed:
+            return []
+        if event["type"] == "tool_call_end":
+            return [self._finish(index)] if index in self._pending else []
+
+        call = self._pending.setdefault(index, {"id": None, "name": None, "parser": IncrementalJSONParser()})
+        call["id"] = event.get("id") or call["id"]
+        call["name"] = event.get("name") or call["name"]
+        if call["parser"].feed(event.get("arguments") or ""):
+            return [self._finish(index)]
+        return []
+
+    def flush(self) -> List[Dict[str, Any]]:
+        """流结束时完成所有剩余的工具调用"""
+        return [self._finish(index) for index in sorted(self._pending)]
+
+    def _finish(self, index: int) -> Dict[str, Any]:
+        call = self._pending.pop(index)
+        parser = call["parser"]
+        try:
+            arguments = json.loads(parser.text) if parser.complete else parse_arguments(parser.text)
+        except ValueError:
+            arguments = {"_raw": parser.text}
+        tool_call = {"id": call["id"] or f"call_{index}", "name": call["name"], "arguments": arguments}
+        self._completed[index] = tool_call
+        return tool_call
+
+    def calls(self) -> List[Dict[str, Any]]:
+        """按模型输出顺序返回已完成的工具调用"""
+        return [self._completed[index] for index in sorted(self._completed)]
+
+
+def tool_call_deltas(tool_calls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """把完整的工具调用转换为流式事件，供非流式实现的默认流式接口使用"""
+    events = []
+    for index, call in enumerate(tool_calls):
+        events.append({
+            "type": "tool_call_delta",
+            "index": index,
+            "id": call["id"],
+            "name": call["name"],
+            "arguments": json.dumps(call.get("arguments") or {}, ensure_ascii=False)
+        })
+        events.append({"type": "tool_call_end", "index": index})
+    return events
+
+
+# ==================== 工具执行循环 ====================
+
+def _result_content(result: Any) -> str:
+    return result if isinstance(result, str) else json.dumps(result, ensure_ascii=False, default=str)
+
+
+async def run_tool_call(call: Dict[str, Any], executor: ToolExecutor) -> Dict[str, Any]:
+    """执行单个工具调用，返回tool消息，异常转换为错误结果"""
+    try:
+        result = await executor(call["name"], call.get("arguments") or {})
+    except Exception as e:
+        result = {"success": False, "error": str(e)}
+    return {"role": "tool", "tool_call_id": call["id"], "name": call["name"], "content": _result_content(result)}
+
+
+async def execute_tool_calls(
+    tool_calls: List[Dict[str, Any]],
+    executor: ToolExecutor
+) -> List[Dict[str, Any]]:
+    """并发执行一次响应中的所有工具调用，按顺序返回tool消息"""
+    return list(await asyncio.gather(*(run_tool_call(call, executor) for call in tool_calls)))
+
+
+def assistant_message(response: Dict[str, Any]) -> Dict[str, Any]:
+    """把带tool_calls的响应转换为可追加到对话中的assistant消息"""
+    return {"role": "assistant", "content": response.get("content"), "tool_calls": response["tool_calls"]}
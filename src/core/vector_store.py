@@ -0,0 +1,221 @@
+"""
+向量存储模块
+基于内存映射文件的float32向量库：只追加写入，分块向量化计算余弦top-k，无需把全部向量读入内存
+"""
+import json
+import os
+from typing import Dict, List, Optional, Any, Sequence
+
+import numpy as np
+
+
+class VectorStore:
+    """内存映射的向量库
+
+    文件布局(path为前缀):
+    - {path}.f32   向量矩阵，行已L2归一化，容量按倍数增长，多出的行为未使用空间
+    - {path}.jsonl 每行一条 {"id", "metadata"}，与向量行一一对应
+    - {path}.json  维度和已提交行数；最后写入，写到一半崩溃时多出的行会被忽略
+
+    同一个库只允许一个写入进程，读取进程可以随时打开。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        dim: Optional[int] = None,
+        initial_capacity: int = 1024,
+        chunk_rows: int = 65536
+    ):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.initial_capacity = initial_capacity
+        self.vectors_path = f"{path}.f32"
+        self.records_path = f"{path}.jsonl"
+        self.meta_path = f"{path}.json"
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.dim = dim
+        self.count = 0
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if dim is not None and dim != meta["dim"]:
+                raise ValueError(f"Vector store dim is {meta['dim']}, got {dim}")
+            self.dim = meta["dim"]
+            self.count = meta["count"]
+
+        self._matrix: Optional[np.memmap] = None
+        self._offsets: List[int] = []
+        self._load_offsets()
+        if self.dim is not None:
+            self._open_matrix()
+
+    # ==================== 文件 ====================
+
+    def _load_offsets(self):
+        """扫描记录文件，得到前count行记录的字节偏移，多出的(未提交)记录被截掉"""
+        if not os.path.exists(self.records_path):
+            return
+        offset = 0
+        with open(self.records_path, "rb") as f:
+            for line in f:
+                if len(self._offsets) == self.count:
+                    break
+                self._offsets.append(offset)
+                offset += len(line)
+        if os.path.getsize(self.records_path) != offset:
+            os.truncate(self.records_path, offset)
+
+    def _capacity(self) -> int:
+        if not os.path.exists(self.vectors_path):
+            return 0
+        return os.path.getsize(self.vectors_path) // (self.dim * 4)
+
+    def _open_matrix(self, capacity: Optional[int] = None):
+        """按容量映射向量文件，容量不足时扩展文件"""
+        current = self._capacity()
+        capacity = max(capacity or 0, current, self.initial_capacity)
+        if capacity > current:
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(capacity * self.dim * 4)
+        if self._matrix is not None:
+            self._matrix.flush()
+            del self._matrix
+        self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+    def _write_meta(self):
+        tmp_path = f"{self.meta_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "count": self.count}, f)
+        os.replace(tmp_path, self.meta_path)
+
+    # ==================== 写入 ====================
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def add(
+        self,
+        vectors: Any,
+        ids: Optional[Sequence[Any]] = None,
+        metadata: Optional[Sequence[Optional[Dict[str, Any]]]] = None
+    ) -> List[int]:
+        """追加一批向量，返回分配的行号；ids默认为行号"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        rows = len(vectors)
+        if rows == 0:
+            return []
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected vectors of dim {self.dim}, got {vectors.shape[1]}")
+        if ids is not None and len(ids) != rows:
+            raise ValueError("ids must match the number of vectors")
+        if metadata is not None and len(metadata) != rows:
+            raise ValueError("metadata must match the number of vectors")
+
+        start = self.count
+        end = start + rows
+        capacity = self._capacity() if self._matrix is not None else 0
+        if self._matrix is None or end > capacity:
+            # 容量按倍数增长，摊销重新映射的开销
+            self._open_matrix(max(end, capacity * 2))
+        self._matrix[start:end] = self._normalize(vectors)
+        self._matrix.flush()
+
+        with open(self.records_path, "ab") as f:
+            offset = f.tell()
+            for index in range(rows):
+                record = {
+                    "id": ids[index] if ids is not None else start + index,
+                    "metadata": metadata[index] if metadata is not None else None
+                }
+                line = (json.dumps(record, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+                self._offsets.append(offset)
+                offset += len(line)
+                f.write(line)
+
+        self.count = end
+        self._write_meta()
+        return list(range(start, end))
+
+    # ==================== 检索 ====================
+
+    def _records(self, rows: Sequence[int]) -> List[Dict[str, Any]]:
+        """按行号读取id和元数据，只读取需要的行"""
+        records = []
+        with open(self.records_path, "rb") as f:
+            for row in rows:
+                f.seek(self._offsets[row])
+                records.append(json.loads(f.readline()))
+        return records
+
+    def search_batch(self, queries: Any, k: int = 10) -> List[List[Dict[str, Any]]]:
+        """批量余弦top-k检索，每个查询返回按相似度降序的 [{"row", "id", "score", "metadata"}]"""
+        queries = np.asarray(queries, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        if self.count == 0 or self._matrix is None:
+            return [[] for _ in range(len(queries))]
+        if queries.shape[1] != self.dim:
+            raise ValueError(f"Expected queries of dim {self.dim}, got {queries.shape[1]}")
+        queries = self._normalize(queries)
+        k = min(k, self.count)
+
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        # 分块计算，内存占用只与chunk_rows有关；每块先取局部top-k再与已有结果合并
+        for start in range(0, self.count, self.chunk_rows):
+            end = min(start + self.chunk_rows, self.count)
+            scores = queries @ self._matrix[start:end].T
+            if end - start > k:
+                local = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(scores, local, axis=1)
+            else:
+                local = np.broadcast_to(np.arange(end - start), scores.shape)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            best_rows = np.concatenate([best_rows, local + start], axis=1)
+            if best_scores.shape[1] > k:
+                keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+
+        order = np.argsort(-best_scores, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+
+        results = []
+        for scores, rows in zip(best_scores, best_rows):
+            records = self._records(rows.tolist())
+            results.append([
+                {"row": int(row), "id": record["id"], "score": float(score), "metadata": record["metadata"]}
+                for row, score, record in zip(rows, scores, records)
+            ])
+        return results
+
+    def search(self, query: Any, k: int = 10) -> List[Dict[str, Any]]:
+        """单个查询的余弦top-k检索"""
+        return self.search_batch(np.asarray(query, dtype=np.float32)[None, :], k)[0]
+
+    def get(self, row: int) -> np.ndarray:
+        """读取某一行(归一化后的)向量"""
+        if not 0 <= row < self.count:
+            raise IndexError(row)
+        return np.array(self._matrix[row])
+
+    def close(self):
+        """刷新并释放内存映射"""
+        if self._matrix is not None:
+            self._matrix.flush()
+            self._matrix = None
+
+    def __len__(self) -> int:
+        return self.count
@@ -0,0 +1,24 @@
+"""
+测试公共配置
+把项目根目录和示例目录加入导入路径，并提供不访问网络的假提供商
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "examples", "mcp-tools"))
+sys.path.insert(0, os.path.join(ROOT, "examples", "llm-basics"))
+
+import pytest
+
+from src.core.llm_client import register_provider
+from tests.fakes import FakeLLMClient
+
+
+@pytest.fixture
+def fake_provider():
+    """注册名为fake的提供商，返回其客户端实例"""
+    client = FakeLLMClient()
+    register_provider("fake", lambda: client)
+    return client
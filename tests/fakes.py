@@ -0,0 +1,56 @@
+"""
+测试用的假提供商和工具函数
+"""
+import asyncio
+import time
+from typing import Dict, List, Optional, Any
+
+from src.core.llm_client import BaseLLMClient
+
+
+class FakeLLMClient(BaseLLMClient):
+    """记录调用次数的假提供商，可用delay模拟上游耗时"""
+
+    model = "fake-model"
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls: List[Dict[str, Any]] = []
+        # 不为None时每次调用抛出该异常
+        self.error: Optional[Exception] = None
+        # 不为None时每次响应都请求这些工具调用
+        self.tool_calls: Optional[List[Dict[str, Any]]] = None
+        # 同时在途的调用数及其峰值
+        self.active = 0
+        self.peak = 0
+
+    async def chat_completion(self, messages: List[Dict[str, str]], **kwargs) -> Dict[str, Any]:
+        self.calls.append(kwargs)
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            if self.delay:
+                await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+        if self.error is not None:
+            raise self.error
+        response = {
+            "content": f"reply {len(self.calls)}",
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+            "model": self.model
+        }
+        if self.tool_calls is not None:
+            response["tool_calls"] = self.tool_calls
+        return response
+
+    async def text_completion(self, prompt: str, **kwargs) -> str:
+        return (await self.chat_completion([{"role": "user", "content": prompt}], **kwargs))["content"]
+
+
+def spin(seconds: float) -> float:
+    """占满CPU直到超时，模拟无法中断的计算(进程池工具需要模块级函数)"""
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        pass
+    return seconds
@@ -0,0 +1,73 @@
+import asyncio
+import json
+
+from src.core.batch_job import BatchJob
+
+
+class FlakyClient:
+    """prompt在fail_prompts中时抛出异常，记录收到的prompt"""
+
+    def __init__(self, fail_prompts=()):
+        self.fail_prompts = set(fail_prompts)
+        self.prompts = []
+
+    async def chat_completion(self, messages, **kwargs):
+        prompt = messages[-1]["content"]
+        self.prompts.append(prompt)
+        if prompt in self.fail_prompts:
+            raise RuntimeError(f"upstream failed for {prompt}")
+        return {"content": prompt.upper(), "usage": {"prompt_tokens": 1, "completion_tokens": 1}}
+
+
+def _write_input(path, rows):
+    with open(path, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write((row if isinstance(row, str) else json.dumps(row)) + "\n")
+
+
+def _results(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def test_retry_failed_reruns_rows_below_watermark(tmp_path):
+    input_path, output_path = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    _write_input(input_path, [{"prompt": p} for p in ("a", "b", "c", "d")])
+
+    first = FlakyClient(fail_prompts={"b"})
+    stats = asyncio.run(BatchJob(first, str(input_path), str(output_path), concurrency=1, checkpoint_every=1).run())
+    assert stats["failed"] == 1
+    with open(f"{output_path}.ckpt", encoding="utf-8") as f:
+        # 失败的行也推进了水位线
+        assert json.load(f)["watermark"] == 4
+
+    # 不重试时续跑不会再调用上游
+    idle = FlakyClient()
+    asyncio.run(BatchJob(idle, str(input_path), str(output_path), concurrency=1).run())
+    assert idle.prompts == []
+
+    retry = FlakyClient()
+    stats = asyncio.run(BatchJob(retry, str(input_path), str(output_path), concurrency=1, retry_failed=True).run())
+    assert retry.prompts == ["b"]
+    assert stats["completed"] == 1
+    succeeded = {row["line"] for row in _results(output_path) if row["success"]}
+    assert succeeded == {0, 1, 2, 3}
+
+    # 全部成功后再次重试不会重复调用
+    again = FlakyClient()
+    asyncio.run(BatchJob(again, str(input_path), str(output_path), concurrency=1, retry_failed=True).run())
+    assert again.prompts == []
+
+
+def test_non_object_rows_fail_without_aborting_job(tmp_path):
+    input_path, output_path = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    _write_input(input_path, [{"prompt": "a"}, "[1, 2]", '"x"', "not json", {"prompt": "b"}])
+
+    client = FlakyClient()
+    stats = asyncio.run(BatchJob(client, str(input_path), str(output_path), concurrency=2).run())
+    assert stats["completed"] == 2 and stats["failed"] == 3
+    by_line = {row["line"]: row for row in _results(output_path)}
+    assert by_line[1]["error"] == "Row must be a JSON object"
+    assert by_line[2]["error"] == "Row must be a JSON object"
+    assert by_line[3]["error"].startswith("Invalid JSON")
+    assert sorted(client.prompts) == ["a", "b"]
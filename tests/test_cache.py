@@ -0,0 +1,52 @@
+import asyncio
+
+from src.core.cache import MemoryCache, ResponseCache
+from src.core.llm_client import LLMClient
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+def test_is_cacheable_requires_explicit_zero_temperature():
+    assert ResponseCache.is_cacheable(temperature=0)
+    assert not ResponseCache.is_cacheable()
+    assert not ResponseCache.is_cacheable(temperature=0.7)
+    assert not ResponseCache.is_cacheable(temperature=0, stream=True)
+    assert ResponseCache.is_cacheable(force=True, temperature=1.0)
+
+
+def test_request_without_temperature_bypasses_cache(fake_provider):
+    cache = ResponseCache(persistent=False)
+    client = LLMClient(provider="fake", cache=cache)
+
+    async def run():
+        await client.chat_completion(MESSAGES)
+        await client.chat_completion(MESSAGES)
+
+    asyncio.run(run())
+    assert len(fake_provider.calls) == 2
+    assert cache.bypassed == 2
+    assert cache.misses == 0
+
+
+def test_zero_temperature_request_is_cached(fake_provider):
+    cache = ResponseCache(persistent=False)
+    client = LLMClient(provider="fake", cache=cache)
+
+    async def run():
+        first = await client.chat_completion(MESSAGES, temperature=0)
+        second = await client.chat_completion(MESSAGES, temperature=0)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert len(fake_provider.calls) == 1
+    assert second["cached"] and second["content"] == first["content"]
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryCache(max_entries=2, ttl=None)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
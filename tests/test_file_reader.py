@@ -0,0 +1,70 @@
+import pytest
+
+from src.core import file_reader
+from src.core.file_reader import iter_chunks, read_lines, read_range
+
+LINES = [f"line {i} 行\n" for i in range(1, 101)]
+
+
+@pytest.fixture(params=["small", "mmap"])
+def text_file(request, tmp_path, monkeypatch):
+    """同一份内容分别走整体读入和mmap两条路径"""
+    if request.param == "mmap":
+        monkeypatch.setattr(file_reader, "MMAP_THRESHOLD", 1)
+    path = tmp_path / "log.txt"
+    path.write_text("".join(LINES), encoding="utf-8")
+    return str(path)
+
+
+def test_read_lines_range(text_file):
+    result = read_lines(text_file, 10, 12)
+    assert result["content"] == "".join(LINES[9:12])
+    assert (result["start_line"], result["end_line"], result["lines"]) == (10, 12, 3)
+    assert result["offset"] == len("".join(LINES[:9]).encode("utf-8"))
+    assert not result["eof"]
+
+
+def test_read_lines_to_end_and_past_end(text_file):
+    assert read_lines(text_file, 99)["content"] == "".join(LINES[98:])
+    past = read_lines(text_file, 200)
+    assert past["content"] == "" and past["eof"]
+
+
+def test_read_last_lines(text_file):
+    result = read_lines(text_file, -3)
+    assert result["content"] == "".join(LINES[-3:])
+    assert result["eof"]
+    assert read_lines(text_file, -500)["content"] == "".join(LINES)
+
+
+def test_read_lines_truncates_at_line_boundary(text_file):
+    result = read_lines(text_file, 1, max_bytes=len(LINES[0].encode("utf-8")) * 2 + 3)
+    assert result["truncated"]
+    assert result["content"] == "".join(LINES[:2])
+    assert read_range(text_file, result["next_offset"], 1024)["content"].startswith(LINES[2])
+
+
+def test_read_lines_rejects_zero(text_file):
+    with pytest.raises(ValueError):
+        read_lines(text_file, 0)
+
+
+def test_read_range_skips_split_utf8_characters(tmp_path):
+    path = tmp_path / "utf8.txt"
+    path.write_text("ab中文cd", encoding="utf-8")
+    # "中"占字节2..4，"文"占字节5..7：从字节3开始时跳过续字节
+    result = read_range(str(path), 3, 6)
+    assert (result["content"], result["offset"], result["next_offset"]) == ("文c", 5, 9)
+    # 在"文"中间结束时把半个字符留给下一段
+    result = read_range(str(path), 0, 6)
+    assert (result["content"], result["next_offset"]) == ("ab中", 5)
+    assert read_range(str(path), -2)["content"] == "cd"
+
+
+def test_iter_chunks_reassembles_multibyte_text(tmp_path):
+    path = tmp_path / "utf8.txt"
+    text = "日志内容🙂" * 50
+    path.write_text(text, encoding="utf-8")
+    chunks = list(iter_chunks(str(path), chunk_size=7))
+    assert "".join(chunk["content"] for chunk in chunks) == text
+    assert chunks[-1]["eof"]
@@ -0,0 +1,98 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from config.settings import Settings
+from mcp_server import MCPServer
+from src.core.gateway import Gateway, create_app
+
+
+def _tools() -> MCPServer:
+    server = MCPServer()
+
+    @server.register_tool("echo", "echo", {}, execution="inline")
+    def echo(text: str = ""):
+        return {"text": text}
+
+    @server.register_tool("file_write", "write", {}, execution="inline")
+    def file_write(path: str = ""):
+        raise AssertionError("must not be reachable")
+
+    return server
+
+
+def _client(**options) -> TestClient:
+    return TestClient(create_app(Gateway(default_provider="fake", mcp_server=_tools(), **options)))
+
+
+def _events(body: str):
+    """解析SSE正文，检查每个事件都是一行data加空行"""
+    assert body.endswith("data: [DONE]\n\n")
+    frames = body.split("\n\n")[:-1]
+    assert all(frame.startswith("data: ") and "\n" not in frame for frame in frames)
+    return [json.loads(frame[len("data: "):]) for frame in frames[:-1]]
+
+
+def test_defaults_bind_locally_without_tools(monkeypatch):
+    for name in ("APP_HOST", "GATEWAY_MCP_SERVER", "GATEWAY_API_KEY", "GATEWAY_TOOL_ALLOWLIST"):
+        monkeypatch.delenv(name, raising=False)
+    settings = Settings()
+    assert settings.app_host == "127.0.0.1"
+    assert settings.gateway_mcp_server == ""
+
+
+def test_tools_refused_without_api_key_or_allowlist(fake_provider):
+    with _client(api_key="", tool_allowlist=[]) as client:
+        assert client.get("/v1/tools").status_code == 403
+        assert client.post("/v1/tools/file_write", json={"path": "x"}).status_code == 403
+        response = client.post("/v1/chat/completions", json={
+            "provider": "fake", "messages": [{"role": "user", "content": "hi"}], "mcp_tools": True
+        })
+        assert response.status_code == 403
+    assert fake_provider.calls == []
+
+
+def test_api_key_required_when_configured(fake_provider):
+    with _client(api_key="secret", tool_allowlist=[]) as client:
+        assert client.post("/v1/tools/echo", json={"text": "a"}).status_code == 401
+        assert client.post("/v1/tools/echo", json={"text": "a"},
+                           headers={"Authorization": "Bearer wrong"}).status_code == 401
+        assert client.post("/v1/chat/completions", json={
+            "provider": "fake", "messages": [{"role": "user", "content": "hi"}]
+        }).status_code == 401
+        response = client.post("/v1/tools/echo", json={"text": "a"}, headers={"Authorization": "Bearer secret"})
+        assert response.status_code == 200
+        assert response.json()["result"] == {"text": "a"}
+        assert client.get("/v1/tools", headers={"X-API-Key": "secret"}).status_code == 200
+        assert client.get("/health").status_code == 200
+
+
+def test_allowlist_limits_tools(fake_provider):
+    with _client(api_key="", tool_allowlist=["echo"]) as client:
+        assert list(client.get("/v1/tools").json()) == ["echo"]
+        assert client.post("/v1/tools/echo", json={"text": "b"}).json()["result"] == {"text": "b"}
+        assert client.post("/v1/tools/file_write", json={"path": "x"}).status_code == 403
+
+
+def test_stream_uses_sse_framing(fake_provider):
+    with _client(api_key="", tool_allowlist=[]) as client:
+        response = client.post("/v1/chat/completions", json={
+            "provider": "fake", "stream": True, "messages": [{"role": "user", "content": "hi"}]
+        })
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = _events(response.text)
+    assert [event["type"] for event in events] == ["text", "usage", "done"]
+    assert events[0]["content"] == "reply 1"
+
+
+def test_stream_error_is_sent_as_event(fake_provider):
+    fake_provider.error = ValueError("bad request\nwith newline")
+    with _client(api_key="", tool_allowlist=[]) as client:
+        response = client.post("/v1/chat/completions", json={
+            "provider": "fake", "stream": True, "messages": [{"role": "user", "content": "hi"}]
+        })
+    events = _events(response.text)
+    assert events[-1]["type"] == "error"
+    assert events[-1]["status"] == 400
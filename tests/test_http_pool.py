@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from src.core import http_pool
+
+
+@pytest.fixture(autouse=True)
+def fresh_pools(monkeypatch):
+    monkeypatch.setattr(http_pool, "_http_clients", {})
+    monkeypatch.setattr(http_pool, "_sdk_clients", {})
+
+
+def test_clients_are_shared_per_base_url():
+    first = http_pool.get_http_client("http://example.test/v1")
+    assert http_pool.get_http_client("http://example.test/v1/") is first
+    assert http_pool.get_http_client("http://other.test/v1") is not first
+
+
+def test_sdk_clients_are_created_once_per_key():
+    created = []
+
+    def factory():
+        created.append(object())
+        return created[-1]
+
+    first = http_pool.get_shared_client(("openai", "key", "url"), factory)
+    assert http_pool.get_shared_client(("openai", "key", "url"), factory) is first
+    assert http_pool.get_shared_client(("openai", "other", "url"), factory) is not first
+    assert len(created) == 2
+
+
+def test_close_releases_pools_and_next_get_creates_new_client():
+    async def run():
+        first = http_pool.get_http_client("http://example.test")
+        http_pool.get_shared_client("sdk", object)
+        await http_pool.close_http_clients()
+        assert first.is_closed
+        assert http_pool._sdk_clients == {}
+        second = http_pool.get_http_client("http://example.test")
+        assert second is not first and not second.is_closed
+        await http_pool.close_http_clients()
+
+    asyncio.run(run())
+
+
+def test_warmup_opens_connections_regardless_of_status():
+    async def handle(reader, writer):
+        # keep-alive连接上可能有多个请求，逐个回复404直到客户端断开
+        try:
+            while await reader.readuntil(b"\r\n\r\n"):
+                writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+
+    async def run():
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            opened = await http_pool.warmup(f"http://127.0.0.1:{port}", connections=2)
+        finally:
+            await http_pool.close_http_clients()
+            server.close()
+        # 端口上没有服务时握手失败，不计入
+        refused = await http_pool.warmup(f"http://127.0.0.1:{port}", connections=1)
+        await http_pool.close_http_clients()
+        return opened, refused
+
+    assert asyncio.run(run()) == (2, 0)
@@ -0,0 +1,166 @@
+import asyncio
+import time
+from types import SimpleNamespace as NS
+
+from config.settings import get_settings
+from src.core.llm_client import AnthropicClient, LLMClient, _iter_openai_stream
+
+
+async def _aiter(items):
+    for item in items:
+        yield item
+
+
+async def _collect(stream):
+    return [event async for event in stream]
+
+
+class _Usage(NS):
+    def dict(self):
+        return dict(vars(self))
+
+
+def _chunk(content=None, tool_calls=None, usage=None):
+    choices = [] if content is None and tool_calls is None else [NS(delta=NS(content=content, tool_calls=tool_calls))]
+    return NS(model="gpt-test", choices=choices, usage=usage)
+
+
+def test_openai_stream_normalizes_text_tool_calls_and_usage():
+    call = NS(index=0, id="call_1", function=NS(name="lookup", arguments='{"q": '))
+    rest = NS(index=0, id=None, function=NS(name=None, arguments='"x"}'))
+    chunks = [
+        _chunk(content="Hel"),
+        _chunk(content="lo"),
+        _chunk(tool_calls=[call]),
+        _chunk(tool_calls=[rest]),
+        # include_usage时最后一个chunk只有usage，没有choices
+        _chunk(usage=_Usage(prompt_tokens=5, completion_tokens=3, total_tokens=8,
+                            prompt_tokens_details={"cached_tokens": 4}))
+    ]
+    events = asyncio.run(_collect(_iter_openai_stream(_aiter(chunks), 0.0)))
+    assert [e["type"] for e in events] == ["text", "text", "tool_call_delta", "tool_call_delta", "usage", "done"]
+    assert "".join(e["content"] for e in events if e["type"] == "text") == "Hello"
+    assert events[2]["name"] == "lookup" and events[3]["arguments"] == '"x"}'
+    assert events[4]["usage"]["total_tokens"] == 8
+    assert events[4]["usage"]["cache_read_tokens"] == 4
+    assert events[-1]["model"] == "gpt-test" and events[-1]["ttft"] is not None
+
+
+def test_anthropic_stream_normalizes_events_and_accumulates_usage():
+    usage = NS(input_tokens=10, output_tokens=1, cache_read_input_tokens=6, cache_creation_input_tokens=0)
+    events = [
+        NS(type="message_start", message=NS(model="claude-test", usage=usage)),
+        NS(type="content_block_delta", index=0, delta=NS(type="text_delta", text="Hi")),
+        NS(type="content_block_start", index=1, content_block=NS(type="tool_use", id="tu_1", name="lookup")),
+        NS(type="content_block_delta", index=1, delta=NS(type="input_json_delta", partial_json='{"q": 1}')),
+        NS(type="content_block_stop", index=1),
+        NS(type="message_delta", usage=NS(output_tokens=7))
+    ]
+
+    async def create(**kwargs):
+        return NS(headers={}, parse=lambda: _aiter(events))
+
+    client = AnthropicClient(api_key="test")
+    client.client = NS(messages=NS(with_raw_response=NS(create=create)))
+    result = asyncio.run(_collect(client.stream_chat_completion([{"role": "user", "content": "hi"}])))
+    assert [e["type"] for e in result] == [
+        "text", "tool_call_delta", "tool_call_delta", "tool_call_end", "usage", "done"
+    ]
+    assert result[1]["id"] == "tu_1" and result[2]["arguments"] == '{"q": 1}'
+    assert result[4]["usage"] == {
+        "input_tokens": 10, "output_tokens": 7, "cache_read_tokens": 6, "cache_write_tokens": 0
+    }
+    assert result[-1]["model"] == "claude-test"
+
+
+def test_client_stream_yields_deltas_then_usage_and_done(fake_provider):
+    client = LLMClient(provider="fake")
+    events = asyncio.run(_collect(client.stream_chat_completion([{"role": "user", "content": "hi"}])))
+    assert [e["type"] for e in events] == ["text", "usage", "done"]
+    assert events[0]["content"] == "reply 1"
+    assert events[1]["usage"]["total_tokens"] == 2
+
+
+def test_overlapping_batches_share_provider_concurrency(fake_provider, monkeypatch):
+    monkeypatch.setattr(get_settings(), "llm_batch_concurrency", 3)
+    fake_provider.delay = 0.05
+    client = LLMClient(provider="fake")
+    batch = [[{"role": "user", "content": f"q{i}"}] for i in range(6)]
+
+    async def run():
+        # 两个批次各自的并发都是3，同时进行时总并发仍不超过提供商上限
+        return await asyncio.gather(
+            client.chat_completion_many(batch, concurrency=3),
+            client.chat_completion_many(batch, concurrency=3)
+        )
+
+    first, second = asyncio.run(run())
+    assert all(result["success"] for result in first + second)
+    assert fake_provider.peak == 3
+    assert len(fake_provider.calls) == 12
+
+
+def test_run_tools_executes_calls_in_parallel_and_feeds_results_back(fake_provider):
+    fake_provider.tool_calls = [
+        {"id": "c1", "name": "slow", "arguments": {"n": 1}},
+        {"id": "c2", "name": "slow", "arguments": {"n": 2}}
+    ]
+    client = LLMClient(provider="fake")
+
+    async def executor(name, arguments):
+        # 第二轮模型不再调用工具
+        fake_provider.tool_calls = None
+        await asyncio.sleep(0.2)
+        return {"success": True, "result": arguments["n"] * 10}
+
+    async def run():
+        start = time.monotonic()
+        response = await client.run_tools([{"role": "user", "content": "hi"}], [], executor)
+        return response, time.monotonic() - start
+
+    response, elapsed = asyncio.run(run())
+    assert elapsed < 0.35
+    assert response["tool_rounds"] == 1
+    assert response["content"] == "reply 2"
+    roles = [msg["role"] for msg in response["messages"]]
+    assert roles == ["user", "assistant", "tool", "tool"]
+    assert [msg["tool_call_id"] for msg in response["messages"][2:]] == ["c1", "c2"]
+    assert '"result": 20' in response["messages"][3]["content"]
+
+
+def test_run_tools_returns_unexecuted_calls_at_max_rounds(fake_provider):
+    fake_provider.tool_calls = [{"id": "c1", "name": "echo", "arguments": {}}]
+    client = LLMClient(provider="fake")
+
+    async def executor(name, arguments):
+        return "ok"
+
+    response = asyncio.run(client.run_tools([{"role": "user", "content": "hi"}], [], executor, max_rounds=1))
+    assert response["tool_rounds"] == 1
+    assert response["tool_calls"][0]["id"] == "c1"
+    assert len(fake_provider.calls) == 2
+
+
+def test_stream_tools_stops_reporting_tool_calls_after_max_rounds(fake_provider):
+    fake_provider.tool_calls = [{"id": "call_1", "name": "echo", "arguments": {"x": 1}}]
+    client = LLMClient(provider="fake")
+    executed = []
+
+    async def executor(name, arguments):
+        executed.append(name)
+        return {"success": True, "result": arguments}
+
+    async def run():
+        return [event async for event in client.stream_tools(
+            [{"role": "user", "content": "hi"}], [], executor, max_rounds=2
+        )]
+
+    events = asyncio.run(run())
+    types = [event["type"] for event in events]
+    assert types.count("tool_call") == 2
+    assert len(executed) == 2
+    assert types[-2:] == ["max_rounds", "done"]
+    assert events[-2]["tool_calls"][0]["id"] == "call_1"
+    # max_rounds之后没有tool_call事件
+    assert "tool_call" not in types[types.index("max_rounds"):]
+    assert events[-1]["tool_rounds"] == 2
@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from src.core.llm_client import LLMClient
+from src.core.scheduler import DeadlineExceeded
+
+
+def test_identical_requests_coalesce(fake_provider):
+    fake_provider.delay = 0.05
+    client = LLMClient(provider="fake", coalesce=True)
+    messages = [{"role": "user", "content": "coalesce me"}]
+
+    async def run():
+        return await asyncio.gather(*(client.chat_completion(messages) for _ in range(3)))
+
+    responses = asyncio.run(run())
+    assert len(fake_provider.calls) == 1
+    assert len({response["content"] for response in responses}) == 1
+
+
+def test_deadline_request_does_not_wait_on_batch_leader(fake_provider):
+    fake_provider.delay = 0.5
+    client = LLMClient(provider="fake", coalesce=True)
+    messages = [{"role": "user", "content": "shared prompt"}]
+
+    async def run():
+        leader = asyncio.ensure_future(client.chat_completion(messages, priority="batch"))
+        await asyncio.sleep(0.01)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        with pytest.raises(DeadlineExceeded):
+            await client.chat_completion(messages, priority="interactive", deadline=0.1)
+        elapsed = loop.time() - start
+        await leader
+        return elapsed
+
+    elapsed = asyncio.run(run())
+    assert elapsed < 0.3
+    assert len(fake_provider.calls) == 2
+
+
+def test_different_priorities_do_not_coalesce(fake_provider):
+    fake_provider.delay = 0.05
+    client = LLMClient(provider="fake", coalesce=True)
+    messages = [{"role": "user", "content": "priority split"}]
+
+    async def run():
+        await asyncio.gather(
+            client.chat_completion(messages, priority="batch"),
+            client.chat_completion(messages, priority="interactive")
+        )
+
+    asyncio.run(run())
+    assert len(fake_provider.calls) == 2
@@ -0,0 +1,76 @@
+import asyncio
+import threading
+
+from mcp_client import MCPClient, SyncBridge
+from mcp_server import MCPServer
+
+
+async def _loop_thread():
+    return threading.current_thread()
+
+
+def test_bridge_reuses_one_background_loop():
+    bridge = SyncBridge()
+    try:
+        first = bridge.run(_loop_thread())
+        assert bridge.run(_loop_thread()) is first
+        assert first is not threading.current_thread()
+    finally:
+        bridge.close()
+    assert not first.is_alive()
+
+
+def test_bridge_runs_from_inside_a_running_loop():
+    bridge = SyncBridge()
+
+    async def caller():
+        # 已有事件循环的线程中同步调用，不能用asyncio.run，但桥接器可以
+        return bridge.run(asyncio.sleep(0.01, result="done"))
+
+    try:
+        assert asyncio.run(caller()) == "done"
+    finally:
+        bridge.close()
+
+
+def test_bridge_rejects_calls_from_its_own_loop():
+    bridge = SyncBridge()
+
+    async def reentrant():
+        coro = asyncio.sleep(0)
+        try:
+            bridge.run(coro)
+        except RuntimeError as e:
+            return str(e)
+
+    try:
+        assert "bridge loop thread" in bridge.run(reentrant())
+    finally:
+        bridge.close()
+
+
+def test_bridge_restarts_after_close():
+    bridge = SyncBridge()
+    first = bridge.run(_loop_thread())
+    bridge.close()
+    try:
+        second = bridge.run(_loop_thread())
+        assert second is not first and second.is_alive()
+    finally:
+        bridge.close()
+
+
+def test_call_tool_sync_inside_running_loop():
+    server = MCPServer()
+    server.register_tool("add", "add", {})(lambda a, b: a + b)
+    client = MCPClient(server)
+
+    async def caller():
+        return client.call_tool_sync("add", {"a": 1, "b": 2}, timeout=5)
+
+    try:
+        response = asyncio.run(caller())
+    finally:
+        server.shutdown()
+    assert response["success"] is True
+    assert response["result"] == 3
@@ -0,0 +1,131 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from mcp_server import MCPServer, _list_files_paths, list_files, mcp_server
+from tests.fakes import spin
+
+
+def test_calculator_rejects_nested_power_before_running():
+    async def run():
+        start = time.monotonic()
+        response = await mcp_server.call_tool("calculator", {"expression": "(9**9999)**9999"})
+        assert time.monotonic() - start < 2
+        return response
+
+    try:
+        response = asyncio.run(run())
+    finally:
+        mcp_server.shutdown()
+    assert response["success"] is True
+    assert "结果过大" in response["result"]["error"]
+    assert mcp_server.tools["calculator"].bulkhead.stats()["active"] == 0
+
+
+@pytest.mark.parametrize("expression, expected", [
+    ("2**10000 // 2**9999", 2),
+    ("(2**100)**100 - 2**10000", 0),
+    ("2**-2", 0.25),
+])
+def test_calculator_allows_bounded_powers(expression, expected):
+    from mcp_server import calculator
+    assert calculator(expression)["result"] == expected
+
+
+def test_process_tool_timeout_frees_bulkhead_slot():
+    server = MCPServer(process_workers=2)
+    server.register_tool("spin", "busy loop", {}, execution="process", timeout=0.3,
+                         max_concurrency=2, max_queue=0)(spin)
+
+    async def run():
+        first = await server.call_tool("spin", {"seconds": 60})
+        assert first["reason"] == "timeout"
+        for _ in range(50):
+            if server.pool_stats()["bulkheads"]["spin"]["active"] == 0:
+                break
+            await asyncio.sleep(0.02)
+        assert server.pool_stats()["bulkheads"]["spin"]["active"] == 0
+        assert server.pool_stats()["process"]["spin"]["inflight"] == 0
+        second = await server.call_tool("spin", {"seconds": 0.01})
+        assert second["success"] is True
+        assert second["result"] == 0.01
+
+    try:
+        asyncio.run(run())
+    finally:
+        start = time.monotonic()
+        server.shutdown()
+        assert time.monotonic() - start < 2
+
+
+def test_process_tool_timeout_does_not_kill_other_tools():
+    server = MCPServer(process_workers=2)
+    server.register_tool("runaway", "busy loop", {}, execution="process", timeout=0.2)(spin)
+    server.register_tool("spin", "busy loop", {}, execution="process", timeout=5)(spin)
+
+    async def run():
+        other = asyncio.ensure_future(server.call_tool("spin", {"seconds": 0.6}))
+        await asyncio.sleep(0.1)
+        result = await server.call_tool("runaway", {"seconds": 60})
+        assert result["reason"] == "timeout"
+        assert (await other)["result"] == 0.6
+        stats = server.pool_stats()["process"]
+        assert stats["runaway"]["killed"] == 1
+        assert stats["spin"]["killed"] == 0
+        assert stats["spin"]["retried"] == 0
+
+    try:
+        asyncio.run(run())
+    finally:
+        server.shutdown()
+
+
+def test_list_files_cache_follows_glob_directory(tmp_path, monkeypatch):
+    # list_files只接受相对路径
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "a.txt").write_text("a")
+    server = MCPServer()
+    server.register_tool("list_files", "list", {}, execution="thread",
+                         cache="fs", cache_paths=_list_files_paths)(list_files)
+
+    async def names(pattern):
+        response = await server.call_tool("list_files", {"directory": ".", "pattern": pattern})
+        return sorted(f["name"] for f in response["result"]["files"]), response.get("cached", False)
+
+    async def run():
+        assert await names("sub/*.txt") == (["a.txt"], False)
+        assert await names("sub/*.txt") == (["a.txt"], True)
+        # 子目录中新增文件只改变子目录的mtime
+        (tmp_path / "sub" / "b.txt").write_text("b")
+        assert await names("sub/*.txt") == (["a.txt", "b.txt"], False)
+        # 递归模式无法确定依赖的目录，不缓存
+        assert await names("**/*.txt") == (["a.txt", "b.txt"], False)
+        assert await names("**/*.txt") == (["a.txt", "b.txt"], False)
+
+    try:
+        asyncio.run(run())
+    finally:
+        server.shutdown()
+
+
+def test_fs_cache_lookup_runs_off_event_loop(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    server = MCPServer()
+    server.register_tool("list_files", "list", {}, execution="thread",
+                         cache="fs", cache_paths=_list_files_paths)(list_files)
+    threads = []
+    lookup = server.cache.lookup
+
+    def recording_lookup(*args):
+        threads.append(threading.current_thread())
+        return lookup(*args)
+
+    monkeypatch.setattr(server.cache, "lookup", recording_lookup)
+    try:
+        asyncio.run(server.call_tool("list_files", {}))
+    finally:
+        server.shutdown()
+    assert threads and threads[0] is not threading.main_thread()
@@ -0,0 +1,158 @@
+import asyncio
+import contextlib
+
+import pytest
+
+from mcp_server import MCPServer
+from mcp_transport import METHOD_NOT_FOUND, STREAM_WINDOW, JSONRPCClient, JSONRPCError, JSONRPCServer
+
+TOTAL = 100
+
+
+def _server(produced):
+    server = MCPServer()
+
+    @server.register_tool("echo", "echo", {}, execution="inline")
+    def echo(text: str = ""):
+        return text
+
+    @server.register_tool("blob", "stream of chunks", {})
+    async def blob():
+        return None
+
+    @server.register_stream("blob")
+    async def blob_stream():
+        for index in range(TOTAL):
+            produced.append(index)
+            yield f"chunk {index}"
+
+    return server
+
+
+@contextlib.asynccontextmanager
+async def _connected(produced):
+    rpc = JSONRPCServer(_server(produced))
+    listener = await rpc.start_tcp("127.0.0.1", 0)
+    port = listener.sockets[0].getsockname()[1]
+    client = await JSONRPCClient.connect(f"tcp://127.0.0.1:{port}")
+    try:
+        yield client
+    finally:
+        await client.close()
+        await rpc.close()
+
+
+def test_slow_stream_consumer_is_limited_to_its_window():
+    produced = []
+
+    async def run():
+        async with _connected(produced) as client:
+            stream = client.stream("tools/stream", {"name": "blob"})
+            assert await stream.__anext__() == "chunk 0"
+            await asyncio.sleep(0.2)
+            # 服务器只发送客户端授予的额度，客户端缓存不超过一个窗口
+            assert len(produced) <= STREAM_WINDOW + 1
+            assert max(queue.qsize() for queue in client._streams.values()) <= STREAM_WINDOW
+            # 慢的流不影响同一连接上的其他请求
+            assert await asyncio.wait_for(client.request("ping"), 2) == "pong"
+            rest = [chunk async for chunk in stream]
+            assert len(rest) == TOTAL - 1
+
+    asyncio.run(run())
+
+
+def test_requests_inside_stream_loop_do_not_deadlock():
+    async def run():
+        async with _connected([]) as client:
+            processed = 0
+            async for chunk in client.stream("tools/stream", {"name": "blob"}):
+                result = await client.request("tools/call", {"name": "echo", "arguments": {"text": chunk}})
+                assert result["result"] == chunk
+                processed += 1
+            return processed
+
+    assert asyncio.run(asyncio.wait_for(run(), 20)) == TOTAL
+
+
+def test_abandoned_stream_is_cancelled_on_server():
+    produced = []
+
+    async def run():
+        async with _connected(produced) as client:
+            stream = client.stream("tools/stream", {"name": "blob"})
+            await stream.__anext__()
+            await stream.aclose()
+            assert await asyncio.wait_for(client.request("ping"), 5) == "pong"
+            await asyncio.sleep(0.1)
+            stopped_at = len(produced)
+            await asyncio.sleep(0.1)
+            assert len(produced) == stopped_at < TOTAL
+
+    asyncio.run(run())
+
+
+
+
+def test_pipelined_requests_complete_out_of_order():
+    server = MCPServer()
+
+    @server.register_tool("sleep", "sleep", {})
+    async def sleep(seconds: float):
+        await asyncio.sleep(seconds)
+        return seconds
+
+    async def run():
+        rpc = JSONRPCServer(server)
+        listener = await rpc.start_tcp("127.0.0.1", 0)
+        client = await JSONRPCClient.connect(f"tcp://127.0.0.1:{listener.sockets[0].getsockname()[1]}")
+        try:
+            finished = []
+
+            async def call(seconds):
+                await client.request("tools/call", {"name": "sleep", "arguments": {"seconds": seconds}})
+                finished.append(seconds)
+
+            start = asyncio.get_running_loop().time()
+            await asyncio.gather(call(0.3), call(0.1), call(0.2))
+            elapsed = asyncio.get_running_loop().time() - start
+        finally:
+            await client.close()
+            await rpc.close()
+        return finished, elapsed
+
+    finished, elapsed = asyncio.run(run())
+    # 同一连接上的请求并发执行，按完成顺序返回
+    assert finished == [0.1, 0.2, 0.3]
+    assert elapsed < 0.55
+
+
+def test_error_response_does_not_disturb_concurrent_requests(tmp_path):
+    server = MCPServer()
+
+    @server.register_tool("sleep", "sleep", {})
+    async def sleep(seconds: float):
+        await asyncio.sleep(seconds)
+        return seconds
+
+    async def run():
+        rpc = JSONRPCServer(server)
+        path = str(tmp_path / "mcp.sock")
+        await rpc.start_unix(path)
+        client = await JSONRPCClient.connect(f"unix://{path}")
+        try:
+            slow = asyncio.ensure_future(
+                client.request("tools/call", {"name": "sleep", "arguments": {"seconds": 0.2}})
+            )
+            with pytest.raises(JSONRPCError) as error:
+                await client.request("no/such/method")
+            assert not slow.done()
+            return error.value.code, await slow
+        finally:
+            await client.close()
+            await rpc.close()
+
+    code, response = asyncio.run(run())
+    assert code == METHOD_NOT_FOUND
+    assert response["success"] is True
+    assert response["result"] == 0.2
+
@@ -0,0 +1,78 @@
+import pytest
+
+from src.core import metrics
+from src.core.metrics import MetricsRegistry
+
+
+def test_counter_and_gauge_render_prometheus_text():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests", ("provider",))
+    requests.inc(("openai",))
+    requests.labels(provider="openai").inc(2)
+    depth = registry.gauge("queue_depth", "Queued \"items\"")
+    depth.set((), 3)
+    depth.inc((), -1)
+
+    text = registry.render_prometheus()
+    assert text.endswith("\n")
+    lines = text.splitlines()
+    assert lines[:3] == [
+        "# HELP requests_total Requests",
+        "# TYPE requests_total counter",
+        'requests_total{provider="openai"} 3'
+    ]
+    assert '# HELP queue_depth Queued \\"items\\"' in lines
+    assert "queue_depth 2" in lines
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    latency = registry.histogram("latency_seconds", "Latency", ("tool",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        latency.observe(("calc",), value)
+
+    lines = registry.render_prometheus().splitlines()
+    assert 'latency_seconds_bucket{tool="calc",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{tool="calc",le="1"} 3' in lines
+    assert 'latency_seconds_bucket{tool="calc",le="+Inf"} 4' in lines
+    assert 'latency_seconds_sum{tool="calc"} 6.05' in lines
+    assert 'latency_seconds_count{tool="calc"} 4' in lines
+
+    sample = registry.snapshot()["latency_seconds"]["samples"][0]
+    assert sample["count"] == 4
+    assert sample["p50"] == pytest.approx(0.55)
+    assert sample["p99"] == 1.0
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry()
+    registry.counter("errors_total", "Errors", ("type",)).inc(('say "hi"\n',))
+    assert 'errors_total{type="say \\"hi\\"\\n"} 1' in registry.render_prometheus()
+
+
+def test_registry_returns_existing_metric_and_rejects_type_clash():
+    registry = MetricsRegistry()
+    first = registry.counter("calls_total", "Calls")
+    assert registry.counter("calls_total", "Calls") is first
+    with pytest.raises(ValueError):
+        registry.gauge("calls_total", "Calls")
+    with pytest.raises(ValueError):
+        registry.counter("by_tool", "Calls", ("tool",)).labels(provider="x")
+    with pytest.raises(ValueError):
+        first.inc((), -1)
+
+
+def test_record_llm_usage_counts_tokens_by_direction():
+    def tokens(direction):
+        return next(
+            (s["value"] for s in metrics.llm_tokens.collect()
+             if s["labels"] == {"provider": "metrics-test", "model": "m", "direction": direction}),
+            0
+        )
+
+    metrics.record_llm_usage("metrics-test", "m", {
+        "input_tokens": 10, "output_tokens": 4, "cache_read_tokens": 6, "cache_write_tokens": 0
+    }, latency=2.0)
+    assert (tokens("input"), tokens("output"), tokens("cache_read"), tokens("cache_write")) == (10, 4, 6, 0)
+    throughput = [s for s in metrics.llm_tokens_per_second.collect() if s["labels"]["provider"] == "metrics-test"]
+    assert throughput[0]["sum"] == 2.0
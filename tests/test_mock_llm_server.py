@@ -0,0 +1,83 @@
+import asyncio
+import random
+
+import httpx
+import pytest
+
+from mock_llm_server import LatencyDistribution, MockConfig, MockLLMServer
+from src.core import http_pool
+from src.core.llm_client import AnthropicClient, OpenAIClient
+
+TOOLS = [{"name": "lookup", "description": "look up", "parameters": {"type": "object", "properties": {}}}]
+
+
+def _run(config, body):
+    """启动模拟服务器执行body(server)，结束后关闭共享连接池(绑定在本次事件循环上)"""
+    async def run():
+        server = await MockLLMServer(config).start()
+        try:
+            return await body(server)
+        finally:
+            await http_pool.close_http_clients()
+            await server.stop()
+
+    return asyncio.run(run())
+
+
+def _fast(**overrides):
+    return MockConfig(ttft=LatencyDistribution("fixed", 1), tokens_per_second=0, output_tokens=4, seed=1, **overrides)
+
+
+def test_latency_distribution_parse_and_sample():
+    dist = LatencyDistribution.parse("uniform:10,20")
+    assert (dist.kind, dist.a, dist.b) == ("uniform", 10, 20)
+    assert all(0.01 <= dist.sample(random.Random(i)) <= 0.02 for i in range(20))
+    assert LatencyDistribution.parse("fixed:5").sample(random.Random()) == 0.005
+    with pytest.raises(ValueError):
+        LatencyDistribution.parse("zipf:1")
+
+
+def test_openai_client_chat_and_stream_against_mock():
+    async def body(server):
+        client = OpenAIClient(api_key="test", base_url=f"{server.base_url}/v1")
+        response = await client.chat_completion([{"role": "user", "content": "hi"}])
+        events = [e async for e in client.stream_chat_completion([{"role": "user", "content": "hi"}])]
+        return response, events
+
+    response, events = _run(_fast(), body)
+    assert response["content"] == "tok0 tok1 tok2 tok3 "
+    assert response["usage"]["completion_tokens"] == 4
+    assert "".join(e["content"] for e in events if e["type"] == "text") == "tok0 tok1 tok2 tok3 "
+    assert [e for e in events if e["type"] == "usage"][0]["usage"]["completion_tokens"] == 4
+    assert events[-1]["type"] == "done" and events[-1]["ttft"] is not None
+
+
+def test_anthropic_stream_with_tool_calls_against_mock():
+    async def body(server):
+        client = AnthropicClient(api_key="test", base_url=server.base_url)
+        return [e async for e in client.stream_chat_completion(
+            [{"role": "user", "content": "hi"}], tools=TOOLS, max_tokens=16
+        )]
+
+    events = _run(_fast(tool_calls=1), body)
+    types = [e["type"] for e in events]
+    assert types.count("text") == 4
+    assert "tool_call_end" in types
+    start = next(e for e in events if e["type"] == "tool_call_delta" and e.get("name"))
+    assert start["name"] == "lookup"
+    assert [e for e in events if e["type"] == "usage"][0]["usage"]["output_tokens"] == 4
+
+
+def test_injected_rate_limit_carries_retry_after():
+    async def body(server):
+        async with httpx.AsyncClient(base_url=server.base_url) as client:
+            response = await client.post("/v1/chat/completions", json={"messages": []})
+            missing = await client.post("/v1/unknown", json={})
+        return response, missing, server
+
+    response, missing, server = _run(_fast(error_rate_429=1.0, retry_after=2.5), body)
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "2.5"
+    assert response.json()["error"]["code"] == "rate_limit_exceeded"
+    assert missing.status_code == 404
+    assert server.status_counts == {429: 1, 404: 1}
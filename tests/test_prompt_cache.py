@@ -0,0 +1,84 @@
+import json
+from types import SimpleNamespace as NS
+
+from src.core import prompt_cache
+from src.core.llm_client import AnthropicClient
+from src.core.prompt_cache import EPHEMERAL
+
+TOOLS = [
+    {"name": "a", "description": "first", "parameters": {"type": "object", "properties": {}}},
+    {"name": "b", "description": "second", "parameters": {"type": "object", "properties": {}}}
+]
+
+MESSAGES = [
+    {"role": "system", "content": "You are helpful."},
+    {"role": "system", "content": "Answer briefly."},
+    {"role": "user", "content": "hi"},
+    {"role": "assistant", "content": "hello"},
+    {"role": "user", "content": "again"}
+]
+
+
+def _anthropic_kwargs(mode):
+    client = AnthropicClient(api_key="test")
+    return client._build_create_kwargs(MESSAGES, tools=TOOLS, prompt_cache=mode)
+
+
+def _marked(blocks):
+    return [i for i, block in enumerate(blocks) if block.get("cache_control") == EPHEMERAL]
+
+
+def test_prefix_mode_marks_last_tool_and_system_block_only():
+    kwargs = _anthropic_kwargs("prefix")
+    assert _marked(kwargs["tools"]) == [1]
+    assert [block["text"] for block in kwargs["system"]] == ["You are helpful.", "Answer briefly."]
+    assert _marked(kwargs["system"]) == [1]
+    assert all(isinstance(msg["content"], str) for msg in kwargs["messages"])
+
+
+def test_conversation_mode_also_marks_last_message():
+    kwargs = _anthropic_kwargs("conversation")
+    last = kwargs["messages"][-1]
+    assert _marked(last["content"]) == [0]
+    assert last["content"][0]["text"] == "again"
+    # 之前的消息保持不变，断点总数不超过Anthropic的上限(4个)
+    assert kwargs["messages"][0]["content"] == "hi"
+    assert json.dumps(kwargs).count("cache_control") == 3
+
+
+def test_off_mode_adds_no_markers():
+    kwargs = _anthropic_kwargs("off")
+    assert kwargs["system"] == "You are helpful.\n\nAnswer briefly."
+    assert "cache_control" not in json.dumps(kwargs)
+
+
+def test_marking_does_not_mutate_inputs():
+    tools = [dict(tool) for tool in TOOLS]
+    prompt_cache.mark_anthropic_tools(tools, "prefix")
+    assert all("cache_control" not in tool for tool in tools)
+    messages = [{"role": "user", "content": [{"type": "text", "text": "x"}]}]
+    prompt_cache.mark_anthropic_messages(messages, "conversation")
+    assert "cache_control" not in messages[0]["content"][0]
+
+
+def test_stable_messages_serialize_identically():
+    first = [{"content": "hi", "role": "user", "extra": 1}]
+    second = [{"extra": 1, "role": "user", "content": "hi"}]
+    assert json.dumps(prompt_cache.stable_messages(first)) == json.dumps(prompt_cache.stable_messages(second))
+    assert list(prompt_cache.stable_messages(first)[0]) == ["role", "content", "extra"]
+
+
+def test_openrouter_marks_only_anthropic_models():
+    messages = [{"role": "system", "content": "sys"}, {"role": "user", "content": "hi"}]
+    assert prompt_cache.mark_openrouter_messages(messages, "openai/gpt-4o", "prefix") is messages
+    marked = prompt_cache.mark_openrouter_messages(messages, "anthropic/claude-3.5-sonnet", "prefix")
+    assert _marked(marked[0]["content"]) == [0]
+    assert marked[1]["content"] == "hi"
+
+
+def test_cache_usage_fields():
+    usage = prompt_cache.cache_usage_openai({"prompt_tokens": 10, "prompt_tokens_details": {"cached_tokens": 8}})
+    assert (usage["cache_read_tokens"], usage["cache_write_tokens"]) == (8, 0)
+    assert prompt_cache.cache_usage_anthropic(
+        NS(cache_read_input_tokens=None, cache_creation_input_tokens=12)
+    ) == (0, 12)
@@ -0,0 +1,101 @@
+import asyncio
+import time
+
+import pytest
+
+from config.settings import get_settings
+from src.core import rate_limiter
+from src.core.llm_client import LLMClient, RateLimitError
+from src.core.rate_limiter import AdaptiveRateLimiter, TokenBucket
+
+
+class FakeClock:
+    """可手动推进的monotonic时钟"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter, "time", clock)
+    return clock
+
+
+def test_bucket_allows_burst_then_waits(clock):
+    bucket = TokenBucket(60)
+    for _ in range(60):
+        assert bucket.delay_for(1) == 0
+        bucket.consume(1)
+    # 每分钟60个令牌，桶空后每秒补充一个
+    assert bucket.delay_for(1) == pytest.approx(1.0)
+
+
+def test_bucket_refills_up_to_capacity(clock):
+    bucket = TokenBucket(60)
+    bucket.consume(60)
+    clock.now += 30
+    assert bucket.delay_for(30) == 0
+    clock.now += 3600
+    bucket.delay_for(1)
+    assert bucket.tokens == 60
+
+
+def test_capacity_from_headers_on_unlimited_bucket_starts_full(clock):
+    limiter = AdaptiveRateLimiter("test", requests_per_minute=0, tokens_per_minute=0)
+    limiter.update_from_headers({"x-ratelimit-limit-requests": "100"})
+    assert limiter.requests.tokens == 100
+    assert limiter.requests.delay_for(1) == 0
+    limiter.update_from_headers({
+        "x-ratelimit-limit-tokens": "50000",
+        "x-ratelimit-remaining-tokens": "1200"
+    })
+    assert limiter.tokens.tokens == 1200
+
+
+def test_rate_limited_cools_down_before_next_request():
+    limiter = AdaptiveRateLimiter("test", requests_per_minute=0, tokens_per_minute=0, max_concurrency=4)
+
+    async def run():
+        limiter.on_rate_limited(retry_after=0.2)
+        start = time.monotonic()
+        async with limiter.slot():
+            pass
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) >= 0.18
+    assert limiter.rate_limited_count == 1
+
+
+def test_aimd_halves_on_429_and_grows_additively():
+    limiter = AdaptiveRateLimiter("test", requests_per_minute=0, tokens_per_minute=0, max_concurrency=8)
+    limiter.on_rate_limited(retry_after=0)
+    assert limiter.concurrency_limit == 4
+    limiter.on_rate_limited(retry_after=0)
+    assert limiter.concurrency_limit == 2
+    # 每次成功增加1/limit，约limit次成功后上限加1
+    limiter.on_success()
+    assert limiter.concurrency_limit == pytest.approx(2.5)
+    for _ in range(100):
+        limiter.on_success()
+    assert limiter.concurrency_limit == 8
+
+
+def test_rate_limit_response_headers_calibrate_limiter(fake_provider, monkeypatch):
+    monkeypatch.setattr(rate_limiter, "_rate_limiters", {})
+    monkeypatch.setattr(get_settings(), "llm_rate_limit_max_retries", 0)
+    fake_provider.error = RateLimitError("429", retry_after=0.01, headers={
+        "x-ratelimit-limit-requests": "100",
+        "x-ratelimit-remaining-requests": "7"
+    })
+    client = LLMClient(provider="fake", rate_limit=True)
+
+    with pytest.raises(RateLimitError):
+        asyncio.run(client.chat_completion([{"role": "user", "content": "hi"}]))
+    limiter = client.client.rate_limiter
+    assert limiter.requests.capacity == 100
+    assert limiter.requests.tokens == pytest.approx(7, abs=0.1)
@@ -0,0 +1,103 @@
+import asyncio
+
+import fakeredis
+import pytest
+
+from src.core.cache import ResponseCache
+from src.core.redis_backend import RedisCache, RedisRateLimiter
+
+
+def _workers(count):
+    """共享同一个Redis服务器的多个客户端，模拟多个worker进程"""
+    server = fakeredis.FakeServer()
+    return [fakeredis.FakeAsyncRedis(server=server) for _ in range(count)]
+
+
+def test_redis_cache_round_trip_and_batch_ops():
+    async def run():
+        client, = _workers(1)
+        cache = RedisCache(client=client, prefix="t:cache:", ttl=60)
+        await cache.set("a", {"content": "x"})
+        await cache.set_many({"b": {"content": "y"}, "c": [1, 2]})
+        assert await cache.get("a") == {"content": "x"}
+        assert await cache.get_many(["a", "missing", "c"]) == [{"content": "x"}, None, [1, 2]]
+        assert 0 < await client.pttl("t:cache:b") <= 60000
+        await cache.clear()
+        assert await cache.get_many(["a", "b", "c"]) == [None, None, None]
+
+    asyncio.run(run())
+
+
+def test_redis_cache_entries_expire():
+    async def run():
+        client, = _workers(1)
+        cache = RedisCache(client=client, prefix="t:cache:", ttl=0.05)
+        await cache.set("a", 1)
+        await asyncio.sleep(0.1)
+        return await cache.get("a")
+
+    assert asyncio.run(run()) is None
+
+
+def test_response_cache_shares_entries_across_workers():
+    async def run():
+        first, second = _workers(2)
+        writer = ResponseCache(backend="redis", redis_client=first, ttl=60)
+        reader = ResponseCache(backend="redis", redis_client=second, ttl=60)
+        await writer.set("k1", {"content": "cached"})
+        assert await reader.prefetch(["k1", "k2", "k1"]) == 1
+        assert await reader.get("k1") == {"content": "cached"}
+        assert reader.stats()["memory_hits"] == 1
+        await writer.remote.clear()
+
+    asyncio.run(run())
+
+
+def _limiter(client, rpm=0, tpm=0):
+    return RedisRateLimiter("redis-test", client=client, requests_per_minute=rpm, tokens_per_minute=tpm)
+
+
+async def _acquire_delay(limiter, tokens=0):
+    return float(await limiter._acquire(
+        keys=[limiter.requests_key, limiter.tokens_key, limiter.blocked_key],
+        args=[limiter.requests.capacity, limiter.tokens.capacity, tokens]
+    ))
+
+
+def test_request_bucket_is_shared_between_workers():
+    async def run():
+        first, second = (_limiter(client, rpm=2) for client in _workers(2))
+        assert await _acquire_delay(first) == 0
+        assert await _acquire_delay(second) == 0
+        # 两个worker合计用完每分钟2次的配额，下一次要等约30秒补充一个令牌
+        delay = await _acquire_delay(first)
+        assert 29 < delay <= 30
+
+    asyncio.run(run())
+
+
+def test_token_bucket_rejects_without_consuming_either_bucket():
+    async def run():
+        client, = _workers(1)
+        limiter = _limiter(client, rpm=10, tpm=100)
+        assert await _acquire_delay(limiter, 80) == 0
+        assert await _acquire_delay(limiter, 50) > 0
+        # TPM不足时请求桶也没有被扣除
+        assert float(await client.hget(limiter.requests_key, "tokens")) == pytest.approx(9, abs=0.01)
+        assert await _acquire_delay(limiter, 20) == 0
+
+    asyncio.run(run())
+
+
+def test_rate_limit_cooldown_and_header_sync_are_shared():
+    async def run():
+        first, second = (_limiter(client, rpm=100) for client in _workers(2))
+        first.on_rate_limited(retry_after=5, headers={"x-ratelimit-remaining-requests": "3"})
+        await asyncio.gather(*first._background)
+        # 另一个worker也进入冷却，共享的剩余额度按响应头校准
+        assert 4 < await _acquire_delay(second) <= 5
+        stats = await second.shared_stats()
+        assert stats["shared_requests_available"] == pytest.approx(3, abs=0.1)
+        assert stats["shared_blocked_for"] > 4
+
+    asyncio.run(run())
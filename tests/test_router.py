@@ -0,0 +1,154 @@
+import asyncio
+
+import pytest
+
+from src.core.llm_client import register_provider
+from src.core.router import CircuitBreaker, LatencyTracker, RouterClient
+from tests.fakes import FakeLLMClient
+
+
+class AlternatingClient(FakeLLMClient):
+    """奇数次调用成功、偶数次调用失败"""
+
+    async def chat_completion(self, messages, **kwargs):
+        response = await super().chat_completion(messages, **kwargs)
+        if len(self.calls) % 2 == 0:
+            raise RuntimeError("upstream 500")
+        return response
+
+
+def _router():
+    register_provider("alternating", AlternatingClient)
+    router = RouterClient(providers=["alternating"], hedge=False)
+    # 连续失败阈值不会被触发，只有错误率能打开熔断器
+    router.breakers["alternating"].failure_threshold = 100
+    return router
+
+
+async def _stream_once(router):
+    return [delta async for delta in router.stream_chat_completion([{"role": "user", "content": "hi"}])]
+
+
+def test_stream_failures_trip_breaker_on_error_rate():
+    router = _router()
+    for _ in range(3):
+        asyncio.run(_stream_once(router))
+        with pytest.raises(RuntimeError):
+            asyncio.run(_stream_once(router))
+    assert router.trackers["alternating"].error_rate == 0.5
+    assert router.breakers["alternating"].state == "open"
+
+
+def test_chat_failures_trip_breaker_on_error_rate():
+    router = _router()
+    messages = [{"role": "user", "content": "hi"}]
+    for _ in range(3):
+        asyncio.run(router.chat_completion(messages))
+        with pytest.raises(RuntimeError):
+            asyncio.run(router.chat_completion(messages))
+    assert router.breakers["alternating"].state == "open"
+
+
+def test_breaker_half_open_allows_single_trial():
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.allow_request()
+    breaker.on_request()
+    assert not breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_latency_tracker_percentiles():
+    tracker = LatencyTracker(window=10)
+    for latency in range(1, 11):
+        tracker.record_success(latency / 10)
+    assert tracker.p50 == pytest.approx(0.5)
+    assert tracker.p95 == pytest.approx(1.0)
+
+
+def test_breaker_transitions():
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow_request()
+    asyncio.run(asyncio.sleep(0.06))
+    assert breaker.allow_request() and breaker.state == "half_open"
+    breaker.on_request()
+    # 试探请求失败时立即重新打开
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow_request()
+
+
+def _gated_router(delay: float):
+    register_provider("gated", lambda: FakeLLMClient(delay=delay))
+    router = RouterClient(providers=["gated"], hedge=False)
+    breaker = router.breakers["gated"]
+    breaker.state, breaker.opened_at, breaker.recovery_timeout = "open", 0.0, 0.0
+    return router
+
+
+def test_cancelled_stream_releases_half_open_trial():
+    router = _gated_router(delay=10)
+
+    async def run():
+        stream = router.stream_chat_completion([{"role": "user", "content": "hi"}])
+        task = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0.05)
+        assert router.breakers["gated"].trial_in_flight
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    breaker = router.breakers["gated"]
+    assert breaker.state == "half_open" and not breaker.trial_in_flight
+    assert router._candidates() == ["gated"]
+
+
+def test_stream_ttft_does_not_feed_hedge_latency():
+    router = _gated_router(delay=0)
+    deltas = asyncio.run(_stream_once(router))
+    assert deltas[-1]["provider"] == "gated"
+    assert len(router.ttft_trackers["gated"].latencies) == 1
+    assert len(router.trackers["gated"].latencies) == 0
+    assert list(router.trackers["gated"].outcomes) == [True]
+    assert router.breakers["gated"].state == "closed"
+
+
+def test_slow_primary_is_hedged_to_next_provider():
+    register_provider("slow", lambda: FakeLLMClient(delay=1.0))
+    register_provider("fast", lambda: FakeLLMClient(delay=0.01))
+    router = RouterClient(providers=["slow", "fast"])
+    # slow的p50更低，作为首选；p95低于最小对冲延迟，对冲在LLM_HEDGE_MIN_DELAY后发出
+    for _ in range(router.settings.llm_router_min_samples):
+        router.trackers["slow"].record_success(0.01)
+        router.trackers["fast"].record_success(0.02)
+    hedge_delay = router._hedge_delay("slow")
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        response = await router.chat_completion([{"role": "user", "content": "hi"}])
+        return response, loop.time() - start
+
+    response, elapsed = asyncio.run(run())
+    assert response["provider"] == "fast"
+    assert hedge_delay <= elapsed < hedge_delay + 0.5
+    assert (router.hedged_requests, router.hedge_wins) == (1, 1)
+
+
+def test_failed_primary_falls_back_without_waiting():
+    class Failing(FakeLLMClient):
+        async def chat_completion(self, messages, **kwargs):
+            raise RuntimeError("down")
+
+    register_provider("failing", Failing)
+    register_provider("backup", FakeLLMClient)
+    router = RouterClient(providers=["failing", "backup"])
+    response = asyncio.run(router.chat_completion([{"role": "user", "content": "hi"}]))
+    assert response["provider"] == "backup"
+    assert router.hedged_requests == 0
+    assert router.trackers["failing"].error_rate == 1.0
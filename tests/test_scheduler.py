@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+import pytest
+
+from src.core.scheduler import DeadlineExceeded, RequestScheduler
+
+
+async def _run_in_order(scheduler, requests):
+    """占住唯一名额后让所有请求排队，再逐个放行，返回完成顺序"""
+    order = []
+    gate = asyncio.Event()
+
+    async def hold():
+        async with scheduler.slot("interactive"):
+            await gate.wait()
+
+    async def request(name, priority, tenant):
+        async with scheduler.slot(priority, tenant):
+            order.append(name)
+
+    holder = asyncio.ensure_future(hold())
+    await asyncio.sleep(0)
+    tasks = [asyncio.ensure_future(request(*item)) for item in requests]
+    await asyncio.sleep(0)
+    gate.set()
+    await asyncio.gather(holder, *tasks)
+    return order
+
+
+def test_interactive_runs_before_queued_batch():
+    scheduler = RequestScheduler("test", max_concurrency=1, interactive_reserve=0)
+    order = asyncio.run(_run_in_order(scheduler, [
+        ("batch-1", "batch", "t"), ("batch-2", "batch", "t"), ("interactive", "interactive", "t")
+    ]))
+    assert order[0] == "interactive"
+
+
+def test_weighted_fair_queueing_within_priority():
+    scheduler = RequestScheduler("test", max_concurrency=1, interactive_reserve=0)
+    scheduler.set_weight("heavy", 3)
+    requests = [(f"heavy-{i}", "batch", "heavy") for i in range(6)] + [(f"light-{i}", "batch", "light") for i in range(6)]
+    order = asyncio.run(_run_in_order(scheduler, requests))
+    first = order[:8]
+    assert sum(name.startswith("heavy") for name in first) == 6
+    assert sum(name.startswith("light") for name in first) == 2
+
+
+def test_queued_request_fails_at_deadline():
+    scheduler = RequestScheduler("test", max_concurrency=1, interactive_reserve=0)
+
+    async def run():
+        gate = asyncio.Event()
+
+        async def hold():
+            async with scheduler.slot("default"):
+                await gate.wait()
+
+        holder = asyncio.ensure_future(hold())
+        await asyncio.sleep(0)
+        with pytest.raises(DeadlineExceeded):
+            async with scheduler.slot("default", deadline=time.monotonic() + 0.05):
+                pass
+        gate.set()
+        await holder
+
+    asyncio.run(run())
+    assert scheduler.running == 0
+    assert scheduler.dropped == 1
+
+
+def test_fit_deadline_downgrades_or_drops():
+    scheduler = RequestScheduler("test", deadline_policy="downgrade")
+    scheduler.observe(latency=1.0, output_tokens=100)
+    fitted = scheduler.fit_deadline("default", time.monotonic() + 0.5, {"max_tokens": 100})
+    assert 16 <= fitted["max_tokens"] < 100
+
+    scheduler.deadline_policy = "drop"
+    with pytest.raises(DeadlineExceeded):
+        scheduler.fit_deadline("default", time.monotonic() + 0.5, {"max_tokens": 100})
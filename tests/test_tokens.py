@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+from src.core.tokens import ContextTrimmer, TokenCounter, estimate_tokens
+
+
+def _conversation(turns: int):
+    messages = [{"role": "system", "content": "You are helpful."}]
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"question {i} " + "x" * 40})
+        messages.append({"role": "assistant", "content": f"answer {i} " + "y" * 40})
+    return messages
+
+
+def test_estimate_tokens_counts_cjk_per_character():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcdefgh") == 2
+    assert estimate_tokens("你好世界") == 4
+
+
+def test_trim_keeps_system_and_recent_turns_within_budget():
+    counter = TokenCounter()
+    messages = _conversation(10)
+    trimmer = ContextTrimmer(budget=100, counter=counter)
+    trimmed = asyncio.run(trimmer.trim(messages))
+
+    assert trimmed[0] == messages[0]
+    assert trimmed[1]["role"] == "user"
+    assert trimmed[-1] == messages[-1]
+    assert trimmed[1:] == messages[-(len(trimmed) - 1):]
+    assert counter.count_messages(trimmed) <= 100
+    assert trimmer.trimmed_requests == 1
+    assert messages == _conversation(10)
+
+
+def test_trim_returns_original_when_within_budget():
+    messages = _conversation(2)
+    assert asyncio.run(ContextTrimmer(budget=10000).trim(messages)) is messages
+
+
+def test_trim_keeps_last_message_even_if_over_budget():
+    messages = [{"role": "user", "content": "z" * 4000}]
+    assert asyncio.run(ContextTrimmer(budget=50).trim(messages)) == messages
+
+
+def test_step_aligns_start_across_turns():
+    trimmer = ContextTrimmer(budget=150, step=4)
+    first = asyncio.run(trimmer.trim(_conversation(10)))
+    second = asyncio.run(trimmer.trim(_conversation(11)[:-1]))
+    # 多一条消息时起点不变，保留窗口的前缀相同
+    assert second[:len(first)] == first
+
+
+def test_summarize_replaces_dropped_turns_once():
+    calls = []
+
+    async def summarizer(dropped):
+        calls.append(len(dropped))
+        return "earlier turns"
+
+    trimmer = ContextTrimmer(budget=150, strategy="summarize", summarizer=summarizer, summary_tokens=20)
+    messages = _conversation(10)
+    trimmed = asyncio.run(trimmer.trim(messages))
+    assert trimmed[1]["role"] == "system"
+    assert trimmed[1]["content"].endswith("earlier turns")
+    assert trimmed[2]["role"] == "user"
+    assert asyncio.run(trimmer.trim(messages)) == trimmed
+    assert len(calls) == 1
+
+
+def test_unknown_strategy_rejected():
+    with pytest.raises(ValueError):
+        ContextTrimmer(budget=100, strategy="truncate")
@@ -0,0 +1,100 @@
+import os
+import time
+
+from src.core.tool_cache import CachePolicy, ToolResultCache
+
+
+def read(file_path: str, encoding: str = "utf-8"):
+    return None
+
+
+def _policy(mode="fs", ttl=None):
+    return CachePolicy.create(read, mode, ttl, ("file_path",) if mode == "fs" else ())
+
+
+def _cached(cache, policy, **parameters):
+    lookup = cache.lookup("read", policy, parameters)
+    if not lookup.hit:
+        cache.store(lookup, {"n": len(cache)}, policy.ttl)
+    return lookup.hit
+
+
+def test_fs_entry_invalidated_when_file_changes(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_text("one")
+    cache, policy = ToolResultCache(1024), _policy()
+    assert not _cached(cache, policy, file_path=str(path))
+    # 省略默认参数和显式传默认值命中同一条目
+    assert _cached(cache, policy, file_path=str(path), encoding="utf-8")
+
+    path.write_text("two!")
+    assert not _cached(cache, policy, file_path=str(path))
+    assert cache.stats()["tools"]["read"]["invalidations"] == 1
+
+
+def test_fs_entry_invalidated_when_file_replaced(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_text("one")
+    cache, policy = ToolResultCache(1024), _policy()
+    _cached(cache, policy, file_path=str(path))
+    # 同样大小、同样mtime的新文件，inode不同
+    stat = path.stat()
+    replacement = tmp_path / "b.txt"
+    replacement.write_text("uno")
+    os.utime(replacement, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    os.replace(replacement, path)
+    assert not _cached(cache, policy, file_path=str(path))
+
+
+def test_invalidate_paths_covers_parent_directory(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_text("one")
+    cache, policy = ToolResultCache(1024), _policy()
+    _cached(cache, policy, file_path=str(path))
+    _cached(cache, policy, file_path=str(tmp_path))
+    # 写入目录下的新文件会改变目录列表
+    assert cache.invalidate_paths(str(tmp_path / "new.txt")) == 1
+    assert cache.invalidate_paths(str(path)) == 1
+    assert len(cache) == 0 and cache.bytes == 0
+
+
+def test_ttl_entry_expires():
+    cache, policy = ToolResultCache(1024), _policy("ttl", ttl=0.05)
+    assert not _cached(cache, policy, file_path="x")
+    assert _cached(cache, policy, file_path="x")
+    time.sleep(0.06)
+    assert not _cached(cache, policy, file_path="x")
+
+
+def test_lru_eviction_by_bytes():
+    # 每个结果序列化后8字节，只能容纳两个
+    cache, policy = ToolResultCache(20), _policy("pure")
+    for name in ("a", "b", "c"):
+        _cached(cache, policy, file_path=name)
+    assert cache.bytes <= 20
+    assert not cache.lookup("read", policy, {"file_path": "a"}).hit
+    assert cache.lookup("read", policy, {"file_path": "c"}).hit
+    assert cache.stats()["tools"]["read"]["evictions"] >= 1
+
+
+def test_hits_return_copies():
+    cache, policy = ToolResultCache(1024), _policy("pure")
+    lookup = cache.lookup("read", policy, {"file_path": "a"})
+    value = {"files": [1]}
+    cache.store(lookup, value)
+    value["files"].append(2)
+    hit = cache.lookup("read", policy, {"file_path": "a"})
+    assert hit.value == {"files": [1]}
+    hit.value["files"].append(3)
+    assert cache.lookup("read", policy, {"file_path": "a"}).value == {"files": [1]}
+
+
+def test_resolver_picks_paths_or_skips_caching(tmp_path):
+    def resolve(arguments):
+        return None if arguments["file_path"] == "skip" else [str(tmp_path)]
+
+    cache = ToolResultCache(1024)
+    policy = CachePolicy.create(read, "fs", paths=resolve)
+    assert cache.lookup("read", policy, {"file_path": "skip"}) is None
+    lookup = cache.lookup("read", policy, {"file_path": "x"})
+    assert lookup.paths == (str(tmp_path),)
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from src.core import tool_pools
+from src.core.tool_pools import Bulkhead, ToolPool, ToolSaturated
+from tests.fakes import spin
+
+
+async def _call(pool: ToolPool, bulkhead: Bulkhead, seconds: float, timeout: float) -> float:
+    await bulkhead.acquire()
+    return await asyncio.wait_for(pool.run(spin, {"seconds": seconds}, on_done=bulkhead.release), timeout)
+
+
+def test_process_timeout_kills_worker_and_releases_slot():
+    pool = ToolPool("process", 2)
+    bulkhead = Bulkhead("spin", 2)
+
+    async def run():
+        with pytest.raises(asyncio.TimeoutError):
+            await _call(pool, bulkhead, 60, 0.3)
+        # 被终止的worker在后台线程中结算，名额很快归还
+        for _ in range(50):
+            if bulkhead.stats()["active"] == 0:
+                break
+            await asyncio.sleep(0.02)
+        assert bulkhead.stats()["active"] == 0
+        assert pool.stats()["inflight"] == 0
+        assert pool.stats()["killed"] == 1
+        assert await _call(pool, bulkhead, 0.01, 5) == 0.01
+
+    try:
+        asyncio.run(run())
+    finally:
+        pool.shutdown()
+
+
+def test_calls_killed_alongside_timeout_are_retried():
+    pool = ToolPool("process", 2)
+
+    async def run():
+        innocent = asyncio.ensure_future(pool.run(spin, {"seconds": 0.5}))
+        await asyncio.sleep(0.1)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(pool.run(spin, {"seconds": 60}), 0.2)
+        assert await innocent == 0.5
+
+    try:
+        asyncio.run(run())
+    finally:
+        pool.shutdown()
+
+
+def test_retries_of_killed_calls_are_capped():
+    pool = ToolPool("process", 2, max_retries=0)
+
+    async def run():
+        innocent = asyncio.ensure_future(pool.run(spin, {"seconds": 0.5}))
+        await asyncio.sleep(0.1)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(pool.run(spin, {"seconds": 60}), 0.2)
+        with pytest.raises(BrokenProcessPool):
+            await innocent
+        assert pool.stats()["retried"] == 0
+
+    try:
+        asyncio.run(run())
+    finally:
+        pool.shutdown()
+
+
+def test_timeout_without_worker_access_replaces_pool(monkeypatch, caplog):
+    # 读不到worker进程(私有的_processes不存在)时不终止worker，只替换进程池并记录警告
+    monkeypatch.setattr(tool_pools, "_worker_processes", lambda executor: [])
+    pool = ToolPool("process", 1)
+    bulkhead = Bulkhead("spin", 1)
+
+    async def run():
+        with caplog.at_level(logging.WARNING, logger="src.core.tool_pools"):
+            with pytest.raises(asyncio.TimeoutError):
+                await _call(pool, bulkhead, 0.6, 0.1)
+        assert "Cannot kill worker processes" in caplog.text
+        # 新的调用使用新的进程池，不必等失控的worker
+        assert await asyncio.wait_for(pool.run(spin, {"seconds": 0.01}), 0.4) == 0.01
+        # 名额要等失控的调用真正结束才归还
+        assert bulkhead.stats()["active"] == 1
+        for _ in range(100):
+            if bulkhead.stats()["active"] == 0:
+                break
+            await asyncio.sleep(0.02)
+        assert bulkhead.stats()["active"] == 0
+        assert pool.stats()["inflight"] == 0
+
+    try:
+        asyncio.run(run())
+    finally:
+        pool.shutdown()
+
+
+def test_shutdown_does_not_block_on_hung_worker():
+    pool = ToolPool("process", 1)
+
+    async def run():
+        task = asyncio.ensure_future(pool.run(spin, {"seconds": 60}))
+        await asyncio.sleep(0.2)
+        start = time.monotonic()
+        pool.shutdown(timeout=0.2)
+        assert time.monotonic() - start < 2
+        with pytest.raises(Exception):
+            await task
+
+    asyncio.run(run())
+
+
+def test_bulkhead_rejects_when_queue_full():
+    bulkhead = Bulkhead("tool", 1, max_queue=1)
+
+    async def run():
+        await bulkhead.acquire()
+        waiter = asyncio.ensure_future(bulkhead.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(ToolSaturated):
+            await bulkhead.acquire()
+        bulkhead.release()
+        await waiter
+        assert bulkhead.stats()["active"] == 1
+        bulkhead.release()
+
+    asyncio.run(run())
+    assert bulkhead.stats() == {"max_concurrency": 1, "max_queue": 1, "active": 0, "queued": 0, "rejected": 1}
@@ -0,0 +1,108 @@
+import json
+
+import pytest
+
+from src.core import tools
+from src.core.tools import IncrementalJSONParser, ToolCallAssembler, tool_call_deltas
+
+SCHEMA = {"type": "object", "properties": {"x": {"type": "number"}}}
+
+
+def _feed_all(parser, pieces):
+    return [parser.feed(piece) for piece in pieces]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 1000])
+def test_parser_completes_on_closing_brace(size):
+    text = json.dumps({"path": "a/{b}.txt", "quote": "say \"}\" \\", "items": [1, {"x": [2]}], "中文": "值"},
+                      ensure_ascii=False)
+    parser = IncrementalJSONParser()
+    done = _feed_all(parser, [text[i:i + size] for i in range(0, len(text), size)])
+    assert done[-1] and not any(done[:-1])
+    assert json.loads(parser.text) == json.loads(text)
+
+
+def test_parser_ignores_text_after_top_level_value():
+    parser = IncrementalJSONParser()
+    assert not parser.feed('{"a": [1, 2')
+    assert parser.feed('], "b": "]"}{"next": 1}')
+    assert parser.text == '{"a": [1, 2], "b": "]"}'
+    # 完成后继续喂入不影响结果
+    assert parser.feed("garbage")
+    assert parser.text == '{"a": [1, 2], "b": "]"}'
+
+
+def test_parser_incomplete_without_closing():
+    parser = IncrementalJSONParser()
+    assert not parser.feed('{"a": "unterminated }')
+    assert not parser.complete
+
+
+def test_assembler_emits_each_call_once_json_closes():
+    assembler = ToolCallAssembler()
+    assert assembler.feed({"type": "tool_call_delta", "index": 0, "id": "c0", "name": "read", "arguments": '{"file'}) == []
+    done = assembler.feed({"type": "tool_call_delta", "index": 0, "arguments": '_path": "a"}'})
+    assert done == [{"id": "c0", "name": "read", "arguments": {"file_path": "a"}}]
+    assert assembler.feed({"type": "tool_call_end", "index": 0}) == []
+    # 无参数的工具由tool_call_end完成
+    assembler.feed({"type": "tool_call_delta", "index": 1, "id": "c1", "name": "now"})
+    assert assembler.feed({"type": "tool_call_end", "index": 1})[0]["name"] == "now"
+    assert [call["id"] for call in assembler.calls()] == ["c0", "c1"]
+
+
+def test_assembler_round_trips_tool_call_deltas():
+    calls = [{"id": "a", "name": "x", "arguments": {"n": 1}}, {"id": "b", "name": "y", "arguments": {}}]
+    assembler = ToolCallAssembler()
+    for event in tool_call_deltas(calls):
+        assembler.feed(event)
+    assert assembler.flush() == []
+    assert assembler.calls() == calls
+
+
+def test_tool_definitions_normalize_from_every_format():
+    mcp_schema = {"calc": {"name": "calc", "description": "calculate", "parameters": SCHEMA}}
+    openai = [{"type": "function", "function": {"name": "calc", "description": "calculate", "parameters": SCHEMA}}]
+    anthropic = [{"name": "calc", "description": "calculate", "input_schema": SCHEMA}]
+    expected = [{"name": "calc", "description": "calculate", "parameters": SCHEMA}]
+    for definitions in (mcp_schema, openai, anthropic):
+        assert tools.normalize_tools(definitions) == expected
+    assert tools.to_openai_tools(anthropic) == [{"type": "function", "function": expected[0]}]
+    assert tools.to_anthropic_tools(openai) == anthropic
+
+
+def test_parse_arguments_keeps_unparseable_text():
+    assert tools.parse_arguments('{"x": 1}') == {"x": 1}
+    assert tools.parse_arguments("") == {}
+    assert tools.parse_arguments("[1]") == {"_raw": "[1]"}
+    assert tools.parse_arguments('{"x": ') == {"_raw": '{"x": '}
+
+
+def test_conversation_converts_to_openai_messages():
+    messages = [
+        {"role": "assistant", "content": None, "tool_calls": [{"id": "c1", "name": "calc", "arguments": {"x": 1}}]},
+        {"role": "tool", "tool_call_id": "c1", "name": "calc", "content": "2"}
+    ]
+    assistant, tool = tools.to_openai_messages(messages)
+    assert assistant["tool_calls"] == [
+        {"id": "c1", "type": "function", "function": {"name": "calc", "arguments": '{"x": 1}'}}
+    ]
+    assert tool == {"role": "tool", "tool_call_id": "c1", "content": "2"}
+
+
+def test_parallel_tool_results_merge_into_one_anthropic_user_message():
+    messages = [
+        {"role": "assistant", "content": "thinking", "tool_calls": [
+            {"id": "c1", "name": "calc", "arguments": {"x": 1}},
+            {"id": "c2", "name": "calc", "arguments": {}}
+        ]},
+        {"role": "tool", "tool_call_id": "c1", "content": "2"},
+        {"role": "tool", "tool_call_id": "c2", "content": {"ok": True}}
+    ]
+    converted = tools.merge_anthropic_messages([tools.to_anthropic_message(msg) for msg in messages])
+    assert [msg["role"] for msg in converted] == ["assistant", "user"]
+    assert [block["type"] for block in converted[0]["content"]] == ["text", "tool_use", "tool_use"]
+    assert converted[1]["content"] == [
+        {"type": "tool_result", "tool_use_id": "c1", "content": "2"},
+        {"type": "tool_result", "tool_use_id": "c2", "content": '{"ok": true}'}
+    ]
+
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from src.core.vector_store import VectorStore
+
+
+def _brute_force(vectors: np.ndarray, queries: np.ndarray, k: int):
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    scores = queries @ vectors.T
+    return np.argsort(-scores, axis=1)[:, :k], np.sort(scores, axis=1)[:, ::-1][:, :k]
+
+
+@pytest.mark.parametrize("chunk_rows, k", [(7, 5), (64, 5), (1000, 5), (3, 10), (50, 300)])
+def test_search_batch_matches_brute_force(tmp_path, chunk_rows, k):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((257, 16)).astype(np.float32)
+    queries = rng.standard_normal((4, 16)).astype(np.float32)
+    store = VectorStore(str(tmp_path / "vec"), initial_capacity=8, chunk_rows=chunk_rows)
+    # 分批写入，覆盖容量扩展
+    store.add(vectors[:100], ids=[f"doc-{i}" for i in range(100)])
+    store.add(vectors[100:], ids=[f"doc-{i}" for i in range(100, 257)])
+
+    results = store.search_batch(queries, k)
+    rows, scores = _brute_force(vectors, queries, k)
+    for result, expected_rows, expected_scores in zip(results, rows, scores):
+        assert len(result) == min(k, 257)
+        assert [hit["row"] for hit in result] == expected_rows.tolist()
+        assert [hit["id"] for hit in result] == [f"doc-{row}" for row in expected_rows]
+        np.testing.assert_allclose([hit["score"] for hit in result], expected_scores, rtol=1e-5)
+    store.close()
+
+
+def test_reopen_ignores_uncommitted_records(tmp_path):
+    path = str(tmp_path / "vec")
+    store = VectorStore(path)
+    store.add(np.eye(3, dtype=np.float32), metadata=[{"n": i} for i in range(3)])
+    store.close()
+    # 模拟写入记录后、提交元数据前崩溃
+    with open(f"{path}.jsonl", "a", encoding="utf-8") as f:
+        f.write('{"id": 3, "metadata": null}\n')
+
+    reopened = VectorStore(path)
+    assert len(reopened) == 3
+    assert reopened.search([0, 1, 0], k=1)[0]["metadata"] == {"n": 1}
+    assert reopened.add([[1, 1, 0]]) == [3]
+    assert reopened.search([1, 1, 0], k=1)[0]["id"] == 3
+
+
+def test_empty_store_and_dim_mismatch(tmp_path):
+    store = VectorStore(str(tmp_path / "vec"), dim=4)
+    assert store.search_batch(np.ones((2, 4)), 3) == [[], []]
+    store.add(np.ones((1, 4)))
+    with pytest.raises(ValueError):
+        store.search(np.ones(3))